@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import (
-    Client, ClientFinance, MonthlyPayment, 
+    Client, ClientFinance, ClientFinanceTotals, MonthlyPayment, 
     PaymentTransaction, OperationalControl,
     MonthlyDeclaration, TaxDeclaration, AdditionalPDT
 )
@@ -36,6 +36,11 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
     search_fields = ('monthly_payment__client_finance__client__name', 'reference')
     list_filter = ('payment_method', 'payment_date', 'created_at')
     ordering = ('-payment_date',)
+    readonly_fields = ('idempotency_key',)
+
+    def has_change_permission(self, request, obj=None):
+        # Las transacciones forman un libro de solo inserción: montos y saldos se derivan de ellas
+        return False
 
 
 @admin.register(OperationalControl)
@@ -68,3 +73,11 @@ class AdditionalPDTAdmin(admin.ModelAdmin):
     search_fields = ('operational_control__client__name', 'pdt_name', 'order_number')
     list_filter = ('pdt_type', 'status', 'presentation_date')
     ordering = ('-presentation_date',)
+
+
+@admin.register(ClientFinanceTotals)
+class ClientFinanceTotalsAdmin(admin.ModelAdmin):
+    list_display = ('id', 'client_finance', 'total_due', 'total_paid', 'total_balance', 'payments_completed', 'payments_pending')
+    search_fields = ('client_finance__client__name',)
+    list_filter = ('client_finance__year',)
+    readonly_fields = ('total_due', 'total_paid', 'total_balance', 'payments_completed', 'payments_pending', 'updated_at')
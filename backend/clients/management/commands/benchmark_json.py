@@ -0,0 +1,125 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from clients.models import Client, ClientFinance, MonthlyPayment, PaymentTransaction
+from estudiomd_tasks import fastjson
+from tasks.models import Task
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara JSONRenderer de DRF con FastJSONRenderer (orjson) sobre las respuestas de '
+        'finanzas y tareas. Los datos de prueba se crean en una transacción que se revierte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Clientes con finanzas del año')
+        parser.add_argument('--transactions', type=int, default=2, help='Transacciones por pago mensual')
+        parser.add_argument('--tasks', type=int, default=100, help='Tareas')
+        parser.add_argument('--iterations', type=int, default=20, help='Veces que se renderiza cada respuesta')
+
+    def handle(self, *args, **options):
+        if fastjson.orjson is None:
+            self.stdout.write(self.style.WARNING('orjson no está instalado: FastJSONRenderer usa la librería estándar'))
+
+        try:
+            with transaction.atomic():
+                payloads = self.build_payloads(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        renderers = [('DRF', JSONRenderer()), ('orjson', fastjson.FastJSONRenderer())]
+        self.stdout.write(f"{'Respuesta':<14}{'N':>5}{'KB':>9}{'DRF ms':>10}{'orjson ms':>11}{'x':>7}  Iguales")
+        for name, responses in payloads:
+            expected = [renderers[0][1].render(data, 'application/json') for data in responses]
+            identical = all(
+                renderers[1][1].render(data, 'application/json') == content
+                for data, content in zip(responses, expected)
+            )
+            timings = [self.time_renderer(renderer, responses, options['iterations']) for _, renderer in renderers]
+            size = sum(len(content) for content in expected) / 1024
+            self.stdout.write(
+                f'{name:<14}{len(responses):>5}{size:>9.1f}{timings[0]:>10.2f}{timings[1]:>11.2f}'
+                f'{timings[0] / timings[1]:>7.1f}  {"sí" if identical else "NO"}'
+            )
+
+    def time_renderer(self, renderer, responses, iterations):
+        """Milisegundos por pasada sobre todas las respuestas"""
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for data in responses:
+                renderer.render(data, 'application/json')
+        return (time.perf_counter() - start) * 1000 / iterations
+
+    def get(self, user, path):
+        """response.data de la vista, antes de renderizar"""
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host and not host.startswith('.')), 'localhost')
+        request = APIRequestFactory(SERVER_NAME=host).get(path)
+        force_authenticate(request, user=user)
+        match = resolve(request.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        assert response.status_code == 200, (path, response.status_code)
+        return response.data
+
+    def build_payloads(self, options):
+        now = timezone.now()
+        user = User.objects.create_user(
+            username='benchmark-json', email='benchmark-json@example.com', password=None,
+            role='admin', first_name='Benchmark', last_name='JSON'
+        )
+
+        clients = Client.objects.bulk_create([
+            Client(name=f'Cliente {i}', email=f'cliente{i}@example.com', company_name=f'Empresa {i} S.A.C.',
+                   company_ruc=f'20{i:09d}', city='Lima', state='Lima')
+            for i in range(options['clients'])
+        ])
+        for client in clients:
+            ClientFinance.provision(client, now.year, {'annual_fee': Decimal('1800.00'), 'monthly_fee': Decimal('150.00')})
+        payments = MonthlyPayment.objects.filter(client_finance__client__in=clients)
+        PaymentTransaction.objects.bulk_create([
+            PaymentTransaction(
+                monthly_payment=payment, amount=Decimal('75.50'), payment_date=now - timedelta(days=n),
+                payment_method='transferencia', reference=f'OP-{payment.id}-{n}', created_by=user
+            )
+            for payment in payments for n in range(options['transactions'])
+        ])
+        for finance in ClientFinance.objects.filter(client__in=clients):
+            finance.recalculate_all_monthly_payments()
+
+        tasks = [
+            Task.objects.create(
+                title=f'Declaración mensual {i}', description='Revisar comprobantes y presentar el PDT',
+                due_date=now + timedelta(days=i % 30), created_by=user
+            )
+            for i in range(options['tasks'])
+        ]
+        for task in tasks:
+            task.assigned_to.add(user)
+
+        return [
+            ('finanzas', [self.get(user, f'/api/v1/clients/{client.id}/finance/') for client in clients]),
+            ('transacciones', [
+                self.get(user, f'/api/v1/clients/{client.id}/transactions/?page_size=100') for client in clients
+            ]),
+            ('cartera', [self.get(user, '/api/v1/clients/finance/portfolio/')]),
+            ('tareas', [
+                self.get(user, f'/api/v1/tasks/?page_size=100&page={page}')
+                for page in range(1, (len(tasks) - 1) // 100 + 2)
+            ]),
+            ('tarea', [self.get(user, f'/api/v1/tasks/{task.id}/') for task in tasks]),
+        ]
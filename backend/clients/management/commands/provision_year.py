@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from estudiomd_tasks.cache import bump_cache_version
+from clients.models import (
+    Client, ClientFinance, ClientFinanceTotals, MonthlyPayment,
+    OperationalControl, MonthlyDeclaration
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea por adelantado la configuración financiera (13 pagos) y el control '
+        'operativo (13 declaraciones) de un año para todos los clientes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=timezone.now().year, help='Año a crear (por defecto el actual)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Clientes por lote')
+        parser.add_argument(
+            '--only', choices=['finance', 'operational'],
+            help='Crear solo la configuración financiera o solo el control operativo'
+        )
+
+    def handle(self, *args, **options):
+        year = options['year']
+        batch_size = options['batch_size']
+        only = options['only']
+
+        client_ids = list(Client.objects.order_by('id').values_list('id', flat=True))
+        created_finances = 0
+        created_controls = 0
+
+        for start in range(0, len(client_ids), batch_size):
+            batch = client_ids[start:start + batch_size]
+            with transaction.atomic():
+                if only != 'operational':
+                    created_finances += self.provision_finances(batch, year)
+                if only != 'finance':
+                    created_controls += self.provision_operational_controls(batch, year)
+            self.stdout.write(f'Lote procesado: {start + len(batch)}/{len(client_ids)} clientes')
+
+        # bulk_create no dispara señales: invalidar las respuestas cacheadas de clientes
+        bump_cache_version('clients', *(f'client:{client_id}' for client_id in client_ids))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Año {year}: {created_finances} configuraciones financieras y '
+            f'{created_controls} controles operativos creados'
+        ))
+
+    def provision_finances(self, client_ids, year):
+        finances = ClientFinance.objects.filter(client_id__in=client_ids, year=year)
+        existing_ids = set(finances.values_list('id', flat=True))
+        ClientFinance.objects.bulk_create(
+            [ClientFinance(client_id=client_id, year=year) for client_id in client_ids],
+            ignore_conflicts=True
+        )
+        finance_ids = list(finances.values_list('id', flat=True))
+        MonthlyPayment.objects.bulk_create(
+            [MonthlyPayment.build_empty(finance_id, month) for finance_id in finance_ids for month in range(1, 14)],
+            ignore_conflicts=True
+        )
+        # Totales de los años nuevos: sin ellos la primera lectura tendría que calcularlos
+        created_ids = [finance_id for finance_id in finance_ids if finance_id not in existing_ids]
+        ClientFinanceTotals.objects.bulk_create(
+            [ClientFinanceTotals.build_empty(finance_id) for finance_id in created_ids],
+            ignore_conflicts=True
+        )
+        return len(created_ids)
+
+    def provision_operational_controls(self, client_ids, year):
+        controls = OperationalControl.objects.filter(client_id__in=client_ids, year=year)
+        existing = controls.count()
+        OperationalControl.objects.bulk_create(
+            [OperationalControl(client_id=client_id, year=year) for client_id in client_ids],
+            ignore_conflicts=True
+        )
+        control_ids = list(controls.values_list('id', flat=True))
+        MonthlyDeclaration.objects.bulk_create(
+            [
+                MonthlyDeclaration(operational_control_id=control_id, month=month)
+                for control_id in control_ids for month in range(1, 14)
+            ],
+            ignore_conflicts=True
+        )
+        return len(control_ids) - existing
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_totals(apps, schema_editor):
+    ClientFinance = apps.get_model('clients', 'ClientFinance')
+    ClientFinanceTotals = apps.get_model('clients', 'ClientFinanceTotals')
+
+    rows = ClientFinance.objects.annotate(
+        sum_due=Sum('monthly_payments__amount_due'),
+        sum_paid=Sum('monthly_payments__amount_paid'),
+        sum_balance=Sum('monthly_payments__balance'),
+        paid_count=Count('monthly_payments', filter=Q(monthly_payments__is_paid=True)),
+        pending_count=Count('monthly_payments', filter=Q(monthly_payments__is_paid=False)),
+    ).values_list('id', 'sum_due', 'sum_paid', 'sum_balance', 'paid_count', 'pending_count')
+
+    ClientFinanceTotals.objects.bulk_create([
+        ClientFinanceTotals(
+            client_finance_id=finance_id,
+            total_due=total_due or Decimal('0.00'),
+            total_paid=total_paid or Decimal('0.00'),
+            total_balance=total_balance or Decimal('0.00'),
+            payments_completed=completed,
+            payments_pending=pending,
+        )
+        for finance_id, total_due, total_paid, total_balance, completed, pending in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0004_alter_clientfinance_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientFinanceTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_due', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('payments_completed', models.IntegerField(default=0)),
+                ('payments_pending', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client_finance', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='totals', to='clients.clientfinance')),
+            ],
+            options={
+                'verbose_name': 'client finance totals',
+                'verbose_name_plural': 'client finance totals',
+            },
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
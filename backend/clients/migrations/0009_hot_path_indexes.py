@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0008_client_client_created_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['name'], name='client_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['company_ruc'], name='client_ruc_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['dni'], name='client_dni_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='monthlypayment',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['client_finance', 'month'], name='payment_unpaid_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:44
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Índices GIN y extensión pg_trgm: solo existen en PostgreSQL, en SQLite la
+# búsqueda usa icontains (ver estudiomd_tasks.search).
+FORWARD_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    UPDATE clients_client SET search_vector =
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(company_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(email, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(city, '')), 'C')
+    """,
+    'CREATE INDEX IF NOT EXISTS client_search_vector_idx ON clients_client USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS client_ruc_trgm_idx ON clients_client USING gin (company_ruc gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS client_dni_trgm_idx ON clients_client USING gin (dni gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS client_name_trgm_idx ON clients_client USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS client_company_trgm_idx ON clients_client USING gin (company_name gin_trgm_ops)',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS client_search_vector_idx',
+    'DROP INDEX IF EXISTS client_ruc_trgm_idx',
+    'DROP INDEX IF EXISTS client_dni_trgm_idx',
+    'DROP INDEX IF EXISTS client_name_trgm_idx',
+    'DROP INDEX IF EXISTS client_company_trgm_idx',
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), run_on_postgresql(REVERSE_SQL)),
+    ]
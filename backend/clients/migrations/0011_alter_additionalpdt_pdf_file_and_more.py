@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:52
+
+import files.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0010_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='additionalpdt',
+            name='pdf_file',
+            field=models.FileField(blank=True, null=True, storage=files.storage.blob_storage, upload_to='additional_pdts/'),
+        ),
+        migrations.AlterField(
+            model_name='taxdeclaration',
+            name='pdf_file',
+            field=models.FileField(blank=True, null=True, storage=files.storage.blob_storage, upload_to='tax_declarations/'),
+        ),
+    ]
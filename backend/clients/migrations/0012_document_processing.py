@@ -0,0 +1,73 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0011_alter_additionalpdt_pdf_file_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='additionalpdt',
+            name='detected_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='additionalpdt',
+            name='extracted_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='additionalpdt',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='additionalpdt',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='additionalpdt',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('done', 'Procesado'), ('rejected', 'Tipo de archivo no permitido'), ('failed', 'Error al procesar')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='additionalpdt',
+            name='thumbnail',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='taxdeclaration',
+            name='detected_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='taxdeclaration',
+            name='extracted_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='taxdeclaration',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='taxdeclaration',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='taxdeclaration',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('done', 'Procesado'), ('rejected', 'Tipo de archivo no permitido'), ('failed', 'Error al procesar')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='taxdeclaration',
+            name='thumbnail',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# El texto de los PDFs de los PDTs entra en el search_vector del cliente
+# (Client.search_vector_fields); se recalculan los clientes que ya lo tienen.
+TAX_DECLARATIONS = """
+    FROM clients_taxdeclaration d
+    JOIN clients_monthlydeclaration m ON m.id = d.monthly_declaration_id
+    JOIN clients_operationalcontrol o ON o.id = m.operational_control_id
+    WHERE o.client_id = c.id
+"""
+ADDITIONAL_PDTS = """
+    FROM clients_additionalpdt d
+    JOIN clients_operationalcontrol o ON o.id = d.operational_control_id
+    WHERE o.client_id = c.id
+"""
+
+FORWARD_SQL = [
+    f"""
+    UPDATE clients_client c SET search_vector =
+        setweight(to_tsvector('simple', coalesce(c.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(c.company_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(c.email, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(c.city, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT string_agg(d.extracted_text, ' ') {TAX_DECLARATIONS}), ''
+        )), 'D') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT string_agg(d.extracted_text, ' ') {ADDITIONAL_PDTS}), ''
+        )), 'D')
+    WHERE EXISTS (SELECT 1 {TAX_DECLARATIONS} AND d.extracted_text <> '')
+       OR EXISTS (SELECT 1 {ADDITIONAL_PDTS} AND d.extracted_text <> '')
+    """,
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0012_document_processing'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), migrations.RunPython.noop),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.search import SearchVectorField
+from files.models import ProcessedDocument
+from files.storage import blob_storage
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
 
@@ -17,6 +23,17 @@ class Client(models.Model):
     city = models.CharField(max_length=100)
     state = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Documento de búsqueda full-text (solo PostgreSQL, ver estudiomd_tasks.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    search_vector_fields = {
+        'name': 'A', 'company_name': 'A', 'email': 'B', 'city': 'C',
+        # Texto de los PDFs de las declaraciones
+        'operational_controls__monthly_declarations__tax_declarations__extracted_text': 'D',
+        'operational_controls__additional_pdts__extracted_text': 'D',
+    }
+    search_config = 'simple'
 
     def __str__(self):
         return self.name
@@ -25,6 +42,14 @@ class Client(models.Model):
         verbose_name = _('client')
         verbose_name_plural = _('clients')
         ordering = ['-created_at']
+        indexes = [
+            # Paginación keyset (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='client_created_id_idx'),
+            # Búsqueda por nombre, RUC y DNI (pattern_ops permite LIKE 'prefijo%' en PostgreSQL)
+            models.Index(fields=['name'], name='client_name_idx'),
+            models.Index(fields=['company_ruc'], name='client_ruc_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['dni'], name='client_dni_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
 
 class ClientFinance(models.Model):
@@ -44,16 +69,165 @@ class ClientFinance(models.Model):
         verbose_name_plural = _('client finances')
         unique_together = ['client', 'year']
     
+    @classmethod
+    def provision(cls, client, year, defaults=None):
+        """
+        Obtiene o crea la configuración financiera del año con sus 13 pagos
+        (12 meses + DJ Anual). Es idempotente y segura ante accesos
+        concurrentes: get_or_create se apoya en unique_together y los pagos
+        se insertan con un único bulk_create que ignora los ya existentes.
+        """
+        with transaction.atomic():
+            client_finance, created = cls.objects.get_or_create(client=client, year=year, defaults=defaults or {})
+            if created:
+                client_finance.provision_monthly_payments()
+                client_finance.totals = ClientFinanceTotals.build_empty(client_finance.id)
+                client_finance.totals.save()
+        return client_finance, created
+
+    def provision_monthly_payments(self):
+        """Crea en un solo INSERT los pagos mensuales que falten"""
+        MonthlyPayment.objects.bulk_create(
+            [MonthlyPayment.build_empty(self.id, month) for month in range(1, 14)],
+            ignore_conflicts=True
+        )
+
     def recalculate_all_monthly_payments(self):
         """
-        Recalcula todos los pagos mensuales considerando saldos pendientes
+        Recalcula todos los pagos mensuales considerando saldos pendientes.
+
+        Carga los pagos del año y los meses con transacciones en dos consultas,
+        calcula los arrastres en memoria en orden cronológico y guarda solo las
+        filas que cambiaron con un único bulk_update. Devuelve cuántas filas
+        se actualizaron.
         """
-        # Ordenar por mes para recalcular en orden cronológico
-        monthly_payments = self.monthly_payments.all().order_by('month')
-        
+        monthly_payments = list(self.monthly_payments.all().order_by('month'))
+        months_with_transactions = set(
+            PaymentTransaction.objects.filter(
+                monthly_payment__client_finance=self
+            ).values_list('monthly_payment__month', flat=True).distinct()
+        )
+        payments_by_month = {payment.month: payment for payment in monthly_payments}
+
+        now = timezone.now()
+        changed = []
         for payment in monthly_payments:
-            payment.recalculate_amount_due()
-            payment.save()
+            previous_payment = payments_by_month.get(payment.month - 1)
+            amount_due = self.calculate_amount_due(
+                payment.month,
+                previous_payment,
+                previous_payment is not None and previous_payment.month in months_with_transactions
+            )
+            balance = amount_due - payment.amount_paid
+            is_paid = balance <= 0
+
+            if (payment.amount_due, payment.balance, payment.is_paid) != (amount_due, balance, is_paid):
+                payment.amount_due = amount_due
+                payment.balance = balance
+                payment.is_paid = is_paid
+                payment.updated_at = now
+                changed.append(payment)
+
+        if changed:
+            MonthlyPayment.objects.bulk_update(changed, ['amount_due', 'balance', 'is_paid', 'updated_at'])
+
+        # bulk_update no dispara señales: actualizar los totales con los pagos ya cargados
+        self.refresh_totals(monthly_payments)
+        return len(changed)
+
+    def refresh_totals(self, monthly_payments=None):
+        """Actualiza los totales precalculados del año (ClientFinanceTotals)"""
+        values = self.calculate_totals(monthly_payments)
+        totals, _ = ClientFinanceTotals.objects.update_or_create(client_finance=self, defaults=values)
+        # Mantener la caché de la relación inversa en esta instancia
+        self.totals = totals
+        return totals
+
+    def calculate_totals(self, monthly_payments=None):
+        """
+        Calcula los totales del año sin guardarlos.
+
+        Si se pasan los pagos mensuales ya cargados se suman en memoria;
+        si no, se calculan con un único aggregate en la base de datos.
+        """
+        if monthly_payments is not None:
+            return {
+                'total_due': sum((p.amount_due for p in monthly_payments), Decimal('0.00')),
+                'total_paid': sum((p.amount_paid for p in monthly_payments), Decimal('0.00')),
+                'total_balance': sum((p.balance for p in monthly_payments), Decimal('0.00')),
+                'payments_completed': sum(1 for p in monthly_payments if p.is_paid),
+                'payments_pending': sum(1 for p in monthly_payments if not p.is_paid),
+            }
+        return self.monthly_payments.aggregate(
+            total_due=Coalesce(Sum('amount_due'), Decimal('0.00'), output_field=models.DecimalField()),
+            total_paid=Coalesce(Sum('amount_paid'), Decimal('0.00'), output_field=models.DecimalField()),
+            total_balance=Coalesce(Sum('balance'), Decimal('0.00'), output_field=models.DecimalField()),
+            payments_completed=Count('id', filter=Q(is_paid=True)),
+            payments_pending=Count('id', filter=Q(is_paid=False)),
+        )
+
+    def get_total_annual_amount(self):
+        """Monto total del año: 12 meses + DJ Anual"""
+        return (self.monthly_fee * 12) + self.annual_fee
+
+    def get_total_paid(self):
+        """Total pagado en el año calculado con un único aggregate"""
+        return self.monthly_payments.aggregate(
+            total=Coalesce(Sum('amount_paid'), Decimal('0.00'), output_field=models.DecimalField())
+        )['total']
+
+    def get_totals(self):
+        """
+        Devuelve los totales precalculados. Se usa en lecturas (GET), así que
+        nunca escribe: si la fila aún no existe los calcula sin guardarlos.
+        """
+        try:
+            return self.totals
+        except ClientFinanceTotals.DoesNotExist:
+            return ClientFinanceTotals(client_finance=self, **self.calculate_totals())
+
+    def calculate_amount_due(self, month, previous_payment=None, previous_has_transactions=False):
+        """
+        Calcula el amount_due de un mes aplicando estas reglas:
+        - Siempre partir de la cuota base del mes (monthly_fee) o DJ Anual.
+        - Solo sumar al mes actual la parte NO pagada de la cuota BASE del mes inmediato anterior
+          y únicamente si en el mes anterior hubo al menos una transacción (pago registrado).
+        - No propagar arrastres en cadena.
+        """
+        if month == 13:  # DJ Anual
+            # El DJ Anual siempre mantiene su monto fijo
+            return self.annual_fee
+        if month == 1 or previous_payment is None or not previous_has_transactions:
+            # Enero, o meses sin pagos registrados en el mes anterior, mantienen su monto base
+            return self.monthly_fee
+
+        unpaid_of_prev_base = self.monthly_fee - (previous_payment.amount_paid or Decimal('0.00'))
+        if unpaid_of_prev_base > 0:
+            return self.monthly_fee + unpaid_of_prev_base
+        return self.monthly_fee
+
+
+class ClientFinanceTotals(models.Model):
+    """Totales precalculados del año financiero del cliente"""
+    client_finance = models.OneToOneField(ClientFinance, on_delete=models.CASCADE, related_name='totals')
+    total_due = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    payments_completed = models.IntegerField(default=0)
+    payments_pending = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Totales {self.client_finance}"
+
+    @classmethod
+    def build_empty(cls, client_finance_id):
+        """Totales de un año recién creado con sus 13 pagos vacíos (para bulk_create)"""
+        return cls(client_finance_id=client_finance_id, payments_completed=13, payments_pending=0)
+
+    class Meta:
+        verbose_name = _('client finance totals')
+        verbose_name_plural = _('client finance totals')
 
 
 class MonthlyPayment(models.Model):
@@ -80,6 +254,18 @@ class MonthlyPayment(models.Model):
         month_name = dict(self.MONTH_CHOICES).get(self.month, f'Mes {self.month}')
         return f"{self.client_finance.client.name} - {month_name} {self.client_finance.year}"
 
+    @classmethod
+    def build_empty(cls, client_finance_id, month):
+        """Pago sin montos, con los mismos valores que calcularía save() (para bulk_create)"""
+        return cls(
+            client_finance_id=client_finance_id,
+            month=month,
+            amount_due=Decimal('0.00'),
+            amount_paid=Decimal('0.00'),
+            balance=Decimal('0.00'),
+            is_paid=True
+        )
+
     def save(self, *args, **kwargs):
         # Calcular balance automáticamente
         self.balance = self.amount_due - self.amount_paid
@@ -87,13 +273,14 @@ class MonthlyPayment(models.Model):
         
         # Validar que no se exceda el monto anual total
         if self.amount_paid > 0:
-            total_paid_this_year = sum(
-                payment.amount_paid for payment in self.client_finance.monthly_payments.all()
-                if payment.id != self.id  # Excluir el pago actual
-            ) + self.amount_paid
+            total_paid_this_year = self.client_finance.monthly_payments.exclude(
+                id=self.id  # Excluir el pago actual
+            ).aggregate(
+                total=Coalesce(Sum('amount_paid'), Decimal('0.00'), output_field=models.DecimalField())
+            )['total'] + self.amount_paid
             
             # Calcular el total anual real (12 meses + DJ Anual)
-            total_annual_amount = (self.client_finance.monthly_fee * 12) + self.client_finance.annual_fee
+            total_annual_amount = self.client_finance.get_total_annual_amount()
             
             if total_paid_this_year > total_annual_amount:
                 raise ValueError(
@@ -106,37 +293,20 @@ class MonthlyPayment(models.Model):
     
     def recalculate_amount_due(self):
         """
-        Recalcula el amount_due aplicando estas reglas:
-        - Siempre partir de la cuota base del mes (monthly_fee) o DJ Anual.
-        - Solo sumar al mes actual la parte NO pagada de la cuota BASE del mes inmediato anterior
-          y únicamente si en el mes anterior hubo al menos una transacción (pago registrado).
-        - No propagar arrastres en cadena.
+        Recalcula el amount_due de este mes según las reglas de
+        ClientFinance.calculate_amount_due.
         """
-        if self.month == 13:  # DJ Anual
-            # El DJ Anual siempre mantiene su monto fijo
-            self.amount_due = self.client_finance.annual_fee
-        elif self.month == 1:  # Enero
-            # Enero siempre mantiene su monto base
-            self.amount_due = self.client_finance.monthly_fee
-        else:
-            # Para meses regulares, calcular monto base + (eventual) saldo del mes anterior
-            base_amount = self.client_finance.monthly_fee
-            
-            # Solo considerar el saldo pendiente del mes inmediatamente anterior
-            previous_month = self.month - 1
-            try:
-                prev_payment = self.client_finance.monthly_payments.get(month=previous_month)
-                self.amount_due = base_amount
-                
-                # Aplicar arrastre SOLO si hubo al menos una transacción en el mes anterior
-                # y ese mes no cubrió su cuota BASE.
-                if prev_payment.transactions.exists():
-                    unpaid_of_prev_base = self.client_finance.monthly_fee - (prev_payment.amount_paid or Decimal('0.00'))
-                    if unpaid_of_prev_base > 0:
-                        self.amount_due = base_amount + unpaid_of_prev_base
-            except MonthlyPayment.DoesNotExist:
-                self.amount_due = base_amount
-        
+        previous_payment = None
+        previous_has_transactions = False
+        if self.month not in (1, 13):
+            previous_payment = self.client_finance.monthly_payments.filter(month=self.month - 1).first()
+            if previous_payment is not None:
+                previous_has_transactions = previous_payment.transactions.exists()
+
+        self.amount_due = self.client_finance.calculate_amount_due(
+            self.month, previous_payment, previous_has_transactions
+        )
+
         # Recalcular balance
         self.balance = self.amount_due - self.amount_paid
         self.is_paid = self.balance <= 0
@@ -145,6 +315,12 @@ class MonthlyPayment(models.Model):
         verbose_name = _('monthly payment')
         verbose_name_plural = _('monthly payments')
         unique_together = ['client_finance', 'month']
+        indexes = [
+            # Solo los pagos pendientes: cartera, vencidos y conteos de pendientes
+            models.Index(
+                fields=['client_finance', 'month'], condition=Q(is_paid=False), name='payment_unpaid_idx'
+            ),
+        ]
 
 
 class PaymentTransaction(models.Model):
@@ -155,6 +331,8 @@ class PaymentTransaction(models.Model):
     payment_method = models.CharField(max_length=50, blank=True)
     reference = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
+    # Clave enviada por el cliente para que los reintentos no registren el pago dos veces
+    idempotency_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -165,6 +343,10 @@ class PaymentTransaction(models.Model):
         verbose_name = _('payment transaction')
         verbose_name_plural = _('payment transactions')
         ordering = ['-payment_date']
+        indexes = [
+            # Paginación keyset (payment_date, id)
+            models.Index(fields=['-payment_date', '-id'], name='transaction_date_id_idx'),
+        ]
 
 
 class OperationalControl(models.Model):
@@ -177,6 +359,25 @@ class OperationalControl(models.Model):
     def __str__(self):
         return f"Control Operativo {self.client.name} - {self.year}"
 
+    @classmethod
+    def provision(cls, client, year):
+        """
+        Obtiene o crea el control operativo del año con sus 13 declaraciones
+        mensuales, de forma idempotente y segura ante accesos concurrentes.
+        """
+        with transaction.atomic():
+            operational_control, created = cls.objects.get_or_create(client=client, year=year)
+            if created:
+                operational_control.provision_monthly_declarations()
+        return operational_control, created
+
+    def provision_monthly_declarations(self):
+        """Crea en un solo INSERT las declaraciones mensuales que falten"""
+        MonthlyDeclaration.objects.bulk_create(
+            [MonthlyDeclaration(operational_control=self, month=month) for month in range(1, 14)],
+            ignore_conflicts=True
+        )
+
     class Meta:
         verbose_name = _('operational control')
         verbose_name_plural = _('operational controls')
@@ -210,7 +411,7 @@ class MonthlyDeclaration(models.Model):
         ordering = ['month']
 
 
-class TaxDeclaration(models.Model):
+class TaxDeclaration(ProcessedDocument):
     """Declaraciones tributarias PDT"""
     PDT_CHOICES = [
         ('PDT_601', 'PDT 601'),
@@ -232,12 +433,15 @@ class TaxDeclaration(models.Model):
     pdt_type = models.CharField(max_length=10, choices=PDT_CHOICES)
     order_number = models.CharField(max_length=50, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    pdf_file = models.FileField(upload_to='tax_declarations/', blank=True, null=True)
+    pdf_file = models.FileField(upload_to='tax_declarations/', storage=blob_storage, blank=True, null=True)
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    processed_file_field = 'pdf_file'
+    search_parent = 'monthly_declaration__operational_control__client'
+
     def __str__(self):
         return f"{self.get_pdt_type_display()} - {self.monthly_declaration}"
 
@@ -247,7 +451,7 @@ class TaxDeclaration(models.Model):
         ordering = ['pdt_type']
 
 
-class AdditionalPDT(models.Model):
+class AdditionalPDT(ProcessedDocument):
     """PDTs adicionales fuera del calendario regular"""
     PDT_CHOICES = [
         ('PDT_601', 'PDT 601'),
@@ -272,12 +476,15 @@ class AdditionalPDT(models.Model):
     order_number = models.CharField(max_length=50, blank=True)
     presentation_date = models.DateField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    pdf_file = models.FileField(upload_to='additional_pdts/', blank=True, null=True)
+    pdf_file = models.FileField(upload_to='additional_pdts/', storage=blob_storage, blank=True, null=True)
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    processed_file_field = 'pdf_file'
+    search_parent = 'operational_control__client'
+
     def __str__(self):
         pdt_name = self.pdt_name if self.pdt_type == 'OTHER' else self.get_pdt_type_display()
         return f"{pdt_name} - {self.operational_control.client.name}"
@@ -1,5 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from estudiomd_tasks.fieldsets import SparseFieldsMixin
+from files.serializers import (
+    PROCESSED_DOCUMENT_FIELDS, ChunkedUploadSerializerMixin, ProcessedDocumentSerializerMixin
+)
 from .models import (
     Client, ClientFinance, MonthlyPayment, 
     PaymentTransaction, OperationalControl,
@@ -9,7 +13,13 @@ from .models import (
 User = get_user_model()
 
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    El contexto 'finances' controla la información financiera incluida:
+    'full' (por defecto) serializa el año actual con sus pagos, 'summary' solo
+    los totales y 'none' omite el campo. Con ?expand= sin 'finances' también
+    se omite.
+    """
     finances = serializers.SerializerMethodField()
     
     class Meta:
@@ -19,19 +29,48 @@ class ClientSerializer(serializers.ModelSerializer):
             'phone', 'address', 'city', 'state', 'created_at', 'finances'
         ]
         read_only_fields = ['id', 'created_at']
+        expandable_fields = ['finances']
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get('finances') == 'none':
+            self.fields.pop('finances', None)
     
     def get_finances(self, obj):
         # Obtener solo la configuración financiera del año actual
-        from django.utils import timezone
-        current_year = timezone.now().year
-        try:
-            finance = obj.finances.get(year=current_year)
-            return ClientFinanceSerializer(finance).data
-        except ClientFinance.DoesNotExist:
+        if hasattr(obj, 'current_year_finances'):
+            # Precargada por la vista con Prefetch(to_attr='current_year_finances')
+            finance = obj.current_year_finances[0] if obj.current_year_finances else None
+        else:
+            from django.utils import timezone
+            finance = obj.finances.filter(year=timezone.now().year).first()
+        
+        if finance is None:
             return None
+        if self.context.get('finances') == 'summary':
+            return ClientFinanceSummarySerializer(finance).data
+        return ClientFinanceSerializer(finance).data
 
 
-class PaymentTransactionSerializer(serializers.ModelSerializer):
+class ClientFinanceSummarySerializer(serializers.ModelSerializer):
+    """Totales del año sin pagos ni transacciones anidadas"""
+    total_due = serializers.ReadOnlyField(source='get_totals.total_due')
+    total_paid = serializers.ReadOnlyField(source='get_totals.total_paid')
+    total_balance = serializers.ReadOnlyField(source='get_totals.total_balance')
+    payments_completed = serializers.ReadOnlyField(source='get_totals.payments_completed')
+    payments_pending = serializers.ReadOnlyField(source='get_totals.payments_pending')
+    
+    class Meta:
+        model = ClientFinance
+        fields = [
+            'id', 'client', 'annual_fee', 'monthly_fee', 'year',
+            'total_due', 'total_paid', 'total_balance',
+            'payments_completed', 'payments_pending', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class PaymentTransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
     
     class Meta:
@@ -43,7 +82,7 @@ class PaymentTransactionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_by', 'created_at']
 
 
-class MonthlyPaymentSerializer(serializers.ModelSerializer):
+class MonthlyPaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     month_name = serializers.CharField(source='get_month_display', read_only=True)
     transactions = PaymentTransactionSerializer(many=True, read_only=True)
     
@@ -54,9 +93,10 @@ class MonthlyPaymentSerializer(serializers.ModelSerializer):
             'is_paid', 'payment_date', 'notes', 'transactions', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'balance', 'is_paid', 'created_at', 'updated_at']
+        expandable_fields = ['transactions']
 
 
-class ClientFinanceSerializer(serializers.ModelSerializer):
+class ClientFinanceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.name', read_only=True)
     monthly_payments = MonthlyPaymentSerializer(many=True, read_only=True)
     total_due = serializers.SerializerMethodField()
@@ -71,30 +111,57 @@ class ClientFinanceSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = ['monthly_payments']
     
     def get_total_due(self, obj):
-        return sum(payment.amount_due for payment in obj.monthly_payments.all())
+        return obj.get_totals().total_due
     
     def get_total_paid(self, obj):
-        return sum(payment.amount_paid for payment in obj.monthly_payments.all())
+        return obj.get_totals().total_paid
     
     def get_total_balance(self, obj):
-        return sum(payment.balance for payment in obj.monthly_payments.all())
+        return obj.get_totals().total_balance
+
 
+class PortfolioFinanceSerializer(SparseFieldsMixin, serializers.Serializer):
+    """Totales anuales de un cliente calculados con aggregates en la base de datos"""
+    client = serializers.IntegerField(source='client_id')
+    client_name = serializers.CharField(source='client.name')
+    company_name = serializers.CharField(source='client.company_name')
+    company_ruc = serializers.CharField(source='client.company_ruc')
+    city = serializers.CharField(source='client.city')
+    state = serializers.CharField(source='client.state')
+    year = serializers.IntegerField()
+    annual_fee = serializers.DecimalField(max_digits=10, decimal_places=2)
+    monthly_fee = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_due = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_paid = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_balance = serializers.DecimalField(max_digits=12, decimal_places=2)
+    overdue_balance = serializers.DecimalField(max_digits=12, decimal_places=2)
+    payments_completed = serializers.IntegerField()
+    payments_pending = serializers.IntegerField()
+    payments_overdue = serializers.IntegerField()
 
-class TaxDeclarationSerializer(serializers.ModelSerializer):
+
+class TaxDeclarationSerializer(SparseFieldsMixin, ChunkedUploadSerializerMixin, ProcessedDocumentSerializerMixin,
+                               serializers.ModelSerializer):
     pdt_type_display = serializers.CharField(source='get_pdt_type_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
     pdf_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    upload_id = serializers.UUIDField(write_only=True, required=False)
+    upload_purpose = 'tax_declaration'
+    upload_file_field = 'pdf_file'
     
     class Meta:
         model = TaxDeclaration
         fields = [
             'id', 'pdt_type', 'pdt_type_display', 'order_number', 'status', 'status_display',
-            'pdf_file', 'pdf_url', 'notes', 'created_by', 'created_by_name', 'created_at', 'updated_at'
-        ]
-        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
+            'pdf_file', 'pdf_url', 'notes', 'created_by', 'created_by_name', 'created_at', 'updated_at',
+            'upload_id'
+        ] + PROCESSED_DOCUMENT_FIELDS
+        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at'] + PROCESSED_DOCUMENT_FIELDS
     
     def get_pdf_url(self, obj):
         if obj.pdf_file and hasattr(obj.pdf_file, 'url'):
@@ -105,7 +172,7 @@ class TaxDeclarationSerializer(serializers.ModelSerializer):
         return None
 
 
-class MonthlyDeclarationSerializer(serializers.ModelSerializer):
+class MonthlyDeclarationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     month_name = serializers.CharField(source='get_month_display', read_only=True)
     tax_declarations = serializers.SerializerMethodField()
     
@@ -116,12 +183,14 @@ class MonthlyDeclarationSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = ['tax_declarations']
     
     def get_tax_declarations(self, obj):
+        # .all() usa la caché de prefetch_related cuando la vista la precargó
         return TaxDeclarationSerializer(obj.tax_declarations.all(), many=True, context=self.context).data
 
 
-class OperationalControlSerializer(serializers.ModelSerializer):
+class OperationalControlSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.name', read_only=True)
     monthly_declarations = MonthlyDeclarationSerializer(many=True, read_only=True)
     additional_pdts = serializers.SerializerMethodField()
@@ -133,25 +202,33 @@ class OperationalControlSerializer(serializers.ModelSerializer):
             'additional_pdts', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = ['monthly_declarations', 'additional_pdts']
     
     def get_additional_pdts(self, obj):
+        # .all() usa la caché de prefetch_related cuando la vista la precargó
         return AdditionalPDTSerializer(obj.additional_pdts.all(), many=True, context=self.context).data
 
 
-class AdditionalPDTSerializer(serializers.ModelSerializer):
+class AdditionalPDTSerializer(SparseFieldsMixin, ChunkedUploadSerializerMixin, ProcessedDocumentSerializerMixin,
+                              serializers.ModelSerializer):
     pdt_type_display = serializers.CharField(source='get_pdt_type_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
     pdf_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    upload_id = serializers.UUIDField(write_only=True, required=False)
+    upload_purpose = 'additional_pdt'
+    upload_file_field = 'pdf_file'
     
     class Meta:
         model = AdditionalPDT
         fields = [
             'id', 'pdt_type', 'pdt_type_display', 'pdt_name', 'order_number', 
             'presentation_date', 'status', 'status_display', 'pdf_file', 'pdf_url',
-            'notes', 'created_by', 'created_by_name', 'created_at', 'updated_at'
-        ]
-        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
+            'notes', 'created_by', 'created_by_name', 'created_at', 'updated_at',
+            'upload_id'
+        ] + PROCESSED_DOCUMENT_FIELDS
+        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at'] + PROCESSED_DOCUMENT_FIELDS
     
     def get_pdf_url(self, obj):
         if obj.pdf_file and hasattr(obj.pdf_file, 'url'):
@@ -162,11 +239,16 @@ class AdditionalPDTSerializer(serializers.ModelSerializer):
         return None
 
 
-class CreateTaxDeclarationSerializer(serializers.ModelSerializer):
+class CreateTaxDeclarationSerializer(ChunkedUploadSerializerMixin, serializers.ModelSerializer):
+    # Subida por partes ya finalizada, en lugar de 'pdf_file'
+    upload_id = serializers.UUIDField(write_only=True, required=False)
+    upload_purpose = 'tax_declaration'
+    upload_file_field = 'pdf_file'
+    
     class Meta:
         model = TaxDeclaration
         fields = [
-            'pdt_type', 'order_number', 'status', 'pdf_file', 'notes'
+            'pdt_type', 'order_number', 'status', 'pdf_file', 'notes', 'upload_id'
         ]
     
     def create(self, validated_data):
@@ -174,12 +256,17 @@ class CreateTaxDeclarationSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CreateAdditionalPDTSerializer(serializers.ModelSerializer):
+class CreateAdditionalPDTSerializer(ChunkedUploadSerializerMixin, serializers.ModelSerializer):
+    # Subida por partes ya finalizada, en lugar de 'pdf_file'
+    upload_id = serializers.UUIDField(write_only=True, required=False)
+    upload_purpose = 'additional_pdt'
+    upload_file_field = 'pdf_file'
+    
     class Meta:
         model = AdditionalPDT
         fields = [
             'pdt_type', 'pdt_name', 'order_number', 
-            'presentation_date', 'status', 'pdf_file', 'notes'
+            'presentation_date', 'status', 'pdf_file', 'notes', 'upload_id'
         ]
     
     def create(self, validated_data):
@@ -190,14 +277,32 @@ class CreateAdditionalPDTSerializer(serializers.ModelSerializer):
 class CreatePaymentTransactionSerializer(serializers.ModelSerializer):
     payment_date = serializers.DateTimeField(input_formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', 'iso-8601'])
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    idempotency_key = serializers.CharField(max_length=100, required=False, allow_blank=True, write_only=True)
     
     class Meta:
         model = PaymentTransaction
         fields = [
             'amount', 'payment_date', 'payment_method',
-            'reference', 'notes'
+            'reference', 'notes', 'idempotency_key'
         ]
     
+    @classmethod
+    def get_idempotency_key(cls, request):
+        """
+        Clave del header Idempotency-Key o del campo idempotency_key, validada
+        como el campo del serializer (400 si no es texto o supera 100 caracteres).
+        Se valida antes del resto porque se busca antes de validar el pago.
+        """
+        value = request.headers.get('Idempotency-Key')
+        if not value and hasattr(request.data, 'get'):
+            value = request.data.get('idempotency_key')
+        if value is None or value == '':
+            return None
+        try:
+            return cls().fields['idempotency_key'].run_validation(value) or None
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({'idempotency_key': exc.detail})
+    
     def validate_amount(self, value):
         if value <= 0:
             raise serializers.ValidationError("El monto debe ser mayor a 0")
@@ -218,14 +323,14 @@ class CreatePaymentTransactionSerializer(serializers.ModelSerializer):
         
         amount = data.get('amount', 0)
         
-        # Calcular el monto total ya pagado en el año
-        client_finance = monthly_payment.client_finance
-        total_paid_this_year = sum(
-            payment.amount_paid for payment in client_finance.monthly_payments.all()
-        )
+        # Usar la ClientFinance bloqueada por la vista (select_for_update) si está disponible
+        client_finance = self.context.get('client_finance') or monthly_payment.client_finance
+        
+        # Calcular el monto total ya pagado en el año con un único aggregate
+        total_paid_this_year = client_finance.get_total_paid()
         
         # Calcular el monto total anual (12 meses + DJ Anual)
-        total_annual_amount = (client_finance.monthly_fee * 12) + client_finance.annual_fee
+        total_annual_amount = client_finance.get_total_annual_amount()
         
         # Verificar que no se exceda el monto anual
         if total_paid_this_year + amount > total_annual_amount:
@@ -244,3 +349,19 @@ class CreatePaymentTransactionSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class BulkPaymentLineSerializer(serializers.Serializer):
+    """Línea de un lote de pagos (extracto bancario en CSV o JSON)"""
+    client = serializers.IntegerField()
+    year = serializers.IntegerField()
+    month = serializers.ChoiceField(choices=MonthlyPayment.MONTH_CHOICES)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    payment_date = serializers.DateTimeField(input_formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', 'iso-8601'])
+    payment_method = serializers.CharField(max_length=50, required=False, allow_blank=True, default='')
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    idempotency_key = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True, default=None)
+    
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("El monto debe ser mayor a 0")
+        return value
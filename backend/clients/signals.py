@@ -0,0 +1,78 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from estudiomd_tasks.cache import bump_cache_version_on_commit
+from estudiomd_tasks.search import update_search_vector
+from files.processing import update_parent_search
+from .models import (
+    Client, ClientFinance, ClientFinanceTotals, MonthlyPayment,
+    PaymentTransaction, OperationalControl, MonthlyDeclaration, TaxDeclaration, AdditionalPDT
+)
+
+
+def _deleted_by_cascade(origin, parent_models):
+    """Indica si el borrado viene en cascada desde alguno de los modelos padre"""
+    origin_model = getattr(origin, 'model', None) or type(origin)
+    return origin_model in parent_models
+
+
+@receiver(post_save, sender=MonthlyPayment)
+@receiver(post_delete, sender=MonthlyPayment)
+def sync_totals_on_monthly_payment_change(sender, instance, raw=False, origin=None, **kwargs):
+    """Mantener ClientFinanceTotals al día cuando cambia un pago mensual"""
+    if raw or _deleted_by_cascade(origin, (Client, ClientFinance)):
+        return
+    client_finance = ClientFinance.objects.filter(id=instance.client_finance_id).first()
+    if client_finance is not None:
+        client_finance.refresh_totals()
+
+
+@receiver(post_delete, sender=PaymentTransaction)
+def sync_totals_on_payment_transaction_delete(sender, instance, origin=None, **kwargs):
+    """Recalcular el año cuando se elimina una transacción (afecta los arrastres)"""
+    if _deleted_by_cascade(origin, (Client, ClientFinance, MonthlyPayment)):
+        return
+    client_finance = ClientFinance.objects.filter(monthly_payments__id=instance.monthly_payment_id).first()
+    if client_finance is not None:
+        client_finance.recalculate_all_monthly_payments()
+
+
+@receiver(post_save, sender=Client)
+def update_client_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_vector(Client, [instance.pk])
+
+
+@receiver(post_delete, sender=TaxDeclaration)
+@receiver(post_delete, sender=AdditionalPDT)
+def update_client_search_on_pdt_delete(sender, instance, origin=None, **kwargs):
+    """El texto del PDF eliminado deja de encontrar al cliente"""
+    if not _deleted_by_cascade(origin, (Client, OperationalControl, MonthlyDeclaration)):
+        update_parent_search(instance)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_cache_on_client_change(sender, instance, **kwargs):
+    bump_cache_version_on_commit('clients', f'client:{instance.id}')
+
+
+@receiver(post_save, sender=ClientFinance)
+@receiver(post_delete, sender=ClientFinance)
+@receiver(post_save, sender=OperationalControl)
+@receiver(post_delete, sender=OperationalControl)
+def invalidate_cache_on_year_change(sender, instance, **kwargs):
+    bump_cache_version_on_commit('clients', f'client:{instance.client_id}')
+
+
+@receiver(post_save, sender=ClientFinanceTotals)
+@receiver(post_delete, sender=ClientFinanceTotals)
+def invalidate_cache_on_totals_change(sender, instance, **kwargs):
+    """
+    Los totales se reescriben después de cualquier cambio en pagos o
+    transacciones (incluidos bulk_update/F()), así que cubren esos casos.
+    """
+    client_id = ClientFinance.objects.filter(id=instance.client_finance_id).values_list('client_id', flat=True).first()
+    if client_id is not None:
+        bump_cache_version_on_commit('clients', f'client:{client_id}')
+    else:
+        bump_cache_version_on_commit('clients')
@@ -1,3 +1,463 @@
+import io
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from estudiomd_tasks.cache import get_cache_version
+
+from .models import (
+    Client, ClientFinance, ClientFinanceTotals, MonthlyDeclaration, MonthlyPayment, OperationalControl,
+    PaymentTransaction
+)
+from .views import BulkPaymentImportView
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Los planes de consulta solo se verifican en PostgreSQL')
+class QueryPlanTests(TestCase):
+    """
+    Regresión de planes: las consultas de los endpoints más usados deben
+    resolverse con sus índices. Con pocas filas el planificador prefiere un
+    seq scan, así que se desactiva para ver qué índice elegiría.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='plan', email='plan@example.com', password='plan', role='admin'
+        )
+        cls.client_obj = Client.objects.create(
+            name='Cliente', dni='12345678', company_name='Empresa', company_ruc='20123456789',
+            email='cliente@example.com', phone='999', address='Av. 1', city='Lima', state='Lima'
+        )
+        finance, _ = ClientFinance.provision(
+            cls.client_obj, timezone.now().year,
+            defaults={'annual_fee': Decimal('0.00'), 'monthly_fee': Decimal('100.00')}
+        )
+        payment = finance.monthly_payments.get(month=1)
+        PaymentTransaction.objects.create(
+            monthly_payment=payment, amount=Decimal('50.00'), payment_date=timezone.now(), created_by=cls.user
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f'Se esperaba {" o ".join(index_names)} en el plan:\n{plan}'
+        )
+
+    def test_transactions_by_payment_date(self):
+        queryset = PaymentTransaction.objects.order_by('-payment_date', '-id')[:20]
+        self.assertUsesIndex(queryset, 'transaction_date_id_idx')
+
+    def test_unpaid_payments(self):
+        self.assertUsesIndex(MonthlyPayment.objects.filter(is_paid=False), 'payment_unpaid_idx')
+
+    def test_client_search(self):
+        self.assertUsesIndex(Client.objects.filter(name='Cliente'), 'client_name_idx')
+        self.assertUsesIndex(Client.objects.filter(company_ruc__startswith='2012'), 'client_ruc_idx')
+        self.assertUsesIndex(Client.objects.filter(dni__startswith='1234'), 'client_dni_idx')
+
+    def test_client_fulltext_search(self):
+        query = SearchQuery("'clien':*", search_type='raw', config='simple')
+        self.assertUsesIndex(Client.objects.filter(search_vector=query), 'client_search_vector_idx')
+        self.assertUsesIndex(Client.objects.filter(name__trigram_similar='Clinte'), 'client_name_trgm_idx')
+
+    def test_client_list_order(self):
+        self.assertUsesIndex(Client.objects.order_by('-created_at', '-id')[:20], 'client_created_id_idx')
+
+
+def per_row_amount_due(payment):
+    """Algoritmo original (fila por fila, antes de bulk_update) como referencia"""
+    finance = payment.client_finance
+    if payment.month == 13:
+        return finance.annual_fee
+    if payment.month == 1:
+        return finance.monthly_fee
+    previous = finance.monthly_payments.filter(month=payment.month - 1).first()
+    if previous is None or not previous.transactions.exists():
+        return finance.monthly_fee
+    unpaid_of_prev_base = finance.monthly_fee - (previous.amount_paid or Decimal('0.00'))
+    return finance.monthly_fee + unpaid_of_prev_base if unpaid_of_prev_base > 0 else finance.monthly_fee
+
+
+class RecalculateMonthlyPaymentsTests(TestCase):
+    """recalculate_all_monthly_payments da los mismos montos que el cálculo fila por fila"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='finanzas', email='finanzas@example.com', password='finanzas', role='admin'
+        )
+        cls.client_obj = Client.objects.create(name='Cliente', email='cliente@example.com')
+        cls.finance, _ = ClientFinance.provision(
+            cls.client_obj, 2024, defaults={'annual_fee': Decimal('500.00'), 'monthly_fee': Decimal('100.00')}
+        )
+
+    def pay(self, month, amount, transaction=True):
+        payment = self.finance.monthly_payments.get(month=month)
+        MonthlyPayment.objects.filter(pk=payment.pk).update(amount_paid=Decimal(amount))
+        if transaction:
+            PaymentTransaction.objects.create(
+                monthly_payment=payment, amount=Decimal(amount), payment_date=timezone.now(), created_by=self.user
+            )
+
+    def test_matches_per_row_results(self):
+        self.pay(1, '40.00')                      # pago parcial: febrero arrastra 60
+        self.pay(2, '250.00')                     # sobrepago: marzo no arrastra
+        self.pay(4, '30.00', transaction=False)   # sin transacción: mayo no arrastra
+        self.pay(6, '100.00')                     # cuota completa
+        self.pay(12, '10.00')                     # el DJ Anual no arrastra diciembre
+        self.pay(13, '100.00')
+
+        self.finance.recalculate_all_monthly_payments()
+
+        payments = {payment.month: payment for payment in self.finance.monthly_payments.all()}
+        for month, payment in payments.items():
+            expected_due = per_row_amount_due(payment)
+            self.assertEqual(payment.amount_due, expected_due, f'mes {month}')
+            self.assertEqual(payment.balance, expected_due - payment.amount_paid, f'mes {month}')
+            self.assertEqual(payment.is_paid, payment.balance <= 0, f'mes {month}')
+
+        self.assertEqual(payments[2].amount_due, Decimal('160.00'))
+        self.assertEqual(payments[2].balance, Decimal('-90.00'))
+        self.assertTrue(payments[2].is_paid)
+        self.assertEqual(payments[3].amount_due, Decimal('100.00'))
+        self.assertEqual(payments[5].amount_due, Decimal('100.00'))
+        self.assertEqual(payments[13].amount_due, Decimal('500.00'))
+        self.assertEqual(payments[13].balance, Decimal('400.00'))
+
+        totals = self.finance.totals
+        self.assertEqual(totals.total_due, sum(p.amount_due for p in payments.values()))
+        self.assertEqual(totals.total_balance, sum(p.balance for p in payments.values()))
+
+    def test_second_pass_changes_nothing(self):
+        self.pay(1, '40.00')
+        self.finance.recalculate_all_monthly_payments()
+        self.assertEqual(self.finance.recalculate_all_monthly_payments(), 0)
+
+
+class ProvisionYearTests(APITestCase):
+    """Creación anticipada del año: 13 hijos por año, totales incluidos, sin duplicar al repetir"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='provision', email='provision@example.com', password='provision', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.clients = [Client.objects.create(name=f'Cliente {i}', email=f'cliente{i}@example.com') for i in range(3)]
+
+    def provision_year(self, *args):
+        out = io.StringIO()
+        call_command('provision_year', '--year', '2030', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def assert_provisioned(self):
+        finances = ClientFinance.objects.filter(year=2030)
+        controls = OperationalControl.objects.filter(year=2030)
+        self.assertEqual(finances.count(), 3)
+        self.assertEqual(controls.count(), 3)
+        self.assertEqual(ClientFinanceTotals.objects.filter(client_finance__in=finances).count(), 3)
+        for finance in finances:
+            self.assertEqual(sorted(finance.monthly_payments.values_list('month', flat=True)), list(range(1, 14)))
+        for control in controls:
+            self.assertEqual(
+                sorted(control.monthly_declarations.values_list('month', flat=True)), list(range(1, 14))
+            )
+
+    def test_command_is_idempotent(self):
+        self.assertIn('3 configuraciones financieras y 3 controles operativos', self.provision_year())
+        self.assert_provisioned()
+        self.assertIn('0 configuraciones financieras y 0 controles operativos', self.provision_year())
+        self.assert_provisioned()
+        self.assertEqual(MonthlyPayment.objects.count(), 3 * 13)
+        self.assertEqual(MonthlyDeclaration.objects.count(), 3 * 13)
+
+    def test_existing_totals_are_kept(self):
+        finance, _ = ClientFinance.provision(self.clients[0], 2030, {'monthly_fee': Decimal('100.00')})
+        finance.recalculate_all_monthly_payments()
+        self.provision_year('--only', 'finance')
+        finance.totals.refresh_from_db()
+        self.assertEqual(finance.totals.total_due, Decimal('1200.00'))
+        self.assertEqual(finance.totals.payments_pending, 12)
+        self.assertFalse(OperationalControl.objects.exists())
+
+    def test_model_provision_is_idempotent(self):
+        finance, created = ClientFinance.provision(self.clients[0], 2030)
+        self.assertTrue(created)
+        self.assertEqual(finance.monthly_payments.count(), 13)
+        self.assertEqual(finance.totals.payments_completed, 13)
+        self.assertEqual(ClientFinance.provision(self.clients[0], 2030), (finance, False))
+        self.assertEqual(MonthlyPayment.objects.count(), 13)
+        self.assertEqual(ClientFinanceTotals.objects.count(), 1)
+
+        control, created = OperationalControl.provision(self.clients[0], 2030)
+        self.assertTrue(created)
+        self.assertEqual(OperationalControl.provision(self.clients[0], 2030), (control, False))
+        self.assertEqual(control.monthly_declarations.count(), 13)
+
+    def test_reads_do_not_write_totals(self):
+        self.provision_year('--only', 'finance')
+        finance = ClientFinance.objects.get(client=self.clients[0], year=2030)
+        expected = {
+            'total_due': Decimal('0.00'), 'total_paid': Decimal('0.00'), 'total_balance': Decimal('0.00'),
+            'payments_completed': 13, 'payments_pending': 0,
+        }
+        self.assertEqual(finance.calculate_totals(), expected)
+        for field, value in expected.items():
+            self.assertEqual(getattr(finance.totals, field), value)
+
+        # Un año sin fila de totales se calcula al leer, sin crearla
+        finance.totals.delete()
+        finance = ClientFinance.objects.get(pk=finance.pk)
+        self.assertEqual(finance.get_totals().payments_completed, 13)
+        response = self.client.get(f'/api/v1/clients/{self.clients[0].id}/finance/summary/?year=2030')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['payments_completed'], 13)
+        self.assertFalse(ClientFinanceTotals.objects.filter(client_finance=finance).exists())
+
+
+class PaymentTransactionTests(APITestCase):
+    """Registro de pagos con clave de idempotencia"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='pagos', email='pagos@example.com', password='pagos', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.client_obj = Client.objects.create(name='Cliente', email='cliente@example.com')
+        self.finance, _ = ClientFinance.provision(
+            self.client_obj, 2024, defaults={'annual_fee': Decimal('500.00'), 'monthly_fee': Decimal('100.00')}
+        )
+        self.finance.recalculate_all_monthly_payments()
+        self.payment = self.finance.monthly_payments.get(month=1)
+        self.url = f'/api/v1/clients/{self.client_obj.id}/payments/{self.payment.id}/transactions/'
+
+    def post(self, **data):
+        return self.client.post(self.url, {'amount': '40.00', 'payment_date': '2024-01-15', **data}, format='json')
+
+    def test_same_key_registers_once(self):
+        first = self.post(idempotency_key='banco-001')
+        second = self.post(idempotency_key='banco-001')
+
+        self.assertEqual(first.status_code, 201, first.data)
+        self.assertEqual(second.status_code, 200, second.data)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(PaymentTransaction.objects.filter(monthly_payment=self.payment).count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.amount_paid, Decimal('40.00'))
+        self.assertEqual(self.payment.balance, Decimal('60.00'))
+        # Febrero arrastra lo que faltó de enero
+        self.assertEqual(self.finance.monthly_payments.get(month=2).amount_due, Decimal('160.00'))
+
+    def test_header_key(self):
+        self.client.credentials(HTTP_IDEMPOTENCY_KEY='banco-002')
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(PaymentTransaction.objects.count(), 1)
+
+    def test_invalid_key(self):
+        for key in (['a', 'b'], {'a': 1}, 'x' * 101):
+            response = self.post(idempotency_key=key)
+            self.assertEqual(response.status_code, 400, key)
+            self.assertIn('idempotency_key', response.data)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_key_used_for_another_payment(self):
+        self.post(idempotency_key='banco-003')
+        other = self.finance.monthly_payments.get(month=2)
+        response = self.client.post(
+            f'/api/v1/clients/{self.client_obj.id}/payments/{other.id}/transactions/',
+            {'amount': '40.00', 'payment_date': '2024-02-15', 'idempotency_key': 'banco-003'}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+
+
+class ClientTransactionPaginationTests(APITestCase):
+    """?ordering= cambia el orden de ('-payment_date', '-id'): el cursor no lo conservaría"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='historial', email='historial@example.com', password='historial', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.client_obj = Client.objects.create(name='Cliente', email='cliente@example.com')
+        finance, _ = ClientFinance.provision(self.client_obj, 2024)
+        payment = finance.monthly_payments.get(month=1)
+        for day, amount in ((1, '30.00'), (2, '10.00'), (3, '20.00')):
+            PaymentTransaction.objects.create(
+                monthly_payment=payment, amount=Decimal(amount), payment_date=f'2024-01-0{day}T10:00Z',
+                created_by=self.user
+            )
+        self.url = f'/api/v1/clients/{self.client_obj.id}/transactions/'
+
+    def amounts(self, data):
+        return [row['amount'] for row in data['results']]
+
+    def test_cursor(self):
+        data = self.client.get(f'{self.url}?cursor=&page_size=2').data
+        self.assertEqual(self.amounts(data), ['20.00', '10.00'])
+        self.assertIn('cursor=', data['next'])
+
+    def test_ordering_falls_back_to_page_numbers(self):
+        response = self.client.get(f'{self.url}?cursor=&ordering=amount&page_size=2')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.amounts(response.data), ['10.00', '20.00'])
+        self.assertNotIn('count', response.data)
+        self.assertNotIn('cursor=', response.data['next'])
+        self.assertIn('count=false', response.data['next'])
+
+        data = self.client.get(response.data['next']).data
+        self.assertEqual(self.amounts(data), ['30.00'])
+        self.assertIsNone(data['next'])
+
+
+class BulkPaymentImportTests(APITestCase):
+    """Importación de lotes de pagos (CSV y JSON)"""
+    url = '/api/v1/clients/payments/bulk/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='lotes', email='lotes@example.com', password='lotes', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.client_obj = Client.objects.create(name='Cliente', email='cliente@example.com')
+        self.finance, _ = ClientFinance.provision(
+            self.client_obj, 2024, defaults={'annual_fee': Decimal('500.00'), 'monthly_fee': Decimal('100.00')}
+        )
+        self.finance.recalculate_all_monthly_payments()
+
+    def line(self, month=1, amount='50.00', **extra):
+        return {'client': self.client_obj.id, 'year': 2024, 'month': month, 'amount': amount,
+                'payment_date': '2024-01-20', **extra}
+
+    def post_lines(self, lines):
+        return self.client.post(self.url, {'transactions': lines}, format='json')
+
+    def test_mixed_valid_and_invalid_lines(self):
+        response = self.post_lines([
+            self.line(1, '40.00'),
+            self.line(2, '-5.00'),                              # monto inválido
+            self.line(3, '30.00', client=self.client_obj.id + 99),  # sin finanzas
+            self.line(4, '2000.00'),                            # supera el monto anual
+            self.line(2, '60.00'),
+        ])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['created'], response.data['errors']), (2, 3))
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'error', 'error', 'error', 'created'])
+        self.assertEqual(PaymentTransaction.objects.count(), 2)
+        payments = {p.month: p for p in self.finance.monthly_payments.all()}
+        self.assertEqual(payments[1].amount_paid, Decimal('40.00'))
+        self.assertEqual(payments[2].amount_due, Decimal('160.00'))
+        self.assertEqual(payments[2].balance, Decimal('100.00'))
+
+    def test_duplicate_keys(self):
+        first = self.post_lines([self.line(idempotency_key='op-1')])
+        response = self.post_lines([
+            self.line(idempotency_key='op-1'),
+            self.line(2, idempotency_key='op-2'),
+            self.line(2, idempotency_key='op-2'),
+        ])
+        self.assertEqual([r['status'] for r in response.data['results']], ['duplicate', 'created', 'duplicate'])
+        results = response.data['results']
+        self.assertEqual(results[0]['transaction_id'], first.data['results'][0]['transaction_id'])
+        self.assertEqual(results[2]['transaction_id'], results[1]['transaction_id'])
+        self.assertEqual(PaymentTransaction.objects.count(), 2)
+
+    def test_key_registered_concurrently(self):
+        # Otro request registra la clave después de la consulta previa: el insert falla y se reintenta
+        existing = PaymentTransaction.objects.create(
+            monthly_payment=self.finance.monthly_payments.get(month=1), amount=Decimal('10.00'),
+            payment_date=timezone.now(), idempotency_key='op-9', created_by=self.user
+        )
+        real = BulkPaymentImportView.find_existing_keys
+        calls = []
+
+        def find_existing_keys(view, keys):
+            calls.append(keys)
+            return {} if len(calls) == 1 else real(view, keys)
+
+        with mock.patch.object(BulkPaymentImportView, 'find_existing_keys', find_existing_keys):
+            response = self.post_lines([self.line(idempotency_key='op-9'), self.line(2, idempotency_key='op-10')])
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(calls), 3)  # consulta, verificación tras el IntegrityError y reintento
+        self.assertEqual([r['status'] for r in response.data['results']], ['duplicate', 'created'])
+        self.assertEqual(response.data['results'][0]['transaction_id'], existing.id)
+        self.assertEqual(PaymentTransaction.objects.count(), 2)
+
+    def test_line_limit(self):
+        with mock.patch.object(BulkPaymentImportView, 'max_lines', 3):
+            response = self.post_lines([self.line()] * 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentTransaction.objects.exists())
+        self.assertEqual(BulkPaymentImportView.max_lines, 5000)
+
+    def test_latin1_csv(self):
+        content = (
+            'client,year,month,amount,payment_date,notes\n'
+            f'{self.client_obj.id},2024,1,50.00,2024-01-20,Depósito en agencia Ñaña\n'
+        ).encode('cp1252')
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('extracto.csv', content)})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(PaymentTransaction.objects.get().notes, 'Depósito en agencia Ñaña')
+
+    def test_undecodable_csv(self):
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('extracto.csv', b'client\n\x81\x8d\n')})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file', response.data)
+
+
+class ResponseCacheInvalidationTests(APITestCase):
+    """La versión de la caché cambia al confirmarse la escritura, no antes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='cache', email='cache@example.com', password='cache', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.client_obj = Client.objects.create(name='Cliente', email='cliente@example.com')
+        self.finance, _ = ClientFinance.provision(
+            self.client_obj, 2024, defaults={'annual_fee': Decimal('500.00'), 'monthly_fee': Decimal('100.00')}
+        )
+        self.finance.recalculate_all_monthly_payments()
+        self.payment = self.finance.monthly_payments.get(month=1)
+        self.summary_url = f'/api/v1/clients/{self.client_obj.id}/finance/summary/?year=2024'
+
+    def test_bump_after_commit(self):
+        scope = f'client:{self.client_obj.id}'
+        self.assertEqual(self.client.get(self.summary_url).data['total_paid'], Decimal('0.00'))
+        version = get_cache_version(scope)
+
+        # El pago se registra dentro del atomic() de la vista; los callbacks quedan pendientes del commit
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                f'/api/v1/clients/{self.client_obj.id}/payments/{self.payment.id}/transactions/',
+                {'amount': '40.00', 'payment_date': '2024-01-15'}, format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        # Antes del commit la versión no cambia: un GET concurrente solo podría llenar la clave vieja
+        self.assertEqual(get_cache_version(scope), version)
+        self.assertEqual(self.client.get(self.summary_url).data['total_paid'], Decimal('0.00'))
 
-# Create your tests here.
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_cache_version(scope), version)
+        self.assertEqual(self.client.get(self.summary_url).data['total_paid'], Decimal('40.00'))
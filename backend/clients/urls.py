@@ -8,12 +8,22 @@ urlpatterns = [
     path('', views.ClientListCreateView.as_view(), name='client_list_create'),
     path('<int:pk>/', views.ClientDetailView.as_view(), name='client_detail'),
     
+    # Cartera de cobranzas de todos los clientes
+    path('finance/portfolio/', views.FinancePortfolioView.as_view(), name='finance_portfolio'),
+    
+    # Importación masiva de pagos (extractos bancarios)
+    path('payments/bulk/', views.BulkPaymentImportView.as_view(), name='bulk_payment_import'),
+    
+    # Cumplimiento de declaraciones de todos los clientes
+    path('declarations/compliance/', views.declaration_compliance, name='declaration_compliance'),
+    
     # Finanzas del cliente
     path('<int:client_id>/finance/', views.ClientFinanceView.as_view(), name='client_finance'),
     path('<int:client_id>/finance/summary/', views.client_finance_summary, name='client_finance_summary'),
     path('<int:client_id>/available-years/', views.client_available_years, name='client_available_years'),
     path('<int:client_id>/payments/<int:pk>/', views.MonthlyPaymentDetailView.as_view(), name='monthly_payment_detail'),
     path('<int:client_id>/payments/<int:payment_id>/transactions/', views.PaymentTransactionView.as_view(), name='payment_transaction'),
+    path('<int:client_id>/transactions/', views.ClientTransactionListView.as_view(), name='client_transactions'),
     
     # Control Operativo del cliente
     path('<int:client_id>/operational/', views.OperationalControlView.as_view(), name='operational_control'),
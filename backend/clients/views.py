@@ -1,12 +1,20 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, ExtractMonth
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+import csv
+import io
+import json
 from datetime import datetime
+from decimal import Decimal
 from .models import (
     Client, ClientFinance, MonthlyPayment, 
     PaymentTransaction, OperationalControl,
@@ -17,20 +25,47 @@ from .serializers import (
     PaymentTransactionSerializer, CreatePaymentTransactionSerializer,
     OperationalControlSerializer, MonthlyDeclarationSerializer,
     TaxDeclarationSerializer, AdditionalPDTSerializer,
-    CreateTaxDeclarationSerializer, CreateAdditionalPDTSerializer
+    CreateTaxDeclarationSerializer, CreateAdditionalPDTSerializer,
+    PortfolioFinanceSerializer, BulkPaymentLineSerializer
 )
 from users.permissions import PublicReadOnlyOrAuthenticated, IsAdminUser, IsWorkerOrAdmin
+from estudiomd_tasks.cache import CachedResponseMixin, cache_response
+from estudiomd_tasks.conditional import ConditionalGetMixin, latest
+from estudiomd_tasks.fieldsets import SparseFieldsViewMixin, get_fieldset
+from estudiomd_tasks.pagination import KeysetPageNumberPagination
+from estudiomd_tasks.search import RankedSearchFilter
+from files.processing import file_changed, schedule_processing
 
 
-class ClientListCreateView(generics.ListCreateAPIView):
+class ClientPagination(KeysetPageNumberPagination):
+    keyset_ordering = ('-created_at', '-id')
+
+
+class ClientListCreateView(SparseFieldsViewMixin, CachedResponseMixin, generics.ListCreateAPIView):
+    """
+    Lista de clientes. El parámetro ?finances=full|summary|none controla la
+    información financiera del año actual incluida para cada cliente
+    (?fields= / ?expand= sin 'finances' equivalen a none).
+    Las respuestas GET se cachean hasta que cambia algún cliente o sus finanzas.
+    """
+    cache_endpoint = 'clients'
+    cache_scopes = ('clients',)
     serializer_class = ClientSerializer
     queryset = Client.objects.all()
     permission_classes = [PublicReadOnlyOrAuthenticated]
-    filter_backends = [DjangoFilterBackend]
+    pagination_class = ClientPagination
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter]
     filterset_fields = ['city', 'state']
-    search_fields = ['name', 'email', 'company_name', 'dni', 'company_ruc']
+    search_fields = [
+        'name', 'email', 'company_name', 'dni', 'company_ruc',
+        'operational_controls__monthly_declarations__tax_declarations__extracted_text',
+        'operational_controls__additional_pdts__extracted_text',
+    ]
+    search_prefix_fields = ['company_ruc', 'dni']
+    search_trigram_fields = ['name', 'company_name']
     ordering_fields = ['created_at', 'name']
     ordering = ['-created_at']
+    finances_modes = ('full', 'summary', 'none')
 
     def get_permissions(self):
         # GET es público (por PublicReadOnlyOrAuthenticated); POST solo admin
@@ -38,8 +73,68 @@ class ClientListCreateView(generics.ListCreateAPIView):
             return [IsAdminUser()]
         return [permission() for permission in self.permission_classes]
 
+    def get_finances_mode(self):
+        mode = self.request.query_params.get('finances', 'full')
+        if mode not in self.finances_modes:
+            raise ValidationError({'finances': f'Valor inválido. Opciones: {", ".join(self.finances_modes)}'})
+        return mode
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+
+        mode = self.get_finances_mode()
+        if mode == 'none' or not self.field_requested('finances'):
+            return queryset
+
+        # Precargar solo la configuración financiera del año actual
+        finances = ClientFinance.objects.filter(year=timezone.now().year).select_related('totals')
+        if mode == 'full':
+            finances = finances.prefetch_related(
+                'monthly_payments',
+                Prefetch(
+                    'monthly_payments__transactions',
+                    queryset=PaymentTransaction.objects.select_related('created_by')
+                ),
+            )
+        return queryset.prefetch_related(
+            Prefetch('finances', queryset=finances, to_attr='current_year_finances')
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context['finances'] = self.get_finances_mode()
+        return context
 
-class ClientDetailView(generics.RetrieveUpdateDestroyAPIView):
+
+def finance_validator(client_id, year):
+    """Última modificación y huella de la ClientFinance de un año, sin serializarla"""
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return None
+    finance = ClientFinance.objects.filter(client_id=client_id, year=year).values_list(
+        'id', 'updated_at', 'client__updated_at'
+    ).first()
+    if finance is None:
+        return None
+
+    finance_id, finance_updated_at, client_updated_at = finance
+    payments = MonthlyPayment.objects.filter(client_finance_id=finance_id).aggregate(
+        last_payment=Max('updated_at'),
+        last_transaction=Max('transactions__created_at'),
+        payments=Count('id', distinct=True),
+        transactions=Count('transactions'),
+    )
+    last_modified = latest(
+        finance_updated_at, client_updated_at, payments['last_payment'], payments['last_transaction']
+    )
+    return last_modified, f"{finance_id}|{payments['payments']}|{payments['transactions']}|{last_modified}"
+
+
+class ClientDetailView(SparseFieldsViewMixin, ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ClientSerializer
     queryset = Client.objects.all()
     permission_classes = [PublicReadOnlyOrAuthenticated]
@@ -50,37 +145,52 @@ class ClientDetailView(generics.RetrieveUpdateDestroyAPIView):
             return [IsAdminUser()]
         return [permission() for permission in self.permission_classes]
 
+    def get_validator(self, request, pk):
+        client_updated_at = Client.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if client_updated_at is None:
+            return None
+        # La respuesta incluye las finanzas del año actual
+        finance = finance_validator(pk, timezone.now().year)
+        if finance is None:
+            return client_updated_at, f'{client_updated_at}'
+        return latest(client_updated_at, finance[0]), f'{client_updated_at}|{finance[1]}'
+
 
-class ClientFinanceView(APIView):
+class ClientFinanceView(ConditionalGetMixin, APIView):
     permission_classes = [IsWorkerOrAdmin]
     
+    def get_validator(self, request, client_id):
+        return finance_validator(client_id, request.query_params.get('year', timezone.now().year))
+    
     def get(self, request, client_id):
         """Obtener información financiera del cliente para el año actual"""
         client = get_object_or_404(Client, id=client_id)
         current_year = timezone.now().year
         year = request.query_params.get('year', current_year)
+        fieldset = get_fieldset(request, ClientFinanceSerializer)
         
         try:
-            client_finance = ClientFinance.objects.get(client=client, year=year)
+            client_finance = self.get_queryset(fieldset).get(client=client, year=year)
         except ClientFinance.DoesNotExist:
-            # Si no existe, crear configuración financiera por defecto
-            client_finance = ClientFinance.objects.create(
-                client=client,
-                year=year,
-                annual_fee=0,
-                monthly_fee=0
-            )
-            # Crear los 13 pagos mensuales (12 meses + DJ Anual)
-            for month in range(1, 14):
-                MonthlyPayment.objects.create(
-                    client_finance=client_finance,
-                    month=month,
-                    amount_due=0
-                )
+            # Si no existe, crear configuración financiera por defecto con sus 13 pagos
+            ClientFinance.provision(client, year)
+            client_finance = self.get_queryset(fieldset).get(client=client, year=year)
         
-        serializer = ClientFinanceSerializer(client_finance)
+        serializer = ClientFinanceSerializer(client_finance, context={'request': request, 'fieldset': fieldset})
         return Response(serializer.data)
     
+    def get_queryset(self, fieldset=None):
+        """Precarga totales y, si se piden, el cliente, los pagos y sus transacciones con su autor"""
+        queryset = ClientFinance.objects.select_related('totals')
+        if fieldset is None or fieldset.includes('client_name'):
+            queryset = queryset.select_related('client')
+        if fieldset is None or fieldset.includes('monthly_payments'):
+            queryset = queryset.prefetch_related(
+                'monthly_payments',
+                Prefetch('monthly_payments__transactions', queryset=PaymentTransaction.objects.select_related('created_by')),
+            )
+        return queryset
+    
     def post(self, request, client_id):
         """Crear o actualizar configuración financiera del cliente"""
         client = get_object_or_404(Client, id=client_id)
@@ -100,102 +210,500 @@ class ClientFinanceView(APIView):
                 client_finance.annual_fee = request.data.get('annual_fee', client_finance.annual_fee)
                 client_finance.monthly_fee = request.data.get('monthly_fee', client_finance.monthly_fee)
                 client_finance.save()
-            
-            # Actualizar o crear pagos mensuales
-            monthly_fee = client_finance.monthly_fee
-            annual_fee = client_finance.annual_fee
-            
-            for month in range(1, 14):
-                monthly_payment, _ = MonthlyPayment.objects.get_or_create(
-                    client_finance=client_finance,
-                    month=month,
-                    defaults={
-                        'amount_due': annual_fee if month == 13 else monthly_fee
-                    }
-                )
-                # Solo actualizar si no hay pagos realizados
-                if monthly_payment.amount_paid == 0:
-                    monthly_payment.amount_due = annual_fee if month == 13 else monthly_fee
-                    monthly_payment.save()
-            
-            # Recalcular todos los pagos para considerar saldos pendientes
+
+            # Releer las cuotas como Decimal (request.data puede traerlas como texto)
+            client_finance.refresh_from_db(fields=['annual_fee', 'monthly_fee'])
+
+            # Crear los pagos mensuales que falten (12 meses + DJ Anual)
+            client_finance.provision_monthly_payments()
+
+            # Recalcular montos y saldos pendientes de todo el año en una sola pasada
             client_finance.recalculate_all_monthly_payments()
         
         serializer = ClientFinanceSerializer(client_finance)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class MonthlyPaymentDetailView(generics.RetrieveUpdateAPIView):
+class ClientTransactionListView(SparseFieldsViewMixin, generics.ListAPIView):
+    """
+    Historial de transacciones de un cliente (opcionalmente de un año), del
+    pago más reciente al más antiguo. Admite ?cursor= para paginación keyset.
+    """
+    serializer_class = PaymentTransactionSerializer
+    permission_classes = [IsWorkerOrAdmin]
+    pagination_class = KeysetPageNumberPagination
+    keyset_ordering = ('-payment_date', '-id')
+
+    def get_queryset(self):
+        queryset = PaymentTransaction.objects.filter(
+            monthly_payment__client_finance__client_id=self.kwargs['client_id']
+        ).order_by('-payment_date', '-id')
+        if self.field_requested('created_by_name'):
+            queryset = queryset.select_related('created_by')
+        year = self.request.query_params.get('year')
+        if year:
+            if not year.isdigit():
+                raise ValidationError({'year': 'Año inválido'})
+            queryset = queryset.filter(monthly_payment__client_finance__year=year)
+        return queryset
+
+
+class MonthlyPaymentDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateAPIView):
     serializer_class = MonthlyPaymentSerializer
     permission_classes = [IsWorkerOrAdmin]
     
     def get_queryset(self):
-        return MonthlyPayment.objects.filter(
+        queryset = MonthlyPayment.objects.filter(
             client_finance__client_id=self.kwargs['client_id']
         )
+        if self.field_requested('transactions'):
+            queryset = queryset.prefetch_related(
+                Prefetch('transactions', queryset=PaymentTransaction.objects.select_related('created_by'))
+            )
+        return queryset
 
 
 class PaymentTransactionView(APIView):
     permission_classes = [IsWorkerOrAdmin]
     
     def post(self, request, client_id, payment_id):
-        """Registrar un pago parcial o completo"""
+        """
+        Registrar un pago parcial o completo.
+
+        El registro se hace con la ClientFinance del año bloqueada
+        (select_for_update), así dos pagos simultáneos del mismo cliente no
+        pierden actualizaciones ni superan el monto anual. Si se envía el
+        header Idempotency-Key, los reintentos devuelven la transacción ya
+        registrada en lugar de crear otra.
+        """
         monthly_payment = get_object_or_404(
             MonthlyPayment, 
             id=payment_id,
             client_finance__client_id=client_id
         )
         
-        serializer = CreatePaymentTransactionSerializer(
-            data=request.data,
-            context={'request': request, 'monthly_payment': monthly_payment}
-        )
+        idempotency_key = CreatePaymentTransactionSerializer.get_idempotency_key(request)
         
-        if serializer.is_valid():
-            with transaction.atomic():
-                # Crear la transacción
-                transaction_obj = serializer.save(monthly_payment=monthly_payment)
-                
-                # Actualizar el pago mensual
-                monthly_payment.amount_paid += transaction_obj.amount
-                monthly_payment.payment_date = transaction_obj.payment_date
-                monthly_payment.save()
-                
-                # Recalcular todos los pagos mensuales para actualizar saldos pendientes
-                monthly_payment.client_finance.recalculate_all_monthly_payments()
+        with transaction.atomic():
+            client_finance = ClientFinance.objects.select_for_update().get(id=monthly_payment.client_finance_id)
             
-            return Response(PaymentTransactionSerializer(transaction_obj).data, status=status.HTTP_201_CREATED)
+            if idempotency_key:
+                existing = PaymentTransaction.objects.filter(idempotency_key=idempotency_key).first()
+                if existing is not None:
+                    return self.idempotent_response(existing, monthly_payment)
+            
+            serializer = CreatePaymentTransactionSerializer(
+                data=request.data,
+                context={'request': request, 'monthly_payment': monthly_payment, 'client_finance': client_finance}
+            )
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                with transaction.atomic():
+                    # Crear la transacción (asiento del libro de pagos)
+                    transaction_obj = serializer.save(
+                        monthly_payment=monthly_payment,
+                        idempotency_key=idempotency_key or None
+                    )
+            except IntegrityError:
+                # Otro request registró la misma clave entre la consulta y el insert
+                existing = PaymentTransaction.objects.filter(idempotency_key=idempotency_key).first()
+                if existing is None:
+                    raise
+                return self.idempotent_response(existing, monthly_payment)
+            
+            # Actualizar el pago mensual en la base de datos, sin leer-modificar-escribir en Python
+            MonthlyPayment.objects.filter(id=monthly_payment.id).update(
+                amount_paid=F('amount_paid') + transaction_obj.amount,
+                payment_date=transaction_obj.payment_date,
+                updated_at=timezone.now()
+            )
+            
+            # Recalcular todos los pagos mensuales para actualizar saldos pendientes
+            client_finance.recalculate_all_monthly_payments()
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(PaymentTransactionSerializer(transaction_obj).data, status=status.HTTP_201_CREATED)
+    
+    def idempotent_response(self, existing, monthly_payment):
+        if existing.monthly_payment_id != monthly_payment.id:
+            return Response(
+                {'error': 'La clave de idempotencia ya fue usada para otro pago'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(PaymentTransactionSerializer(existing).data, status=status.HTTP_200_OK)
 
 
-class OperationalControlView(APIView):
+class BulkPaymentImportView(APIView):
+    """
+    Importar un lote de pagos de varios clientes y meses (extractos bancarios).
+
+    Acepta un archivo CSV en el campo 'file' (columnas: client, year, month,
+    amount, payment_date, payment_method, reference, notes, idempotency_key)
+    o una lista JSON con los mismos campos. Todas las líneas se validan contra
+    el estado precargado de ClientFinance/MonthlyPayment, las transacciones
+    válidas se insertan con bulk_create y cada ClientFinance afectada se
+    recalcula una sola vez. Devuelve el resultado de cada línea. El CSV puede
+    venir en UTF-8 o Latin-1; una clave de idempotencia registrada por otro
+    request durante la importación se informa como duplicada.
+    """
+    permission_classes = [IsWorkerOrAdmin]
+    max_lines = 5000
+    # Codificaciones aceptadas para el CSV: UTF-8 y la de los extractos de Windows (Latin-1)
+    encodings = ('utf-8-sig', 'cp1252')
+
+    def decode_file(self, file):
+        content = file.read()
+        for encoding in self.encodings:
+            try:
+                return content.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        raise ValidationError({'file': ['El archivo debe estar codificado en UTF-8 o Latin-1 (Windows-1252)']})
+
+    def parse_lines(self, request):
+        if 'file' in request.FILES:
+            content = self.decode_file(request.FILES['file'])
+            try:
+                return [
+                    {key.strip(): (value or '').strip() for key, value in row.items() if key}
+                    for row in csv.DictReader(io.StringIO(content))
+                ]
+            except csv.Error as exc:
+                raise ValidationError({'file': [f'CSV inválido: {exc}']})
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get('transactions')
+        if not isinstance(data, list):
+            raise ValidationError({'error': 'Envíe un archivo CSV en "file" o una lista JSON de transacciones'})
+        return data
+
+    def find_existing_keys(self, keys):
+        """{clave de idempotencia: id de la transacción} de las claves ya registradas"""
+        return dict(PaymentTransaction.objects.filter(idempotency_key__in=keys).values_list('idempotency_key', 'id'))
+
+    def post(self, request):
+        lines = self.parse_lines(request)
+        if len(lines) > self.max_lines:
+            raise ValidationError({'error': f'El lote no puede superar {self.max_lines} líneas'})
+
+        results = []
+        valid_lines = []
+        for number, line in enumerate(lines, start=1):
+            serializer = BulkPaymentLineSerializer(data=line)
+            if serializer.is_valid():
+                valid_lines.append((number, serializer.validated_data))
+                results.append({'line': number, 'status': 'pending'})
+            else:
+                results.append({'line': number, 'status': 'error', 'errors': serializer.errors})
+
+        keys = {data['idempotency_key'] for _, data in valid_lines if data['idempotency_key']}
+        with transaction.atomic():
+            while True:
+                existing_keys = self.find_existing_keys(keys)
+                for number, _ in valid_lines:
+                    results[number - 1] = {'line': number, 'status': 'pending'}
+                try:
+                    with transaction.atomic():
+                        self.import_lines(request, valid_lines, results, existing_keys)
+                    break
+                except IntegrityError:
+                    # Otro request registró alguna clave del lote después de la consulta:
+                    # se reintenta y esas líneas quedan como duplicadas
+                    if not set(self.find_existing_keys(keys)) - set(existing_keys):
+                        raise
+
+        summary = {
+            'created': sum(1 for r in results if r['status'] == 'created'),
+            'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+            'errors': sum(1 for r in results if r['status'] == 'error'),
+            'results': results,
+        }
+        return Response(summary)
+
+    def import_lines(self, request, valid_lines, results, existing_keys):
+        """
+        Inserta las transacciones válidas y recalcula las ClientFinance afectadas.
+        Las líneas con claves de existing_keys quedan como duplicadas.
+        """
+        # Precargar y bloquear (en orden de id) las configuraciones financieras del lote
+        client_ids = {data['client'] for _, data in valid_lines}
+        years = {data['year'] for _, data in valid_lines}
+        finances = {
+            (finance.client_id, finance.year): finance
+            for finance in ClientFinance.objects.select_for_update().filter(
+                client_id__in=client_ids, year__in=years
+            ).order_by('id')
+        }
+        payments = {
+            (payment.client_finance_id, payment.month): payment
+            for payment in MonthlyPayment.objects.filter(client_finance__in=finances.values())
+        }
+
+        # Total ya pagado por año para validar el monto anual en memoria
+        total_paid = {}
+        for payment in payments.values():
+            total_paid[payment.client_finance_id] = total_paid.get(payment.client_finance_id, Decimal('0.00')) + payment.amount_paid
+
+        new_transactions = []
+        line_transactions = []
+        batch_keys = {}
+        batch_duplicates = []
+        touched_payments = {}
+        affected_finances = {}
+        for number, data in valid_lines:
+            result = results[number - 1]
+            key = data['idempotency_key'] or None
+            if key and key in existing_keys:
+                result.update({'status': 'duplicate', 'transaction_id': existing_keys[key]})
+                continue
+            if key and key in batch_keys:
+                # Repetida dentro del mismo lote: apunta a la transacción de la primera línea
+                result['status'] = 'duplicate'
+                batch_duplicates.append((result, batch_keys[key]))
+                continue
+
+            finance = finances.get((data['client'], data['year']))
+            if finance is None:
+                result.update({'status': 'error', 'errors': {'client': ['No existe configuración financiera para este cliente y año']}})
+                continue
+            payment = payments.get((finance.id, data['month']))
+            if payment is None:
+                result.update({'status': 'error', 'errors': {'month': ['No existe el pago mensual para este mes']}})
+                continue
+
+            total_annual_amount = finance.get_total_annual_amount()
+            already_paid = total_paid.get(finance.id, Decimal('0.00'))
+            if already_paid + data['amount'] > total_annual_amount:
+                result.update({'status': 'error', 'errors': {'amount': [
+                    f"No se puede pagar más del monto anual total. "
+                    f"Monto anual: S/ {total_annual_amount}, "
+                    f"Ya pagado: S/ {already_paid}, "
+                    f"Máximo permitido: S/ {total_annual_amount - already_paid}"
+                ]}})
+                continue
+
+            total_paid[finance.id] = already_paid + data['amount']
+            payment.amount_paid += data['amount']
+            payment.payment_date = data['payment_date']
+            touched_payments[payment.id] = payment
+            affected_finances[finance.id] = finance
+
+            transaction_obj = PaymentTransaction(
+                monthly_payment=payment,
+                amount=data['amount'],
+                payment_date=data['payment_date'],
+                payment_method=data['payment_method'],
+                reference=data['reference'],
+                notes=data['notes'],
+                idempotency_key=key,
+                created_by=request.user,
+            )
+            if key:
+                batch_keys[key] = transaction_obj
+            new_transactions.append(transaction_obj)
+            line_transactions.append(result)
+
+        PaymentTransaction.objects.bulk_create(new_transactions, batch_size=500)
+        for result, transaction_obj in zip(line_transactions, new_transactions):
+            result.update({'status': 'created', 'transaction_id': transaction_obj.id})
+        for result, transaction_obj in batch_duplicates:
+            result['transaction_id'] = transaction_obj.id
+
+        if touched_payments:
+            now = timezone.now()
+            for payment in touched_payments.values():
+                payment.updated_at = now
+            MonthlyPayment.objects.bulk_update(
+                list(touched_payments.values()), ['amount_paid', 'payment_date', 'updated_at'], batch_size=500
+            )
+
+        # Recalcular cada ClientFinance afectada una sola vez
+        for finance in affected_finances.values():
+            finance.recalculate_all_monthly_payments()
+
+
+class FinancePortfolioView(SparseFieldsViewMixin, generics.ListAPIView):
+    """
+    Cartera de cobranzas de todos los clientes para un año.
+
+    Los totales por cliente y de todo el estudio se calculan con aggregates
+    sobre MonthlyPayment, sin serializar pagos ni transacciones.
+    Filtros: year, city, state, overdue (true/false).
+    """
+    serializer_class = PortfolioFinanceSerializer
+    permission_classes = [IsWorkerOrAdmin]
+    filter_backends = []
+
+    def get_year(self):
+        year = self.request.query_params.get('year', timezone.now().year)
+        try:
+            return int(year)
+        except (TypeError, ValueError):
+            raise ValidationError({'year': 'El año debe ser un número entero'})
+
+    def get_overdue_filter(self, year, prefix=''):
+        """Meses vencidos: anteriores al mes actual, o todo el año si ya pasó"""
+        now = timezone.now()
+        if year < now.year:
+            cutoff = 14
+        elif year == now.year:
+            cutoff = now.month
+        else:
+            cutoff = 1
+        return Q(**{f'{prefix}month__lt': cutoff, f'{prefix}is_paid': False})
+
+    def get_queryset(self):
+        year = self.get_year()
+        overdue = self.get_overdue_filter(year, prefix='monthly_payments__')
+        zero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+        queryset = ClientFinance.objects.filter(year=year).select_related('client').annotate(
+            total_due=Coalesce(Sum('monthly_payments__amount_due'), zero),
+            total_paid=Coalesce(Sum('monthly_payments__amount_paid'), zero),
+            total_balance=Coalesce(Sum('monthly_payments__balance'), zero),
+            overdue_balance=Coalesce(Sum(Case(
+                When(overdue, then='monthly_payments__balance'),
+                default=zero,
+            )), zero),
+            payments_completed=Count('monthly_payments', filter=Q(monthly_payments__is_paid=True)),
+            payments_pending=Count('monthly_payments', filter=Q(monthly_payments__is_paid=False)),
+            payments_overdue=Count('monthly_payments', filter=overdue),
+        )
+
+        city = self.request.query_params.get('city')
+        state = self.request.query_params.get('state')
+        if city:
+            queryset = queryset.filter(client__city=city)
+        if state:
+            queryset = queryset.filter(client__state=state)
+
+        overdue_param = self.request.query_params.get('overdue')
+        if overdue_param is not None:
+            if overdue_param.lower() in ('true', '1'):
+                queryset = queryset.filter(payments_overdue__gt=0)
+            elif overdue_param.lower() in ('false', '0'):
+                queryset = queryset.filter(payments_overdue=0)
+
+        return queryset.order_by('client__name', 'id')
+
+    def get_portfolio_totals(self, queryset):
+        """Totales de todo el estudio y desglose por mes para los clientes filtrados"""
+        year = self.get_year()
+        overdue = self.get_overdue_filter(year)
+        payments = MonthlyPayment.objects.filter(client_finance__in=queryset.values('id'))
+        aggregates = {
+            'total_due': Sum('amount_due'),
+            'total_paid': Sum('amount_paid'),
+            'total_balance': Sum('balance'),
+            'overdue_balance': Sum('balance', filter=overdue),
+            'payments_completed': Count('id', filter=Q(is_paid=True)),
+            'payments_pending': Count('id', filter=Q(is_paid=False)),
+            'payments_overdue': Count('id', filter=overdue),
+        }
+
+        totals = payments.aggregate(**aggregates)
+        by_month = payments.values('month').annotate(**aggregates).order_by('month')
+        for key, value in totals.items():
+            if value is None:
+                totals[key] = Decimal('0.00')
+        totals['clients'] = queryset.count()
+        totals['by_month'] = [
+            {key: (Decimal('0.00') if value is None else value) for key, value in row.items()}
+            for row in by_month
+        ]
+        return year, totals
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        year, totals = self.get_portfolio_totals(queryset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        else:
+            response = Response({'results': self.get_serializer(queryset, many=True).data})
+
+        response.data['year'] = year
+        response.data['totals'] = totals
+        return response
+
+
+class OperationalControlView(ConditionalGetMixin, APIView):
     permission_classes = [IsWorkerOrAdmin]
     
+    def get_validator(self, request, client_id):
+        """Última modificación y huella del control operativo, sin serializarlo"""
+        try:
+            year = int(request.query_params.get('year', timezone.now().year))
+        except (TypeError, ValueError):
+            return None
+        control = OperationalControl.objects.filter(client_id=client_id, year=year).values_list(
+            'id', 'updated_at', 'client__updated_at'
+        ).first()
+        if control is None:
+            return None
+
+        control_id, control_updated_at, client_updated_at = control
+        declarations = MonthlyDeclaration.objects.filter(operational_control_id=control_id).aggregate(
+            last_declaration=Max('updated_at'),
+            last_tax=Max('tax_declarations__updated_at'),
+            declarations=Count('id', distinct=True),
+            taxes=Count('tax_declarations'),
+        )
+        additional = AdditionalPDT.objects.filter(operational_control_id=control_id).aggregate(
+            last_additional=Max('updated_at'),
+            additional=Count('id'),
+        )
+        last_modified = latest(
+            control_updated_at, client_updated_at, declarations['last_declaration'],
+            declarations['last_tax'], additional['last_additional']
+        )
+        return last_modified, (
+            f"{control_id}|{declarations['declarations']}|{declarations['taxes']}|"
+            f"{additional['additional']}|{last_modified}"
+        )
+    
     def get(self, request, client_id):
         """Obtener control operativo del cliente para el año actual"""
         client = get_object_or_404(Client, id=client_id)
         current_year = timezone.now().year
         year = request.query_params.get('year', current_year)
+        fieldset = get_fieldset(request, OperationalControlSerializer)
         
         try:
-            operational_control = OperationalControl.objects.get(client=client, year=year)
+            operational_control = self.get_queryset(fieldset).get(client=client, year=year)
         except OperationalControl.DoesNotExist:
-            # Si no existe, crear control operativo por defecto
-            operational_control = OperationalControl.objects.create(
-                client=client,
-                year=year
-            )
-            # Crear las 13 declaraciones mensuales (12 meses + DJ Anual)
-            for month in range(1, 14):
-                MonthlyDeclaration.objects.create(
-                    operational_control=operational_control,
-                    month=month
-                )
+            # Si no existe, crear control operativo por defecto con sus 13 declaraciones
+            OperationalControl.provision(client, year)
+            operational_control = self.get_queryset(fieldset).get(client=client, year=year)
         
-        serializer = OperationalControlSerializer(operational_control, context={'request': request})
+        serializer = OperationalControlSerializer(
+            operational_control, context={'request': request, 'fieldset': fieldset}
+        )
         return Response(serializer.data)
     
+    def get_queryset(self, fieldset=None):
+        """
+        Precarga declaraciones, PDTs y sus autores: el GET usa un número fijo
+        de consultas. Con ?fields= / ?expand= solo precarga lo que se serializa.
+        """
+        queryset = OperationalControl.objects.all()
+        if fieldset is None or fieldset.includes('client_name'):
+            queryset = queryset.select_related('client')
+        if fieldset is None or fieldset.includes('monthly_declarations'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'monthly_declarations',
+                queryset=MonthlyDeclaration.objects.prefetch_related(
+                    Prefetch('tax_declarations', queryset=TaxDeclaration.objects.select_related('created_by'))
+                )
+            ))
+        if fieldset is None or fieldset.includes('additional_pdts'):
+            queryset = queryset.prefetch_related(
+                Prefetch('additional_pdts', queryset=AdditionalPDT.objects.select_related('created_by'))
+            )
+        return queryset
+    
     def post(self, request, client_id):
         """Actualizar fecha de presentación de una declaración mensual"""
         client = get_object_or_404(Client, id=client_id)
@@ -242,6 +750,8 @@ class TaxDeclarationView(APIView):
         
         if serializer.is_valid():
             tax_declaration = serializer.save(monthly_declaration=monthly_declaration)
+            # Tipo real, páginas, texto y miniatura se obtienen en segundo plano (Celery)
+            schedule_processing(tax_declaration)
             return Response(TaxDeclarationSerializer(tax_declaration, context={'request': request}).data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -264,6 +774,8 @@ class TaxDeclarationView(APIView):
         
         if serializer.is_valid():
             serializer.save()
+            if file_changed(request):
+                schedule_processing(tax_declaration)
             return Response(serializer.data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -289,8 +801,13 @@ class AdditionalPDTView(APIView):
         year = request.query_params.get('year', timezone.now().year)
         try:
             operational_control = OperationalControl.objects.get(client_id=client_id, year=year)
+            fieldset = get_fieldset(request, AdditionalPDTSerializer)
             additional_pdts = operational_control.additional_pdts.all()
-            serializer = AdditionalPDTSerializer(additional_pdts, many=True, context={'request': request})
+            if fieldset.includes('created_by_name'):
+                additional_pdts = additional_pdts.select_related('created_by')
+            serializer = AdditionalPDTSerializer(
+                additional_pdts, many=True, context={'request': request, 'fieldset': fieldset}
+            )
             return Response(serializer.data)
         except OperationalControl.DoesNotExist:
             return Response([])
@@ -312,22 +829,29 @@ class AdditionalPDTView(APIView):
         
         if serializer.is_valid():
             additional_pdt = serializer.save(operational_control=operational_control)
+            schedule_processing(additional_pdt)
             return Response(AdditionalPDTSerializer(additional_pdt, context={'request': request}).data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AdditionalPDTDetailView(generics.RetrieveUpdateDestroyAPIView):
+class AdditionalPDTDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AdditionalPDTSerializer
     permission_classes = [IsWorkerOrAdmin]
     
     def get_queryset(self):
         client_id = self.kwargs['client_id']
         return AdditionalPDT.objects.filter(operational_control__client_id=client_id)
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        if file_changed(self.request):
+            schedule_processing(serializer.instance)
 
 
 @api_view(['GET'])
 @permission_classes([IsWorkerOrAdmin])
+@cache_response('client_finance_summary', lambda request, client_id: [f'client:{client_id}'])
 def client_finance_summary(request, client_id):
     """Resumen financiero del cliente"""
     client = get_object_or_404(Client, id=client_id)
@@ -335,19 +859,19 @@ def client_finance_summary(request, client_id):
     year = request.query_params.get('year', current_year)
     
     try:
-        client_finance = ClientFinance.objects.get(client=client, year=year)
-        monthly_payments = client_finance.monthly_payments.all()
+        client_finance = ClientFinance.objects.select_related('totals').get(client=client, year=year)
+        totals = client_finance.get_totals()
         
         summary = {
             'client_name': client.name,
             'year': year,
             'total_annual_fee': client_finance.annual_fee,
             'monthly_fee': client_finance.monthly_fee,
-            'total_due': sum(p.amount_due for p in monthly_payments),
-            'total_paid': sum(p.amount_paid for p in monthly_payments),
-            'total_balance': sum(p.balance for p in monthly_payments),
-            'payments_completed': monthly_payments.filter(is_paid=True).count(),
-            'payments_pending': monthly_payments.filter(is_paid=False).count(),
+            'total_due': totals.total_due,
+            'total_paid': totals.total_paid,
+            'total_balance': totals.total_balance,
+            'payments_completed': totals.payments_completed,
+            'payments_pending': totals.payments_pending,
         }
         
         return Response(summary)
@@ -358,6 +882,7 @@ def client_finance_summary(request, client_id):
 
 @api_view(['GET'])
 @permission_classes([IsWorkerOrAdmin])
+@cache_response('client_available_years', lambda request, client_id: [f'client:{client_id}'])
 def client_available_years(request, client_id):
     """Obtener años disponibles para un cliente"""
     client = get_object_or_404(Client, id=client_id)
@@ -377,3 +902,108 @@ def client_available_years(request, client_id):
         'current_year': timezone.now().year
     })
 
+
+def _parse_list_param(request, name, choices):
+    """Lee un parámetro separado por comas y valida sus valores"""
+    raw = request.query_params.get(name)
+    if not raw:
+        return []
+    values = [value.strip() for value in raw.split(',') if value.strip()]
+    invalid = [value for value in values if value not in choices]
+    if invalid:
+        raise ValidationError({name: f'Valores inválidos: {", ".join(invalid)}. Opciones: {", ".join(choices)}'})
+    return values
+
+
+@api_view(['GET'])
+@permission_classes([IsWorkerOrAdmin])
+def declaration_compliance(request):
+    """
+    Matriz de cumplimiento de declaraciones de todos los clientes para un año.
+
+    Cada fila es [client, month, pdt_type, status, count, additional] y se
+    calcula con aggregates agrupados sobre TaxDeclaration y AdditionalPDT
+    (el mes de un PDT adicional es el de su fecha de presentación). La
+    respuesta se envía en streaming como JSON compacto: primero 'columns' y
+    'rows', al final el diccionario 'clients' {id: nombre}.
+
+    Filtros: year, status y pdt_type (separados por comas), city, state.
+    status=missing (requiere pdt_type) agrega las combinaciones cliente/mes
+    vencidas sin ninguna declaración de ese tipo.
+    """
+    try:
+        year = int(request.query_params.get('year', timezone.now().year))
+    except (TypeError, ValueError):
+        raise ValidationError({'year': 'El año debe ser un número entero'})
+
+    status_choices = [choice for choice, _ in TaxDeclaration.STATUS_CHOICES] + ['missing']
+    pdt_choices = [choice for choice, _ in AdditionalPDT.PDT_CHOICES]
+    statuses = _parse_list_param(request, 'status', status_choices)
+    pdt_types = _parse_list_param(request, 'pdt_type', pdt_choices)
+    include_missing = 'missing' in statuses
+    statuses = [value for value in statuses if value != 'missing']
+    if include_missing and not pdt_types:
+        raise ValidationError({'pdt_type': 'Indique el tipo de PDT para consultar las declaraciones faltantes'})
+
+    clients = Client.objects.all()
+    if request.query_params.get('city'):
+        clients = clients.filter(city=request.query_params['city'])
+    if request.query_params.get('state'):
+        clients = clients.filter(state=request.query_params['state'])
+
+    tax_rows = TaxDeclaration.objects.filter(
+        monthly_declaration__operational_control__year=year,
+        monthly_declaration__operational_control__client__in=clients,
+    )
+    additional_rows = AdditionalPDT.objects.filter(
+        operational_control__year=year,
+        operational_control__client__in=clients,
+    )
+    if pdt_types:
+        tax_rows = tax_rows.filter(pdt_type__in=pdt_types)
+        additional_rows = additional_rows.filter(pdt_type__in=pdt_types)
+
+    tax_rows = tax_rows.values_list(
+        'monthly_declaration__operational_control__client_id', 'monthly_declaration__month', 'pdt_type', 'status'
+    ).annotate(count=Count('id')).order_by(
+        'monthly_declaration__operational_control__client_id', 'monthly_declaration__month', 'pdt_type', 'status'
+    )
+    additional_rows = additional_rows.annotate(month=ExtractMonth('presentation_date')).values_list(
+        'operational_control__client_id', 'month', 'pdt_type', 'status'
+    ).annotate(count=Count('id')).order_by('operational_control__client_id', 'month', 'pdt_type', 'status')
+
+    def generate():
+        client_ids = set()
+        yield '{"year":%d,"columns":["client","month","pdt_type","status","count","additional"],"rows":[' % year
+        separator = ''
+        filed = set()
+
+        if statuses or not include_missing:
+            for additional, rows in ((0, tax_rows), (1, additional_rows)):
+                for client_id, month, pdt_type, row_status, count in rows.iterator():
+                    filed.add((client_id, month, pdt_type))
+                    if statuses and row_status not in statuses:
+                        continue
+                    client_ids.add(client_id)
+                    yield separator + json.dumps([client_id, month, pdt_type, row_status, count, additional], separators=(',', ':'))
+                    separator = ','
+
+        if include_missing:
+            if not filed:
+                # Solo se pidieron faltantes: basta con saber qué combinaciones tienen declaración
+                for rows in (tax_rows, additional_rows):
+                    filed.update((client_id, month, pdt_type) for client_id, month, pdt_type, _, _ in rows.iterator())
+            now = timezone.now()
+            last_month = 13 if year < now.year else (now.month - 1 if year == now.year else 0)
+            for client_id in clients.order_by('id').values_list('id', flat=True).iterator():
+                for month in range(1, last_month + 1):
+                    for pdt_type in pdt_types:
+                        if (client_id, month, pdt_type) not in filed:
+                            client_ids.add(client_id)
+                            yield separator + json.dumps([client_id, month, pdt_type, 'missing', 0, 0], separators=(',', ':'))
+                            separator = ','
+
+        names = dict(Client.objects.filter(id__in=client_ids).values_list('id', 'name'))
+        yield '],"clients":' + json.dumps({str(key): value for key, value in names.items()}, separators=(',', ':')) + '}'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
@@ -121,10 +121,10 @@ def create_test_data():
             # Crear log de auditoría para la tarea
             AuditLogEntry.objects.create(
                 task=task,
-                action='Tarea creada',
+                action=AuditLogEntry.Action.TASK_CREATED,
                 user=admin_user,
                 timestamp=datetime.now(),
-                details=f'Tarea asignada a {", ".join([u.get_full_name() for u in assigned_users])}'
+                payload={'title': task.title}
             )
         else:
             print(f"✅ Tarea ya existe: {task.title}")
@@ -0,0 +1,155 @@
+"""
+Caché de respuestas GET con invalidación por versión.
+
+Cada respuesta se guarda bajo una clave que incluye el nombre del endpoint,
+el rol (y el usuario cuando el contenido depende de él), los parámetros de
+consulta y la versión de los ámbitos de los que depende ('clients',
+'client:<id>', 'tasks'...). Las señales de los modelos incrementan esas
+versiones al confirmarse la transacción, de modo que las entradas antiguas
+dejan de leerse y expiran solas.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from users.permissions import IsAdminUser
+
+VERSION_KEY = 'cache_version:{}'
+COUNTER_KEY = 'cache_stats:{}:{}'
+ENDPOINTS_KEY = 'cache_stats:endpoints'
+
+
+def get_cache_version(scope):
+    version = cache.get(VERSION_KEY.format(scope))
+    if version is None:
+        version = 1
+        cache.add(VERSION_KEY.format(scope), version, None)
+    return version
+
+
+def bump_cache_version(*scopes):
+    """Invalida todas las respuestas cacheadas que dependen de estos ámbitos"""
+    for scope in scopes:
+        try:
+            cache.incr(VERSION_KEY.format(scope))
+        except ValueError:
+            cache.set(VERSION_KEY.format(scope), 2, None)
+
+
+def bump_cache_version_on_commit(*scopes):
+    """
+    bump_cache_version al confirmarse la transacción en curso (o en el acto
+    fuera de una). Las señales se disparan dentro de la transacción de quien
+    escribe: si la versión cambiara antes del commit, un GET concurrente
+    leería las filas viejas y las cachearía bajo la versión nueva.
+    """
+    transaction.on_commit(lambda: bump_cache_version(*scopes))
+
+
+def _count(endpoint, kind):
+    key = COUNTER_KEY.format(endpoint, kind)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def _build_key(request, endpoint, scopes, per_user):
+    user = request.user
+    if user and user.is_authenticated:
+        role = user.role
+        identity = f'{role}:{user.id}' if per_user and role != 'admin' else role
+    else:
+        identity = 'anonymous'
+    versions = ','.join(f'{scope}={get_cache_version(scope)}' for scope in scopes)
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    return f'response:{endpoint}:{identity}:{versions}:{digest}'
+
+
+def cached_get(request, endpoint, scopes, per_user, compute):
+    """Devuelve la respuesta cacheada o la calcula con compute() y la guarda si es 200"""
+    key = _build_key(request, endpoint, scopes, per_user)
+    data = cache.get(key)
+    if data is not None:
+        _count(endpoint, 'hits')
+        return Response(data)
+
+    _count(endpoint, 'misses')
+    endpoints = cache.get(ENDPOINTS_KEY) or set()
+    if endpoint not in endpoints:
+        cache.set(ENDPOINTS_KEY, endpoints | {endpoint}, None)
+
+    response = compute()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(key, response.data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return response
+
+
+def cache_response(endpoint, scopes, per_user=False):
+    """
+    Decorador para vistas de función (debajo de @api_view).
+    scopes es una función (request, **kwargs) -> lista de ámbitos.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            return cached_get(
+                request, endpoint, scopes(request, **kwargs), per_user,
+                lambda: view_func(request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    """
+    Cachea las respuestas GET de una vista basada en clases.
+    Definir cache_endpoint, cache_scopes y, si el contenido depende del
+    usuario, cache_per_user = True.
+    """
+    cache_endpoint = None
+    cache_scopes = ()
+    cache_per_user = False
+
+    def get_cache_scopes(self):
+        return list(self.cache_scopes)
+
+    def get(self, request, *args, **kwargs):
+        return cached_get(
+            request, self.cache_endpoint or self.__class__.__name__,
+            self.get_cache_scopes(), self.cache_per_user,
+            lambda: super(CachedResponseMixin, self).get(request, *args, **kwargs)
+        )
+
+
+def get_cache_stats():
+    stats = {}
+    for endpoint in sorted(cache.get(ENDPOINTS_KEY) or ()):
+        hits = cache.get(COUNTER_KEY.format(endpoint, 'hits')) or 0
+        misses = cache.get(COUNTER_KEY.format(endpoint, 'misses')) or 0
+        total = hits + misses
+        stats[endpoint] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else None,
+        }
+    return stats
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Aciertos y fallos de la caché de respuestas por endpoint"""
+    return Response({
+        'backend': settings.CACHES['default']['BACKEND'],
+        'endpoints': get_cache_stats(),
+    })
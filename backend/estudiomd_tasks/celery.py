@@ -1,3 +1,19 @@
-from .celery import app as celery_app
+import os
+from celery import Celery
 
-__all__ = ('celery_app',) 
\ No newline at end of file
+# Set the default Django settings module for the 'celery' program.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'estudiomd_tasks.settings')
+
+app = Celery('estudiomd_tasks')
+
+# Using a string here means the worker doesn't have to serialize
+# the configuration object to child processes.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Load task modules from all registered Django apps.
+app.autodiscover_tasks()
+
+
+@app.task(bind=True)
+def debug_task(self):
+    print(f'Request: {self.request!r}') 
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+GET condicional (ETag / Last-Modified) para vistas de DRF.
+
+La vista define get_validator(), que devuelve (last_modified, huella) a
+partir de consultas baratas (máximo de updated_at de la entidad y sus hijos,
+cantidad de hijos...) sin serializar nada. Si el cliente envía
+If-None-Match / If-Modified-Since y coincide, se responde 304 antes de
+ejecutar el handler; si no, la respuesta 200 lleva los headers ETag y
+Last-Modified.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def latest(*values):
+    """Mayor fecha ignorando los valores None"""
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+class ConditionalGetMixin:
+    conditional_etag = None
+    conditional_last_modified = None
+
+    def get_validator(self, request, *args, **kwargs):
+        """
+        Devuelve (last_modified, huella) del recurso, o None si no existe
+        (la vista seguirá su flujo normal, p. ej. 404 o creación del año).
+        """
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        validator = self.get_validator(request, *args, **kwargs)
+        if validator is None:
+            return
+
+        last_modified, fingerprint = validator
+        # La huella incluye la URL completa: ?year= y otros parámetros cambian el recurso
+        fingerprint = f'{request.get_full_path()}|{fingerprint}'
+        self.conditional_etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        self.conditional_last_modified = last_modified
+
+        not_modified = get_conditional_response(
+            request._request,
+            etag=self.conditional_etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+        if not_modified is not None:
+            self.set_validator_headers(not_modified)
+            raise NotModified(not_modified)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            self.set_validator_headers(response)
+        return response
+
+    def set_validator_headers(self, response):
+        if self.conditional_etag:
+            response['ETag'] = self.conditional_etag
+        if self.conditional_last_modified:
+            response['Last-Modified'] = http_date(self.conditional_last_modified.timestamp())
@@ -0,0 +1,80 @@
+"""
+Renderer y parser JSON de la API con orjson.
+
+Producen los mismos bytes que JSONRenderer / JSONParser de DRF (compacto,
+UTF-8, \\u2028 y \\u2029 escapados) y se usan en REST_FRAMEWORK en su lugar.
+Los tipos que orjson serializa distinto a la librería estándar (Decimal,
+fechas, UUID, lazy strings, querysets...) pasan por el encoder de DRF: un
+Decimal suelto sigue saliendo como número (float) y un datetime UTC con
+'Z'. Los DecimalField de los serializers ya llegan como texto
+(COERCE_DECIMAL_TO_STRING).
+
+Sin orjson instalado, o en lo que orjson no admite (respuestas con
+indentación como la API navegable, claves no str, enteros de más de 64
+bits, otros charsets al parsear), se usa la implementación de DRF. Con JSON
+inválido el error es el de DRF. Diferencias que quedan: un float NaN sale
+como null, los floats con exponente se escriben 1e-7 en vez de 1e-07 (no
+ocurre con montos entre 1e-4 y 1e16) y, al parsear, un entero de más de 64
+bits llega como float.
+
+python manage.py benchmark_json compara ambos renderers.
+"""
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+def _escape_separators(data):
+    # Igual que DRF: JSON que también es un subconjunto válido de JavaScript
+    if b'\xe2\x80' in data:
+        data = data.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return data
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return _escape_separators(orjson.dumps(data, default=_default, option=OPTIONS))
+        except orjson.JSONEncodeError:
+            # Claves no str, enteros grandes, errores del encoder...: el mismo
+            # resultado (o la misma excepción) que JSONRenderer
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # JSON inválido o fuera de lo que admite orjson: decide DRF
+            return super().parse(io.BytesIO(body), media_type, parser_context)
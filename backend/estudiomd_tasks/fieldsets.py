@@ -0,0 +1,142 @@
+"""
+Campos parciales (?fields=) y expansión (?expand=) en las respuestas GET.
+
+- ?fields=id,title: solo esos campos del nivel superior de la respuesta.
+- ?expand=evidences: los campos expandibles que se incluyen.
+
+Cada serializer declara en Meta.expandable_fields sus campos anidados
+costosos (relaciones con muchas filas). Sin ?fields= ni ?expand= la
+respuesta es la de siempre, completa. Con ?expand= (aunque esté vacío) se
+omiten los expandibles no nombrados. Los dos se combinan:
+?fields=id,title&expand=evidences. expandable_fields puede ser un dict
+{campo: campos que lo acompañan}, p. ej. el historial y su enlace a la
+página siguiente.
+
+Las vistas consultan el Fieldset (field_requested) para hacer solo los
+joins, prefetches y anotaciones de los campos que se van a serializar.
+
+Solo se aplica a GET/HEAD: en las escrituras el serializer valida con
+todos sus campos.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _parse(value):
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def expandable_fields(serializer_class):
+    """{campo expandible: campos que lo acompañan} del serializer"""
+    meta = getattr(serializer_class, 'Meta', None)
+    expandable = getattr(meta, 'expandable_fields', ())
+    if isinstance(expandable, dict):
+        return {name: tuple(companions) for name, companions in expandable.items()}
+    return {name: () for name in expandable}
+
+
+class Fieldset:
+    """Campos pedidos para un serializer; sin parámetros incluye todos"""
+
+    def __init__(self, serializer_class, fields=None, expand=None):
+        self.serializer_class = serializer_class
+        self.fields = set(fields) if fields is not None else None
+        self.expand = set(expand) if expand is not None else None
+        self.expandable = expandable_fields(serializer_class)
+
+        if self.expand:
+            unknown = self.expand - set(self.expandable)
+            if unknown:
+                raise ValidationError({EXPAND_PARAM: (
+                    f'Campos no expandibles: {", ".join(sorted(unknown))}. '
+                    f'Opciones: {", ".join(sorted(self.expandable)) or "ninguna"}'
+                )})
+
+        # Campos que acompañan a cada expandible
+        self.companions = {
+            companion: name for name, companions in self.expandable.items() for companion in companions
+        }
+
+    @classmethod
+    def from_request(cls, request, serializer_class):
+        if request is None or request.method not in SAFE_METHODS:
+            return cls(serializer_class)
+        params = request.query_params
+        return cls(serializer_class, _parse(params.get(FIELDS_PARAM)), _parse(params.get(EXPAND_PARAM)))
+
+    @property
+    def is_restricted(self):
+        return self.fields is not None or self.expand is not None
+
+    def includes(self, name):
+        if not self.is_restricted:
+            return True
+        if name in self.companions:
+            return self.includes(self.companions[name])
+        if self.expand is not None and name in self.expand:
+            return True
+        if name in self.expandable and self.expand is not None:
+            return False
+        return self.fields is None or name in self.fields
+
+    def applies_to(self, serializer):
+        return self.is_restricted and type(serializer) is self.serializer_class
+
+    def validate(self, names):
+        """400 si ?fields= nombra campos que el serializer no tiene"""
+        if self.fields:
+            unknown = self.fields - set(names)
+            if unknown:
+                raise ValidationError({FIELDS_PARAM: f'Campos desconocidos: {", ".join(sorted(unknown))}'})
+
+
+def get_fieldset(request, serializer_class):
+    """Fieldset de la petición para serializer_class (se calcula una vez por petición)"""
+    if request is None:
+        return Fieldset(serializer_class)
+    cache = getattr(request, '_fieldsets', None)
+    if cache is None:
+        cache = request._fieldsets = {}
+    if serializer_class not in cache:
+        cache[serializer_class] = Fieldset.from_request(request, serializer_class)
+    return cache[serializer_class]
+
+
+class SparseFieldsMixin:
+    """
+    Serializers: quita los campos no pedidos cuando el contexto trae el
+    Fieldset de este serializer (la vista lo agrega, ver SparseFieldsViewMixin).
+    Los serializers anidados o creados dentro de otro no se recortan.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is not None and fieldset.applies_to(self):
+            fieldset.validate(fields)
+            for name in [name for name in fields if not fieldset.includes(name)]:
+                del fields[name]
+        return fields
+
+
+class SparseFieldsViewMixin:
+    """
+    Vistas genéricas: agrega el Fieldset al contexto del serializer.
+    get_queryset usa field_requested() para precargar solo lo necesario.
+    """
+
+    def get_fieldset(self):
+        return get_fieldset(self.request, self.get_serializer_class())
+
+    def field_requested(self, name):
+        return self.get_fieldset().includes(name)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
@@ -0,0 +1,222 @@
+"""
+Paginación con modos opcionales por petición.
+
+- Por defecto: paginación por número de página (count, next, previous, results),
+  igual que antes.
+- ?count=false: paginación por número de página sin el COUNT(*); se pide una
+  fila extra para saber si hay página siguiente. Pensado para scroll infinito.
+- ?cursor=  (vacío para la primera página) o ?pagination=cursor: paginación
+  keyset sobre los campos de orden de la vista, p. ej. (created_at, id). Cada
+  página filtra por "después de la última fila vista", sin OFFSET ni COUNT, así
+  que el costo es el mismo en la primera página que en la millonésima.
+
+Las vistas indican sus campos con keyset_ordering; el último debe ser único
+(normalmente 'id' / '-id') para que el orden sea total. Si el queryset trae
+otro orden (la relevancia de ?search= con RankedSearchFilter, p. ej.), el
+cursor no lo conservaría: esas peticiones se paginan como ?count=false y sus
+enlaces siguen en ese modo.
+
+Además de querysets, los tres modos aceptan listas ya cargadas, que en modo
+keyset se ordenan y filtran en memoria con los mismos campos, y secuencias
+que se rebanan sin cargarse y filtran por keyset con keyset_filter(order,
+position) (p. ej. el historial de auditoría, tasks.archive.TaskHistory).
+"""
+import base64
+import json
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, replace_query_param, remove_query_param
+from rest_framework.response import Response
+
+
+class KeysetPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    keyset_ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = self.get_mode(request)
+        if self.mode == 'page':
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        if self.mode == 'cursor':
+            ordering = getattr(view, 'keyset_ordering', self.keyset_ordering)
+            if self.keeps_ordering(queryset, ordering):
+                return self.paginate_keyset(queryset, ordering)
+            self.mode = 'nocount'
+            url = self.request.build_absolute_uri()
+            url = remove_query_param(remove_query_param(url, self.cursor_query_param), self.mode_query_param)
+            return self.paginate_without_count(queryset, replace_query_param(url, self.count_query_param, 'false'))
+        return self.paginate_without_count(queryset)
+
+    def get_mode(self, request):
+        if self.cursor_query_param in request.query_params or \
+                request.query_params.get(self.mode_query_param) == 'cursor':
+            return 'cursor'
+        if request.query_params.get(self.count_query_param, '').lower() in ('false', '0', 'no'):
+            return 'nocount'
+        return 'page'
+
+    def get_paginated_response(self, data):
+        if self.mode == 'page':
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    @staticmethod
+    def keeps_ordering(queryset, ordering):
+        """
+        Indica si paginar por ordering respeta el orden del queryset: sin orden
+        explícito o con un prefijo de ordering (p. ej. OrderingFilter por
+        defecto). Las listas se ordenan en memoria con ordering.
+        """
+        if not isinstance(queryset, QuerySet):
+            return True
+        current = tuple(queryset.query.order_by)
+        return current == tuple(ordering[:len(current)])
+
+    # Modo sin COUNT
+
+    def paginate_without_count(self, queryset, url=None):
+        try:
+            page_number = int(self.request.query_params.get(self.page_query_param, 1))
+        except (TypeError, ValueError):
+            page_number = 0
+        if page_number < 1:
+            raise NotFound('Página inválida.')
+
+        offset = (page_number - 1) * self.page_size
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not rows and page_number > 1:
+            raise NotFound('Página inválida.')
+
+        url = url or self.request.build_absolute_uri()
+        self.next_link = replace_query_param(url, self.page_query_param, page_number + 1) if has_next else None
+        if page_number == 1:
+            self.previous_link = None
+        elif page_number == 2:
+            self.previous_link = remove_query_param(url, self.page_query_param)
+        else:
+            self.previous_link = replace_query_param(url, self.page_query_param, page_number - 1)
+        return rows
+
+    # Modo keyset
+
+    def paginate_keyset(self, queryset, ordering):
+        position, reverse = self.decode_cursor(self.request.query_params.get(self.cursor_query_param), ordering)
+
+        # Para la página anterior se recorre en sentido inverso y luego se da vuelta
+        order = [self.invert(field) for field in ordering] if reverse else list(ordering)
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.order_by(*order)
+            if position is not None:
+                queryset = queryset.filter(self.after(order, position))
+        elif hasattr(queryset, 'keyset_filter'):
+            queryset = queryset.keyset_filter(order, position)
+        else:
+            queryset = self.sort_rows(queryset, order)
+            if position is not None:
+                queryset = [row for row in queryset if self.row_after(row, order, position)]
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+        self.next_link = self.cursor_link(rows[-1], ordering, False) if rows and has_next else None
+        self.previous_link = self.cursor_link(rows[0], ordering, True) if rows and has_previous else None
+        return rows
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(order, position):
+        """
+        Condición "fila posterior a position" para un orden compuesto:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(order, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def sort_rows(rows, order):
+        rows = list(rows)
+        # Ordenamientos estables del último campo al primero
+        for field in reversed(order):
+            rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+        return rows
+
+    @staticmethod
+    def row_after(row, order, position):
+        """Equivalente en memoria de after() para una fila"""
+        for field, value in zip(order, position):
+            current = getattr(row, field.lstrip('-'))
+            if current != value:
+                return current < value if field.startswith('-') else current > value
+        return False
+
+    @staticmethod
+    def encode_cursor(instance, ordering, reverse=False):
+        """Cursor de la página siguiente (o anterior, con reverse) a instance"""
+        position = []
+        for field in ordering:
+            value = getattr(instance, field.lstrip('-'))
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def cursor_link(self, instance, ordering, reverse):
+        cursor = self.encode_cursor(instance, ordering, reverse)
+        url = remove_query_param(self.request.build_absolute_uri(), self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, cursor, ordering):
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+        except (AttributeError, TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # Las fechas viajan como ISO 8601
+        values = []
+        for value in position:
+            if isinstance(value, str):
+                try:
+                    value = parse_datetime(value) or value
+                except ValueError:
+                    raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values, reverse
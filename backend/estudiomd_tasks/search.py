@@ -0,0 +1,109 @@
+"""
+Búsqueda de texto para los listados (?search=).
+
+En PostgreSQL cada modelo buscable mantiene una columna search_vector
+(tsvector con índice GIN) que se actualiza al guardar; la búsqueda combina:
+- full-text con prefijo sobre search_vector ("contab" encuentra "contabilidad"),
+- prefijo sobre los campos de documento (RUC, DNI) con índice trigram,
+- similitud trigram sobre los nombres para errores de tipeo,
+y ordena los resultados por relevancia.
+
+En otras bases de datos (SQLite en desarrollo) se usa el SearchFilter de DRF
+(icontains sobre search_fields), sin ranking.
+
+El modelo declara:
+    search_vector_fields = {'campo': 'A', ...}   # pesos A-D del tsvector
+    search_config = 'simple' | 'spanish'
+Un campo puede ser una ruta a registros relacionados ('evidences__extracted_text'):
+su texto se une en una subconsulta (el de los PDFs, ver files.processing).
+y la vista, además de search_fields:
+    search_prefix_fields = ['company_ruc', 'dni']
+    search_trigram_fields = ['name']
+"""
+import re
+from functools import reduce
+from operator import add
+
+from django.db import connection
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, TextField, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from rest_framework.filters import SearchFilter
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def search_text(model, field):
+    """Campo del modelo, o texto de los registros relacionados unido en una subconsulta"""
+    if '__' not in field:
+        return field
+    texts = model.objects.filter(pk=OuterRef('pk')).values('pk').annotate(text=StringAgg(field, ' ')).values('text')
+    return Coalesce(Subquery(texts), Value(''), output_field=TextField())
+
+
+def build_search_vector(model):
+    return reduce(add, [
+        SearchVector(search_text(model, field), weight=weight, config=model.search_config)
+        for field, weight in model.search_vector_fields.items()
+    ])
+
+
+def update_search_vector(model, pks=None):
+    """Recalcula search_vector de las filas indicadas (o de todas) con un solo UPDATE"""
+    if not is_postgresql():
+        return 0
+    queryset = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    return queryset.update(search_vector=build_search_vector(model))
+
+
+def build_prefix_query(text, config):
+    """
+    tsquery con prefijo para cada palabra ("jua per" -> 'jua':* & 'per':*).
+    Solo se usan caracteres de palabra, así que la entrada del usuario no
+    puede romper la sintaxis de to_tsquery.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f"'{word}':*" for word in words), search_type='raw', config=config)
+
+
+class RankedSearchFilter(SearchFilter):
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms or not is_postgresql() or not hasattr(queryset.model, 'search_vector_fields'):
+            return super().filter_queryset(request, queryset, view)
+
+        text = ' '.join(search_terms)
+        model = queryset.model
+        condition = Q()
+        ranks = []
+
+        query = build_prefix_query(text, model.search_config)
+        if query is not None:
+            condition |= Q(search_vector=query)
+            ranks.append(SearchRank(F('search_vector'), query))
+
+        # RUC / DNI: cada término puede ser el inicio del documento
+        prefix = Q()
+        for field in getattr(view, 'search_prefix_fields', []):
+            for term in search_terms:
+                prefix |= Q(**{f'{field}__startswith': term})
+        if prefix:
+            condition |= prefix
+            ranks.append(Case(When(prefix, then=Value(1.0)), default=Value(0.0), output_field=FloatField()))
+
+        for field in getattr(view, 'search_trigram_fields', []):
+            condition |= Q(**{f'{field}__trigram_similar': text})
+            ranks.append(TrigramSimilarity(field, text))
+
+        if not ranks:
+            return queryset.filter(condition)
+
+        rank = ranks[0] if len(ranks) == 1 else Greatest(*ranks, output_field=FloatField())
+        ordering = queryset.query.order_by or model._meta.ordering
+        return queryset.filter(condition).annotate(search_rank=rank).order_by('-search_rank', *ordering)
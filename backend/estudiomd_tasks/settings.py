@@ -16,6 +16,12 @@ try:
 except ImportError:
     HAS_CELERY_BEAT = False
 
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -105,6 +111,10 @@ else:
         }
     }
 
+# Búsqueda full-text y trigram (lookups de django.contrib.postgres) solo con PostgreSQL
+if DATABASES['default']['ENGINE'].startswith('django.db.backends.postgresql'):
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -156,6 +166,16 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ),
+    # JSON con orjson si está instalado (ver estudiomd_tasks/fastjson.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'estudiomd_tasks.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'estudiomd_tasks.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # JWT Configuration
@@ -200,7 +220,10 @@ CORS_ALLOWED_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
+    'upload-checksum',
+    'upload-offset',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
@@ -223,21 +246,101 @@ AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default='us-east-1')
 AWS_S3_FILE_OVERWRITE = False
 AWS_DEFAULT_ACL = None
 AWS_S3_VERIFY = True
+# Servicio compatible con S3 (MinIO, moto); vacío para AWS
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default='') or None
+# Firma v4: necesaria para URLs prefirmadas con checksum
+AWS_S3_SIGNATURE_VERSION = 's3v4'
+AWS_QUERYSTRING_EXPIRE = config('AWS_QUERYSTRING_EXPIRE', default=300, cast=int)
 
 
-# Configuración para storage local (desarrollo)
-DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+if AWS_STORAGE_BUCKET_NAME:
+    # Archivos en S3: subidas y descargas directas con URLs prefirmadas (files/direct-uploads/)
+    DEFAULT_FILE_STORAGE = 'storages.backends.s3.S3Storage'
+else:
+    # Configuración para storage local (desarrollo)
+    DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+
+# Redis
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+
+# Cache Configuration
+# Redis cuando se indica CACHE_REDIS_URL o en Docker/producción (DATABASE_URL);
+# memoria local para desarrollo con SQLite.
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+
+if HAS_REDIS and (CACHE_REDIS_URL or DATABASE_URL):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL or REDIS_URL,
+            'KEY_PREFIX': 'estudiomd',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'estudiomd',
+            'TIMEOUT': 300,
+        }
+    }
+
+# Tiempo de vida (segundos) de las respuestas GET cacheadas.
+# Se invalidan por versión al cambiar los modelos; el TTL es un límite de seguridad.
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
 
 # Celery Configuration
-CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Ejecutar las tareas en el mismo proceso, sin broker (desarrollo y pruebas)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+
+# Auditoría de tareas (tasks.audit): 'redis' encola los eventos en un stream y
+# un worker de Celery los escribe por lotes; 'sync' los escribe al confirmar
+# la transacción. Por defecto Redis en Docker/producción (DATABASE_URL).
+AUDIT_LOG_BACKEND = config('AUDIT_LOG_BACKEND', default='redis' if HAS_REDIS and DATABASE_URL else 'sync')
+AUDIT_LOG_BATCH_SIZE = config('AUDIT_LOG_BATCH_SIZE', default=500, cast=int)
+# Segundos de espera para agrupar eventos antes de escribirlos
+AUDIT_LOG_FLUSH_INTERVAL = config('AUDIT_LOG_FLUSH_INTERVAL', default=2, cast=int)
+# Meses que la auditoría queda en la base; los anteriores se archivan en
+# AUDIT_ARCHIVE_DIR como JSONL comprimido (tasks.archive). 0 desactiva el archivo.
+AUDIT_LOG_RETENTION_MONTHS = config('AUDIT_LOG_RETENTION_MONTHS', default=12, cast=int)
+AUDIT_ARCHIVE_DIR = config('AUDIT_ARCHIVE_DIR', default=os.path.join(MEDIA_ROOT, 'audit_archive'))
+
+CELERY_BEAT_SCHEDULE = {
+    # Particiones de los próximos meses y archivo de los meses vencidos
+    'maintain-audit-log': {
+        'task': 'tasks.tasks.maintain_audit_log',
+        'schedule': timedelta(days=1),
+    },
+    # Eventos de auditoría que quedaron en el stream (flush fallido o sin programar)
+    'flush-audit-log': {
+        'task': 'tasks.tasks.flush_audit_log',
+        'schedule': timedelta(minutes=5),
+    },
+}
+
+# Tiempo de vida (segundos) de las estadísticas de tareas cacheadas.
+# Se invalidan al cambiar una tarea; el TTL acota el desfase del conteo de vencidas.
+TASK_STATS_CACHE_TIMEOUT = config('TASK_STATS_CACHE_TIMEOUT', default=60, cast=int)
 
 # File Upload Settings
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Subidas por partes (files/uploads/): tamaño máximo de cada trozo y del archivo
+# completo, y horas sin actividad tras las que una subida abierta se descarta
+CHUNKED_UPLOAD_CHUNK_SIZE = config('CHUNKED_UPLOAD_CHUNK_SIZE', default=2 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_MAX_SIZE = config('CHUNKED_UPLOAD_MAX_SIZE', default=50 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_EXPIRATION_HOURS = config('CHUNKED_UPLOAD_EXPIRATION_HOURS', default=24, cast=int)
+
+# Descargas servidas por nginx (X-Accel-Redirect), p. ej. '/protected-media/'.
+# Vacío: Django envía el archivo por bloques.
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = config('DOWNLOAD_ACCEL_REDIRECT_PREFIX', default='')
 ALLOWED_FILE_TYPES = [
     'image/jpeg',
     'image/png',
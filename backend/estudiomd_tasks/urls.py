@@ -6,6 +6,7 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from .health import health_check
+from .cache import cache_stats
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -29,6 +30,7 @@ urlpatterns = [
     
     # Health Check
     path('api/v1/health/', health_check, name='health_check'),
+    path('api/v1/cache-stats/', cache_stats, name='cache_stats'),
     
     # API Endpoints
     path('api/v1/', include([
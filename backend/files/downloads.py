@@ -0,0 +1,156 @@
+"""
+Descarga de archivos del storage sin cargarlos en memoria.
+
+- Respuesta completa: FileResponse, que envía el archivo por bloques.
+- Cabecera Range (bytes=inicio-fin): respuesta 206 con solo ese tramo, para
+  reanudar descargas y para visores de PDF que piden páginas sueltas.
+- DOWNLOAD_ACCEL_REDIRECT_PREFIX: si se configura (p. ej. '/protected-media/')
+  y el storage es local, Django solo valida permisos y responde con
+  X-Accel-Redirect; nginx envía el archivo (con Range incluido).
+- Storage S3: redirección a una URL prefirmada de corta duración
+  (files.presigned); con ?redirect=false se devuelve la URL en JSON.
+
+on_close se ejecuta al cerrarse el archivo enviado por Django (después de
+enviarlo), para que tareas como la auditoría no retrasen la descarga. En
+las respuestas sin cuerpo de archivo (X-Accel-Redirect, S3) se ejecuta al
+armar la respuesta.
+"""
+import logging
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .presigned import presigned_download_url, url_expiration
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    Devuelve (inicio, fin) inclusivo para un único rango, 'invalid' si no se
+    puede satisfacer, o None si no hay rango utilizable (se envía todo).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if size == 0:
+        # Un archivo vacío no tiene tramos: se envía completo (vacío)
+        return None
+    if not start:
+        # bytes=-500: los últimos 500 bytes
+        length = int(end)
+        if length == 0:
+            return 'invalid'
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def iter_range(file, start, length):
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def run_callback(callback):
+    try:
+        callback()
+    except Exception:
+        logger.exception('Error al ejecutar la tarea posterior a la descarga')
+
+
+class ClosingFile:
+    """
+    Archivo que ejecuta callback una vez al cerrarse. FileResponse e
+    iter_range cierran el archivo cuando el servidor termina de enviarlo.
+    """
+
+    def __init__(self, file, callback):
+        self.file = file
+        self.callback = callback
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            callback, self.callback = self.callback, None
+            if callback is not None:
+                run_callback(callback)
+
+
+def serve_file(request, name, filename, content_type=None, storage=None, on_close=None):
+    storage = storage or default_storage
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    accel_prefix = getattr(settings, 'DOWNLOAD_ACCEL_REDIRECT_PREFIX', '')
+    # ContentAddressedStorage delega en el storage real
+    backend = getattr(storage, 'backend', storage)
+    if accel_prefix and isinstance(backend, FileSystemStorage):
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f"{accel_prefix.rstrip('/')}/{name}")
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    elif hasattr(backend, 'bucket'):
+        # S3: el navegador descarga directamente del bucket
+        url = presigned_download_url(storage, name, filename, content_type)
+        if request.GET.get('redirect') == 'false':
+            response = JsonResponse({'url': url, 'expires_in': url_expiration()})
+        else:
+            response = HttpResponseRedirect(url)
+    else:
+        return _stream_file(request, storage, name, filename, content_type, on_close)
+
+    if on_close is not None and response.status_code in (200, 302):
+        run_callback(on_close)
+    return response
+
+
+def _stream_file(request, storage, name, filename, content_type, on_close=None):
+    size = storage.size(name)
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = storage.open(name, 'rb')
+    if on_close is not None:
+        file = ClosingFile(file, on_close)
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from clients.models import AdditionalPDT, TaxDeclaration
+from files.processing import enqueue_processing
+from files.tasks import process_upload
+from tasks.models import Evidence
+
+
+class Command(BaseCommand):
+    help = 'Procesa (o vuelve a encolar) las evidencias y PDTs pendientes de procesar'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutes', type=int, default=10,
+            help='Solo registros pendientes sin cambios en este tiempo (los recientes pueden estar en cola)'
+        )
+        parser.add_argument(
+            '--sync', action='store_true',
+            help='Procesar en este proceso en lugar de encolar en Celery'
+        )
+        parser.add_argument(
+            '--failed', action='store_true',
+            help='Incluir también los registros que fallaron'
+        )
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'failed'] if options['failed'] else ['pending']
+        limit = timezone.now() - timedelta(minutes=options['minutes'])
+
+        count = 0
+        for model, date_field in ((Evidence, 'uploaded_at'), (TaxDeclaration, 'updated_at'), (AdditionalPDT, 'updated_at')):
+            pending = model.objects.filter(
+                processing_status__in=statuses, **{f'{date_field}__lt': limit}
+            ).exclude(**{model.processed_file_field: ''}).exclude(**{f'{model.processed_file_field}__isnull': True})
+            for pk in pending.values_list('pk', flat=True).iterator():
+                if options['sync']:
+                    process_upload.apply(args=(model._meta.label, pk))
+                else:
+                    enqueue_processing(model._meta.label, pk)
+                count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{count} archivos procesados' if options['sync'] else f'{count} archivos encolados'))
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.models import Blob, UploadSession
+from files.storage import release_blob
+from files.uploads import discard_chunks
+
+
+class Command(BaseCommand):
+    help = 'Elimina las partes de subidas abandonadas o canceladas y los blobs que nadie usa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.CHUNKED_UPLOAD_EXPIRATION_HOURS,
+            help='Horas sin actividad tras las que una subida se considera abandonada'
+        )
+
+    def handle(self, *args, **options):
+        limit = timezone.now() - timedelta(hours=options['hours'])
+        expired = UploadSession.objects.filter(status='open', updated_at__lt=limit)
+        aborted = UploadSession.objects.filter(status='aborted', chunks__isnull=False).distinct()
+
+        count = 0
+        for session in list(expired) + list(aborted):
+            discard_chunks(session)
+            if session.status == 'open':
+                session.status = 'aborted'
+                session.save(update_fields=['status', 'updated_at'])
+            count += 1
+
+        # Subidas finalizadas que nunca se asociaron a un registro
+        UploadSession.objects.filter(status='complete', updated_at__lt=limit).update(status='aborted')
+
+        # Blobs sin referencias (subidas no asociadas o registros que fallaron al guardarse)
+        released = 0
+        pending = UploadSession.objects.filter(status='complete').values('storage_name')
+        for blob in Blob.objects.filter(references__isnull=True, created_at__lt=limit).exclude(storage_name__in=pending):
+            released += release_blob(blob)
+
+        self.stdout.write(self.style.SUCCESS(f'{count} subidas limpiadas, {released} blobs sin uso eliminados'))
@@ -0,0 +1,150 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class UploadSession(models.Model):
+    """
+    Subida por partes: el cliente envía el archivo en trozos consecutivos y
+    puede reanudar desde el último offset confirmado. Al finalizar, las
+    partes se ensamblan en default_storage. Con S3 también puede ser una
+    subida directa al bucket (direct).
+    """
+    PURPOSE_CHOICES = [
+        ('file', 'Archivo'),
+        ('evidence', 'Evidencia'),
+        ('tax_declaration', 'Declaración PDT'),
+        ('additional_pdt', 'PDT adicional'),
+    ]
+
+    STATUS_CHOICES = [
+        ('open', 'En curso'),
+        ('complete', 'Completa'),
+        ('attached', 'Asociada a un registro'),
+        ('aborted', 'Cancelada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES, default='file')
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.BigIntegerField()
+    # Bytes recibidos y confirmados; el siguiente trozo debe empezar aquí
+    offset = models.BigIntegerField(default=0)
+    # SHA-256 del archivo completo (opcional, se verifica al finalizar)
+    checksum = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    # Subida directa al bucket con URL prefirmada (files.presigned) en lugar de trozos;
+    # mientras está abierta, storage_name es el objeto temporal que sube el navegador
+    direct = models.BooleanField(default=False)
+    storage_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('upload session')
+        verbose_name_plural = _('upload sessions')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name} ({self.offset}/{self.total_size})"
+
+    @property
+    def is_expired(self):
+        lifetime = timedelta(hours=getattr(settings, 'CHUNKED_UPLOAD_EXPIRATION_HOURS', 24))
+        return self.status == 'open' and self.updated_at < timezone.now() - lifetime
+
+    def chunk_prefix(self):
+        return f'uploads/chunks/{self.id}'
+
+
+class UploadChunk(models.Model):
+    """Trozo recibido de una subida por partes, guardado como objeto aparte"""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    offset = models.BigIntegerField()
+    size = models.IntegerField()
+    checksum = models.CharField(max_length=64)
+    storage_name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('upload chunk')
+        verbose_name_plural = _('upload chunks')
+        ordering = ['offset']
+        unique_together = ['session', 'offset']
+
+    def __str__(self):
+        return f"{self.session_id} @ {self.offset}"
+
+
+class Blob(models.Model):
+    """
+    Contenido almacenado una sola vez bajo su SHA-256 (blobs/ab/<sha256>.ext).
+    Los registros que lo usan se cuentan en BlobReference.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    storage_name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('blob')
+        verbose_name_plural = _('blobs')
+
+    def __str__(self):
+        return self.storage_name
+
+
+class BlobReference(models.Model):
+    """
+    Uso de un blob por un registro: 'tasks.evidence:12:file' para campos de
+    modelos o 'upload:uploads/<usuario>/<nombre>' para archivos sueltos.
+    """
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='references')
+    record = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('blob reference')
+        verbose_name_plural = _('blob references')
+
+    def __str__(self):
+        return f"{self.record} -> {self.blob_id}"
+
+
+class ProcessedDocument(models.Model):
+    """
+    Resultado del procesamiento posterior a la subida (files.processing),
+    que se ejecuta en Celery para no alargar la petición de subida.
+    processed_file_field indica el FileField que se procesa.
+    """
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('done', 'Procesado'),
+        ('rejected', 'Tipo de archivo no permitido'),
+        ('failed', 'Error al procesar'),
+    ]
+
+    processed_file_field = 'file'
+    # Campo con el tipo declarado, que se corrige con el detectado
+    declared_type_field = None
+    # Ruta al registro cuyo search_vector incluye extracted_text (p. ej. 'task')
+    search_parent = None
+
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUS_CHOICES, default='pending')
+    # Tipo real según los primeros bytes del archivo (no el declarado por el navegador)
+    detected_type = models.CharField(max_length=100, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    # Texto de los PDFs, para búsquedas
+    extracted_text = models.TextField(blank=True)
+    # Nombre de la miniatura en default_storage
+    thumbnail = models.CharField(max_length=255, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
@@ -0,0 +1,146 @@
+"""
+Subidas y descargas directas contra S3 (o un servicio compatible como MinIO)
+con URLs prefirmadas, sin que los bytes pasen por Django.
+
+Subida:
+1. POST files/direct-uploads/ con file_name, content_type, total_size y
+   checksum (SHA-256 en hex). Devuelve una URL PUT prefirmada y los headers
+   que el navegador debe enviar. La firma incluye el tamaño y el checksum,
+   así S3 rechaza un contenido distinto al declarado.
+2. El navegador sube el archivo con PUT a esa URL.
+3. POST files/direct-uploads/<id>/confirm/: se verifica el objeto (HEAD) y
+   se convierte en blob (files.storage) con una copia en el servidor. Para
+   evidencias y PDTs devuelve el upload_id que se envía al crear el registro,
+   igual que las subidas por partes.
+
+El bucket debe permitir PUT desde el origen del frontend (CORS) y exponer
+el header ETag.
+
+Si el servicio no devuelve el checksum del objeto, se calcula leyéndolo
+desde el bucket: el contenido de un blob nunca se toma del cliente sin
+verificar.
+
+Descarga: serve_file responde con una redirección a una URL GET prefirmada
+(o con la URL en JSON si se pide ?redirect=false).
+"""
+import base64
+import binascii
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.http import content_disposition_header
+from storages.utils import clean_name
+
+from .storage import blob_storage
+from .uploads import ChunkedUploadError
+
+
+def s3_backend(storage=None):
+    """El storage S3 de django-storages detrás de storage, o None si es otro backend"""
+    storage = storage or default_storage
+    backend = getattr(storage, 'backend', storage)
+    return backend if hasattr(backend, 'bucket') else None
+
+
+def url_expiration():
+    return getattr(settings, 'AWS_QUERYSTRING_EXPIRE', 300)
+
+
+def direct_upload_name(session):
+    extension = os.path.splitext(session.file_name)[1].lower()
+    return f'uploads/direct/{session.id}{extension}'
+
+
+def _object_key(backend, name):
+    return backend._normalize_name(clean_name(name))
+
+
+def presigned_upload(session):
+    """URL PUT prefirmada para que el navegador suba el archivo de la sesión"""
+    backend = s3_backend()
+    checksum = base64.b64encode(bytes.fromhex(session.checksum)).decode()
+    url = backend.bucket.meta.client.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': backend.bucket.name,
+            'Key': _object_key(backend, session.storage_name),
+            'ContentType': session.content_type,
+            'ContentLength': session.total_size,
+            'ChecksumSHA256': checksum,
+        },
+        ExpiresIn=url_expiration(),
+    )
+    return {
+        'method': 'PUT',
+        'url': url,
+        'headers': {
+            'Content-Type': session.content_type,
+            'x-amz-checksum-sha256': checksum,
+        },
+        'expires_in': url_expiration(),
+    }
+
+
+def _object_sha256(backend, name, head):
+    """SHA-256 del objeto en hex: el que guardó S3 o, si no lo hay, leyéndolo"""
+    checksum = head.get('ChecksumSHA256', '')
+    # Los objetos multipart tienen un checksum compuesto ('...-N')
+    if checksum and '-' not in checksum:
+        try:
+            return base64.b64decode(checksum).hex()
+        except (binascii.Error, ValueError):
+            pass
+    digest = hashlib.sha256()
+    with backend.open(name, 'rb') as file:
+        for chunk in file.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def confirm_direct_upload(session):
+    """
+    Verifica el objeto subido por el navegador y lo guarda como blob. Debe
+    llamarse con la sesión bloqueada (select_for_update).
+    """
+    if session.status != 'open':
+        raise ChunkedUploadError('La subida ya fue confirmada o cancelada', status_code=409)
+
+    from botocore.exceptions import ClientError
+
+    backend = s3_backend()
+    name = session.storage_name
+    try:
+        head = backend.bucket.meta.client.head_object(
+            Bucket=backend.bucket.name, Key=_object_key(backend, name), ChecksumMode='ENABLED'
+        )
+    except ClientError:
+        raise ChunkedUploadError('El archivo aún no se subió al storage', status_code=409)
+
+    if head['ContentLength'] != session.total_size:
+        backend.delete(name)
+        raise ChunkedUploadError('El tamaño del archivo no coincide con el declarado')
+    sha256 = _object_sha256(backend, name, head)
+    if sha256 != session.checksum:
+        backend.delete(name)
+        raise ChunkedUploadError('El checksum del archivo no coincide')
+
+    stored_name = blob_storage().adopt(name, sha256, session.total_size)
+    session.storage_name = stored_name
+    session.offset = session.total_size
+    session.status = 'complete'
+    session.save(update_fields=['storage_name', 'offset', 'status', 'updated_at'])
+    return stored_name
+
+
+def presigned_download_url(storage, name, filename, content_type):
+    """URL GET prefirmada que descarga el archivo con su nombre original"""
+    return s3_backend(storage).url(
+        name,
+        parameters={
+            'ResponseContentDisposition': content_disposition_header(True, filename),
+            'ResponseContentType': content_type,
+        },
+        expire=url_expiration(),
+    )
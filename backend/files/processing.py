@@ -0,0 +1,227 @@
+"""
+Procesamiento posterior a la subida de evidencias y PDTs.
+
+La petición de subida solo escribe el archivo en el storage y encola
+files.tasks.process_upload al confirmar la transacción. El worker de
+Celery luego:
+
+- Detecta el tipo real por los primeros bytes (magic bytes). Los archivos
+  cuyo tipo no está en ALLOWED_FILE_TYPES quedan como 'rejected'.
+- En PDFs obtiene el número de páginas y el texto (PyMuPDF).
+- Genera una miniatura JPEG de las imágenes y de la primera página de los
+  PDFs en thumbnails/, con el mismo nombre que el blob (una por contenido).
+
+El texto no se devuelve en la API: entra en el search_vector del registro
+indicado por search_parent (la tarea de una evidencia, el cliente de un
+PDT), así ?search= encuentra los documentos por su contenido.
+
+PyMuPDF es opcional: sin él, el número de páginas se estima contando los
+objetos /Page y no se extrae texto ni se generan miniaturas de PDFs.
+"""
+import io
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from estudiomd_tasks.search import is_postgresql, update_search_vector
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF < 1.24.3
+    except ImportError:
+        fitz = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_PREFIX = 'thumbnails'
+THUMBNAIL_SIZE = (320, 320)
+# Límite del texto guardado por documento
+MAX_EXTRACTED_TEXT = 100_000
+
+MAGIC_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+]
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+
+def detect_type(header, file_name=''):
+    """Tipo MIME según los primeros bytes del archivo"""
+    # El encabezado %PDF- puede estar dentro del primer KB
+    if b'%PDF-' in header[:1024]:
+        return 'application/pdf'
+    for signature, content_type in MAGIC_SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header.startswith(b'PK\x03\x04'):
+        # Los .docx son ZIP; el contenido interno no se inspecciona
+        return DOCX_TYPE if file_name.lower().endswith('.docx') else 'application/zip'
+    if header and b'\x00' not in header:
+        try:
+            header.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError:
+            # El encabezado pudo cortar un carácter multibyte
+            try:
+                header[:-3].decode('utf-8')
+                return 'text/plain'
+            except UnicodeDecodeError:
+                pass
+    return 'application/octet-stream'
+
+
+def thumbnail_name(storage_name):
+    stem = os.path.splitext(os.path.basename(storage_name))[0]
+    return f'{THUMBNAIL_PREFIX}/{stem}.jpg'
+
+
+def _save_thumbnail(image, storage_name):
+    image.thumbnail(THUMBNAIL_SIZE)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80)
+    name = thumbnail_name(storage_name)
+    # El mismo contenido ya tiene miniatura
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def analyze_pdf(data, storage_name):
+    """Número de páginas, texto y miniatura de la primera página"""
+    result = {}
+    if fitz is None:
+        result['page_count'] = len(PDF_PAGE_RE.findall(data)) or None
+        return result
+
+    with fitz.open(stream=data, filetype='pdf') as document:
+        result['page_count'] = document.page_count
+        text = []
+        length = 0
+        for page in document:
+            page_text = page.get_text()
+            text.append(page_text)
+            length += len(page_text)
+            if length >= MAX_EXTRACTED_TEXT:
+                break
+        result['extracted_text'] = ''.join(text)[:MAX_EXTRACTED_TEXT].replace('\x00', '')
+
+        if document.page_count and Image is not None:
+            pixmap = document[0].get_pixmap(dpi=72)
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+            result['thumbnail'] = _save_thumbnail(image, storage_name)
+    return result
+
+
+def analyze_image(file, storage_name):
+    if Image is None:
+        return {}
+    with Image.open(file) as image:
+        return {'thumbnail': _save_thumbnail(image, storage_name)}
+
+
+def process_document(instance):
+    """
+    Procesa el archivo del registro y devuelve los campos a actualizar.
+    Los errores del contenido (PDF dañado, imagen inválida) se registran como
+    'failed'; los de lectura del storage se propagan para que la tarea se
+    reintente.
+    """
+    field_file = getattr(instance, instance.processed_file_field)
+    name = field_file.name
+    with field_file.storage.open(name, 'rb') as file:
+        data = file.read()
+
+    detected = detect_type(data[:2048], name)
+    # Los resultados de un archivo anterior no se conservan
+    updates = {
+        'detected_type': detected, 'processed_at': timezone.now(),
+        'page_count': None, 'extracted_text': '', 'thumbnail': '',
+    }
+
+    allowed_types = getattr(settings, 'ALLOWED_FILE_TYPES', [])
+    if allowed_types and detected not in allowed_types:
+        updates['processing_status'] = 'rejected'
+        return updates
+
+    if instance.declared_type_field and getattr(instance, instance.declared_type_field) != detected:
+        updates[instance.declared_type_field] = detected
+
+    try:
+        if detected == 'application/pdf':
+            updates.update(analyze_pdf(data, name))
+        elif detected.startswith('image/'):
+            updates.update(analyze_image(io.BytesIO(data), name))
+    except Exception as e:
+        logger.warning('No se pudo procesar %s: %s', name, e)
+        updates['processing_status'] = 'failed'
+        return updates
+
+    updates['processing_status'] = 'done'
+    return updates
+
+
+def update_parent_search(instance):
+    """Recalcula el search_vector que incluye el texto del documento (search_parent)"""
+    if not instance.search_parent or not is_postgresql():
+        return
+    *names, last = instance.search_parent.split('__')
+    parent = instance
+    try:
+        for name in names:
+            parent = getattr(parent, name)
+    except ObjectDoesNotExist:
+        # Eliminado en cascada junto con el registro
+        return
+    field = parent._meta.get_field(last)
+    update_search_vector(field.related_model, [getattr(parent, field.attname)])
+
+
+def schedule_processing(instance):
+    """
+    Marca el registro como pendiente y encola su procesamiento al confirmar
+    la transacción (el worker debe ver el registro ya guardado).
+    """
+    if not getattr(instance, instance.processed_file_field):
+        return
+    model = type(instance)
+    model.objects.filter(pk=instance.pk).update(processing_status='pending', processed_at=None)
+    instance.processing_status = 'pending'
+    instance.processed_at = None
+    label, pk = instance._meta.label, instance.pk
+    transaction.on_commit(lambda: enqueue_processing(label, pk))
+
+
+def enqueue_processing(label, pk):
+    from .tasks import process_upload
+    try:
+        process_upload.delay(label, pk)
+    except Exception:
+        # Sin broker el registro queda 'pending'; process_uploads lo retoma
+        logger.exception('No se pudo encolar el procesamiento de %s %s', label, pk)
+
+
+def file_changed(request, field_name='pdf_file'):
+    """Indica si una actualización envía un archivo nuevo (directo o por partes)"""
+    return field_name in request.data or 'upload_id' in request.data
@@ -1,5 +1,12 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from .models import UploadSession
+from .uploads import claim_upload
+
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
@@ -14,4 +21,118 @@ class FileResponseSerializer(serializers.Serializer):
     file_url = serializers.URLField()
     file_size = serializers.IntegerField()
     file_type = serializers.CharField()
-    message = serializers.CharField() 
\ No newline at end of file
+    message = serializers.CharField()
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'purpose', 'file_name', 'content_type', 'total_size', 'offset',
+            'checksum', 'status', 'chunk_size', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'offset', 'status', 'created_at', 'updated_at']
+
+    def get_chunk_size(self, obj):
+        return settings.CHUNKED_UPLOAD_CHUNK_SIZE
+
+    def validate_file_name(self, value):
+        # Solo el nombre, sin carpetas
+        value = os.path.basename(value.replace('\\', '/'))
+        if not value:
+            raise serializers.ValidationError('Nombre de archivo inválido')
+        return value
+
+    def validate_content_type(self, value):
+        allowed_types = getattr(settings, 'ALLOWED_FILE_TYPES', [])
+        if allowed_types and value not in allowed_types:
+            raise serializers.ValidationError('Tipo de archivo no permitido')
+        return value
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('El tamaño debe ser mayor a cero')
+        if value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'El archivo excede el tamaño máximo de {settings.CHUNKED_UPLOAD_MAX_SIZE / (1024*1024)}MB'
+            )
+        return value
+
+    def validate_checksum(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdefABCDEF' for c in value)):
+            raise serializers.ValidationError('El checksum debe ser un SHA-256 en hexadecimal')
+        return value.lower()
+
+
+class DirectUploadSerializer(UploadSessionSerializer):
+    """Subida directa al bucket: el checksum es obligatorio porque forma parte de la firma"""
+    checksum = serializers.CharField(max_length=64)
+
+    class Meta(UploadSessionSerializer.Meta):
+        read_only_fields = UploadSessionSerializer.Meta.read_only_fields + ['direct']
+        fields = UploadSessionSerializer.Meta.fields + ['direct']
+
+
+class ChunkedUploadSerializerMixin:
+    """
+    Permite enviar upload_id (una subida por partes ya finalizada) en lugar
+    del archivo. El serializer declara el campo upload_id y define el
+    propósito de la subida y el campo de archivo del modelo.
+    """
+    upload_purpose = None
+    upload_file_field = 'file'
+    upload_required = False
+
+    def validate_upload_id(self, value):
+        if value is None:
+            return None
+        session = UploadSession.objects.filter(
+            pk=value, user=self.context['request'].user, purpose=self.upload_purpose, status='complete'
+        ).first()
+        if session is None:
+            raise serializers.ValidationError('Subida no encontrada o sin finalizar')
+        return session
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs.get('upload_id') and attrs.get(self.upload_file_field):
+            raise serializers.ValidationError('Envíe el archivo o upload_id, no ambos')
+        if self.upload_required and not self.instance and \
+                not attrs.get('upload_id') and not attrs.get(self.upload_file_field):
+            raise serializers.ValidationError({self.upload_file_field: 'Se requiere el archivo o upload_id'})
+        return attrs
+
+    def get_upload_attrs(self, session):
+        """Campos adicionales del modelo a completar con los datos de la subida"""
+        return {}
+
+    def apply_upload(self, validated_data):
+        session = validated_data.pop('upload_id', None)
+        if session is not None:
+            claim_upload(session)
+            validated_data[self.upload_file_field] = session.storage_name
+            validated_data.update(self.get_upload_attrs(session))
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self.apply_upload(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self.apply_upload(validated_data))
+
+
+# Resultado del procesamiento en segundo plano (files.processing), solo lectura
+PROCESSED_DOCUMENT_FIELDS = ['processing_status', 'detected_type', 'page_count', 'thumbnail_url']
+
+
+class ProcessedDocumentSerializerMixin:
+    """El serializer declara thumbnail_url = SerializerMethodField()"""
+
+    def get_thumbnail_url(self, obj):
+        if not obj.thumbnail:
+            return None
+        url = default_storage.url(obj.thumbnail)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete
+from .storage import set_reference
+from .uploads import PURPOSE_FIELDS
+
+
+def _record(instance, field_name):
+    return f'{instance._meta.label_lower}:{instance.pk}:{field_name}'
+
+
+def _connect(model, field_name):
+    def sync_reference_on_save(sender, instance, raw=False, **kwargs):
+        """Mantener la referencia al blob del archivo del registro"""
+        if not raw:
+            set_reference(_record(instance, field_name), getattr(instance, field_name).name)
+
+    def release_reference_on_delete(sender, instance, **kwargs):
+        """Liberar el blob; se elimina del storage si ningún otro registro lo usa"""
+        set_reference(_record(instance, field_name), '')
+
+    post_save.connect(sync_reference_on_save, sender=model, weak=False,
+                      dispatch_uid=f'blob_reference_save_{model._meta.label_lower}')
+    post_delete.connect(release_reference_on_delete, sender=model, weak=False,
+                        dispatch_uid=f'blob_reference_delete_{model._meta.label_lower}')
+
+
+for app_label, model_name, field_name in PURPOSE_FIELDS.values():
+    _connect(apps.get_model(app_label, model_name), field_name)
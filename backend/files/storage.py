@@ -0,0 +1,231 @@
+"""
+Almacenamiento direccionado por contenido.
+
+ContentAddressedStorage envuelve default_storage: al guardar calcula el
+SHA-256 mientras el archivo se escribe en un objeto temporal y luego lo
+mueve a blobs/<ab>/<sha256><ext>. Si el blob ya existía, el temporal se
+descarta y se devuelve el nombre existente, así el mismo PDF subido como
+evidencia, como PDT y por otro trabajador ocupa espacio una sola vez.
+
+Cada registro que usa un blob tiene una BlobReference; al eliminar la
+última referencia se elimina el blob del storage.
+"""
+import hashlib
+import io
+import os
+import uuid
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils.crypto import get_random_string
+
+from .models import Blob, BlobReference
+from .processing import thumbnail_name
+
+BLOB_PREFIX = 'blobs'
+
+
+class HashingReader(io.RawIOBase):
+    """Lee los chunks de un archivo calculando su SHA-256 y su tamaño"""
+
+    def __init__(self, content):
+        super().__init__()
+        self.chunks = content.chunks()
+        self.pending = b''
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            self.pending = next(self.chunks, b'')
+            self.digest.update(self.pending)
+            self.size += len(self.pending)
+        data, self.pending = self.pending[:len(buffer)], self.pending[len(buffer):]
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class ContentAddressedStorage(Storage):
+
+    def __init__(self, backend=None):
+        self.backend = backend or default_storage
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        reader = HashingReader(content)
+        temp_name = self.backend.save(
+            f'{BLOB_PREFIX}/tmp/{uuid.uuid4().hex}{extension}', File(reader, name=name)
+        )
+        return self.adopt(temp_name, reader.digest.hexdigest(), reader.size)
+
+    def adopt(self, temp_name, sha256, size):
+        """
+        Convierte un objeto ya escrito en el backend (con su SHA-256 verificado)
+        en blob, o lo descarta si el contenido ya existía. Devuelve el nombre del blob.
+        """
+        extension = os.path.splitext(temp_name)[1].lower()
+        final_name = f'{BLOB_PREFIX}/{sha256[:2]}/{sha256}{extension}'
+
+        with transaction.atomic():
+            blob, created = Blob.objects.select_for_update().get_or_create(
+                sha256=sha256, defaults={'storage_name': final_name, 'size': size}
+            )
+            if not created and self.backend.exists(blob.storage_name):
+                self.backend.delete(temp_name)
+                return blob.storage_name
+            blob.storage_name = self._move(temp_name, blob.storage_name)
+            blob.save(update_fields=['storage_name'])
+        return blob.storage_name
+
+    def _move(self, source, target):
+        """Mueve el temporal a su nombre definitivo sin volver a leerlo si el backend lo permite"""
+        if isinstance(self.backend, FileSystemStorage):
+            target_path = self.backend.path(target)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(self.backend.path(source), target_path)
+            return target
+        if hasattr(self.backend, 'bucket'):
+            # S3: copia en el servidor y borra el temporal
+            bucket = self.backend.bucket
+            bucket.Object(self.backend._normalize_name(target)).copy_from(
+                CopySource={'Bucket': bucket.name, 'Key': self.backend._normalize_name(source)}
+            )
+            self.backend.delete(source)
+            return target
+        with self.backend.open(source, 'rb') as source_file:
+            saved_name = self.backend.save(target, source_file)
+        self.backend.delete(source)
+        return saved_name
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide el contenido
+        return name
+
+    def generate_filename(self, filename):
+        return self.backend.generate_filename(filename)
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def delete(self, name):
+        # Los blobs solo se eliminan al liberar su última referencia
+        if not Blob.objects.filter(storage_name=name).exists():
+            self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+
+def blob_storage():
+    """Storage de los FileField de documentos (callable para no fijarlo en las migraciones)"""
+    return ContentAddressedStorage()
+
+
+def release_blob(blob):
+    """Elimina el blob si ya no tiene referencias"""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob.pk).first()
+        if blob is None or blob.references.exists():
+            return False
+        storage_name = blob.storage_name
+        blob.delete()
+        transaction.on_commit(lambda: delete_blob_files(storage_name))
+    return True
+
+
+def delete_blob_files(storage_name):
+    """Elimina el blob y su miniatura (files.processing) del storage"""
+    default_storage.delete(storage_name)
+    default_storage.delete(thumbnail_name(storage_name))
+
+
+def set_reference(record, storage_name):
+    """
+    Apunta la referencia del registro al blob guardado como storage_name
+    (o la elimina si storage_name está vacío o no es un blob) y libera el
+    blob anterior si quedó sin uso.
+    """
+    blob = Blob.objects.filter(storage_name=storage_name).first() if storage_name else None
+    current = BlobReference.objects.select_related('blob').filter(record=record).first()
+    if current is not None and blob is not None and current.blob_id == blob.id:
+        return current
+
+    with transaction.atomic():
+        reference = None
+        if current is not None:
+            current.delete()
+        if blob is not None:
+            # El bloqueo evita que release_blob lo elimine mientras se referencia
+            Blob.objects.select_for_update().filter(pk=blob.pk).first()
+            reference = BlobReference.objects.create(blob=blob, record=record)
+    if current is not None:
+        release_blob(current.blob)
+    return reference
+
+
+def release_blob_name(storage_name):
+    """Descarta un blob recién guardado que no llegó a usarse (si nadie más lo usa)"""
+    blob = Blob.objects.filter(storage_name=storage_name).first()
+    if blob is not None:
+        release_blob(blob)
+
+
+def upload_record(path):
+    return f'upload:{path}'
+
+
+def register_upload(user_id, file_name, storage_name):
+    """
+    Registra un archivo suelto bajo su ruta lógica uploads/<usuario>/<nombre>
+    (con sufijo si ya existe, igual que get_available_name) y la devuelve.
+    """
+    path = f'uploads/{user_id}/{file_name}'
+    root, extension = os.path.splitext(path)
+    while BlobReference.objects.filter(record=upload_record(path)).exists():
+        path = f'{root}_{get_random_string(7)}{extension}'
+    set_reference(upload_record(path), storage_name)
+    return path
+
+
+def get_dedup_stats():
+    """Espacio ocupado por los blobs frente al que ocuparían sin deduplicar"""
+    blobs = Blob.objects.aggregate(count=Count('id'), stored_bytes=Sum('size'))
+    references = BlobReference.objects.aggregate(count=Count('id'), logical_bytes=Sum('blob__size'))
+    stored_bytes = blobs['stored_bytes'] or 0
+    logical_bytes = references['logical_bytes'] or 0
+    saved_bytes = max(logical_bytes - stored_bytes, 0)
+    return {
+        'blobs': blobs['count'],
+        'references': references['count'],
+        'unreferenced_blobs': Blob.objects.filter(references__isnull=True).count(),
+        'stored_bytes': stored_bytes,
+        'logical_bytes': logical_bytes,
+        'saved_bytes': saved_bytes,
+        'saved_ratio': round(saved_bytes / logical_bytes, 4) if logical_bytes else 0.0,
+    }
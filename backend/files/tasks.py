@@ -0,0 +1,35 @@
+import logging
+
+from celery import shared_task
+from django.apps import apps
+
+from .processing import process_document, update_parent_search
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30, acks_late=True)
+def process_upload(self, label, pk):
+    """Procesa el archivo de una evidencia o PDT recién subido (ver files.processing)"""
+    model = apps.get_model(label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    name = getattr(instance, model.processed_file_field).name
+    if not name:
+        return None
+
+    try:
+        updates = process_document(instance)
+    except OSError as e:
+        # Error al leer del storage: se reintenta
+        if self.request.retries >= self.max_retries:
+            logger.error('No se pudo leer %s para procesarlo: %s', name, e)
+            model.objects.filter(pk=pk).update(processing_status='failed')
+            return 'failed'
+        raise self.retry(exc=e)
+
+    # Si el archivo cambió mientras tanto, el resultado ya no aplica
+    if model.objects.filter(pk=pk, **{model.processed_file_field: name}).update(**updates):
+        update_parent_search(instance)
+    return updates['processing_status']
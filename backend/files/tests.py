@@ -0,0 +1,379 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from tasks.models import Evidence, Task
+from . import processing
+from .downloads import serve_file
+from .models import Blob, UploadChunk, UploadSession
+from .storage import blob_storage
+from .tasks import process_upload
+from .uploads import claim_upload
+
+try:
+    import boto3
+    import requests
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+User = get_user_model()
+
+BUCKET = 'estudiomd-test'
+S3_STORAGES = {
+    'default': {'BACKEND': 'storages.backends.s3.S3Storage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@skipUnless(mock_aws is not None, 'Las subidas directas se prueban contra moto (requirements-dev.txt)')
+@override_settings(
+    STORAGES=S3_STORAGES, AWS_STORAGE_BUCKET_NAME=BUCKET, AWS_S3_ENDPOINT_URL=None,
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing'
+)
+class DirectUploadTests(APITestCase):
+    """Subida y descarga con URLs prefirmadas contra un S3 simulado (moto)"""
+
+    def setUp(self):
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+
+        self.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='admin', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.task = Task.objects.create(
+            title='Tarea', description='Descripción', due_date='2030-01-01T00:00Z', created_by=self.user
+        )
+        self.data = b'%PDF-1.4 contenido de prueba ' * 64
+
+    def start_upload(self, data, checksum=None, purpose='evidence'):
+        response = self.client.post('/api/v1/files/direct-uploads/', {
+            'purpose': purpose, 'file_name': 'declaracion.pdf', 'content_type': 'application/pdf',
+            'total_size': len(data), 'checksum': checksum or hashlib.sha256(data).hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def put(self, upload, data):
+        response = requests.put(upload['url'], data=data, headers=upload['headers'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_upload_confirm_and_download(self):
+        session = self.start_upload(self.data)
+        self.assertEqual(
+            self.client.post(f"/api/v1/files/direct-uploads/{session['id']}/confirm/").status_code, 409
+        )
+
+        self.put(session['upload'], self.data)
+        response = self.client.post(f"/api/v1/files/direct-uploads/{session['id']}/confirm/")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['status'], 'complete')
+
+        response = self.client.post(
+            f'/api/v1/tasks/{self.task.id}/evidences/upload/', {'upload_id': session['id']}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        evidence = Evidence.objects.get(pk=response.data['id'])
+        self.assertTrue(evidence.file.name.startswith('blobs/'))
+        self.assertFalse(default_storage.exists(f"uploads/direct/{session['id']}.pdf"))
+
+        response = self.client.get(f'/api/v1/tasks/{self.task.id}/evidences/{evidence.id}/download/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(requests.get(response['Location']).content, self.data)
+
+    def test_same_content_is_stored_once(self):
+        for purpose in ('evidence', 'file'):
+            session = self.start_upload(self.data, purpose=purpose)
+            self.put(session['upload'], self.data)
+            response = self.client.post(f"/api/v1/files/direct-uploads/{session['id']}/confirm/")
+            self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Blob.objects.count(), 1)
+
+    def test_rejects_content_with_other_checksum(self):
+        session = self.start_upload(self.data)
+        self.put(session['upload'], b'x' * len(self.data))
+        response = self.client.post(f"/api/v1/files/direct-uploads/{session['id']}/confirm/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, 'open')
+        self.assertEqual(Blob.objects.count(), 0)
+
+
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=16)
+class ChunkedUploadTests(APITestCase):
+    """Subida por partes sobre un MEDIA_ROOT temporal: trozos de 16 bytes"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = self.settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='admin', role='admin'
+        )
+        self.client.force_authenticate(self.user)
+        self.task = Task.objects.create(
+            title='Tarea', description='Descripción', due_date='2030-01-01T00:00Z', created_by=self.user
+        )
+        self.data = b'%PDF-1.4 contenido de prueba por partes'
+        self.chunks = [(offset, self.data[offset:offset + 16]) for offset in range(0, len(self.data), 16)]
+
+    def start_upload(self):
+        response = self.client.post('/api/v1/files/uploads/', {
+            'purpose': 'evidence', 'file_name': 'declaracion.pdf', 'content_type': 'application/pdf',
+            'total_size': len(self.data), 'checksum': hashlib.sha256(self.data).hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def put(self, upload_id, offset, chunk, checksum=None):
+        return self.client.put(
+            f'/api/v1/files/uploads/{upload_id}/chunks/', chunk, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=checksum or hashlib.sha256(chunk).hexdigest()
+        )
+
+    def upload(self):
+        upload_id = self.start_upload()
+        for offset, chunk in self.chunks:
+            self.assertEqual(self.put(upload_id, offset, chunk).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/v1/files/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 200, response.data)
+        return upload_id
+
+    def attach(self, upload_id):
+        return self.client.post(
+            f'/api/v1/tasks/{self.task.id}/evidences/upload/', {'upload_id': upload_id}, format='json'
+        )
+
+    def test_complete_assembles_into_blob_storage(self):
+        upload_id = self.upload()
+        session = UploadSession.objects.get(pk=upload_id)
+        self.assertEqual(session.status, 'complete')
+        self.assertTrue(session.storage_name.startswith('blobs/'))
+        with blob_storage().open(session.storage_name) as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertFalse(UploadChunk.objects.exists())
+
+        response = self.attach(upload_id)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Evidence.objects.get(pk=response.data['id']).file.name, session.storage_name)
+
+    def test_offset_mismatch(self):
+        upload_id = self.start_upload()
+        offset, chunk = self.chunks[1]
+        response = self.put(upload_id, offset, chunk)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 0)
+
+    def test_resent_chunk_is_harmless(self):
+        upload_id = self.start_upload()
+        offset, chunk = self.chunks[0]
+        for _ in range(2):
+            response = self.put(upload_id, offset, chunk)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['offset'], 16)
+        self.assertEqual(UploadChunk.objects.count(), 1)
+
+    def test_bad_checksum(self):
+        upload_id = self.start_upload()
+        offset, chunk = self.chunks[0]
+        response = self.put(upload_id, offset, chunk, checksum=hashlib.sha256(b'otro').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).offset, 0)
+        self.assertFalse(UploadChunk.objects.exists())
+
+    def test_oversize_chunk(self):
+        upload_id = self.start_upload()
+        self.assertEqual(self.put(upload_id, 0, self.data[:17]).status_code, 400)
+        # Dentro del máximo por trozo, pero más allá del tamaño declarado
+        for offset, chunk in self.chunks[:-1]:
+            self.put(upload_id, offset, chunk)
+        offset, chunk = self.chunks[-1]
+        self.assertEqual(self.put(upload_id, offset, chunk + b'!').status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).offset, offset)
+
+    def test_upload_is_claimed_once(self):
+        upload_id = self.upload()
+        stale = UploadSession.objects.get(pk=upload_id)
+
+        other = User.objects.create_user(username='otro', email='otro@example.com', password='otro', role='admin')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.attach(upload_id).status_code, 400)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.attach(upload_id).status_code, 201)
+        response = self.attach(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('upload_id', response.data)
+        self.assertEqual(Evidence.objects.count(), 1)
+
+        # Dos peticiones que validaron la misma subida: solo la primera la usa
+        with self.assertRaises(ValidationError):
+            claim_upload(stale)
+
+
+@override_settings(DOWNLOAD_ACCEL_REDIRECT_PREFIX='')
+class ServeFileTests(SimpleTestCase):
+    """Descarga por streaming desde un FileSystemStorage"""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = FileSystemStorage(location=location)
+        self.storage.save('datos.txt', ContentFile(b'0123456789'))
+        self.storage.save('vacio.txt', ContentFile(b''))
+        self.closed = []
+
+    def download(self, name, range_header=None):
+        headers = {'HTTP_RANGE': range_header} if range_header else {}
+        request = RequestFactory().get('/', **headers)
+        response = serve_file(request, name, name, storage=self.storage, on_close=lambda: self.closed.append(name))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_on_close_runs_once_after_sending(self):
+        response, content = self.download('datos.txt')
+        self.assertEqual((response.status_code, content), (200, b'0123456789'))
+        self.assertEqual(self.closed, [])
+        response.close()
+        response.close()
+        self.assertEqual(self.closed, ['datos.txt'])
+
+    def test_range(self):
+        response, content = self.download('datos.txt', 'bytes=2-4')
+        self.assertEqual((response.status_code, content), (206, b'234'))
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response.close()
+        self.assertEqual(self.closed, ['datos.txt'])
+
+    def test_unsatisfiable_range_does_not_run_on_close(self):
+        response, _ = self.download('datos.txt', 'bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        response.close()
+        self.assertEqual(self.closed, [])
+
+    def test_range_on_empty_file_sends_it_whole(self):
+        for range_header in ('bytes=-5', 'bytes=0-'):
+            response, content = self.download('vacio.txt', range_header)
+            self.assertEqual((response.status_code, content), (200, b''))
+            response.close()
+
+
+def make_pdf(*pages):
+    """PDF mínimo con una página por texto"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>']
+    kids = ' '.join(f'{3 + 2 * index} 0 R' for index in range(len(pages)))
+    objects.append(f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'.encode())
+    font = 3 + 2 * len(pages)
+    for index, text in enumerate(pages):
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * index} 0 R '
+            f'/Resources << /Font << /F1 {font} 0 R >> >> >>'.encode()
+        )
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    data = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    data += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    data += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return data
+
+
+class ProcessUploadTests(TestCase):
+    """files.tasks.process_upload sobre evidencias guardadas en un MEDIA_ROOT temporal"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='docs', email='docs@example.com', password='docs', role='admin'
+        )
+        cls.task = Task.objects.create(
+            title='Declaración', description='...', due_date='2030-01-01T00:00Z', created_by=cls.user
+        )
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = self.settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def evidence(self, data, file_name, file_type):
+        return Evidence.objects.create(
+            task=self.task, file=ContentFile(data, name=file_name), file_name=file_name,
+            file_type=file_type, file_size=len(data), uploaded_by=self.user
+        )
+
+    def process(self, evidence):
+        status = process_upload(Evidence._meta.label, evidence.pk)
+        evidence.refresh_from_db()
+        self.assertEqual(evidence.processing_status, status)
+        return evidence
+
+    def test_pdf(self):
+        data = make_pdf('Hola', 'Constancia de presentacion')
+        evidence = self.process(self.evidence(data, 'pdt.pdf', 'application/pdf'))
+        self.assertEqual((evidence.processing_status, evidence.detected_type), ('done', 'application/pdf'))
+        self.assertEqual(evidence.page_count, 2)
+        self.assertIsNotNone(evidence.processed_at)
+        if processing.fitz is not None:
+            self.assertIn('Constancia de presentacion', evidence.extracted_text)
+
+    @skipUnless(Image is not None, 'Las miniaturas requieren Pillow')
+    def test_image_thumbnail(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(buffer, format='PNG')
+        evidence = self.process(self.evidence(buffer.getvalue(), 'foto.png', 'image/png'))
+        self.assertEqual((evidence.processing_status, evidence.detected_type), ('done', 'image/png'))
+        self.assertTrue(default_storage.exists(evidence.thumbnail))
+        with default_storage.open(evidence.thumbnail) as file, Image.open(file) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), max(processing.THUMBNAIL_SIZE))
+
+    def test_mislabelled_binary_is_rejected(self):
+        evidence = self.process(self.evidence(bytes(range(256)) * 4, 'declaracion.pdf', 'application/pdf'))
+        self.assertEqual((evidence.processing_status, evidence.detected_type), ('rejected', 'application/octet-stream'))
+        self.assertEqual((evidence.page_count, evidence.extracted_text, evidence.thumbnail), (None, '', ''))
+
+    def test_extracted_text_is_searchable(self):
+        Task.objects.create(title='Otra', description='...', due_date='2030-01-01T00:00Z', created_by=self.user)
+        evidence = self.evidence(make_pdf('Hola'), 'pdt.pdf', 'application/pdf')
+        Evidence.objects.filter(pk=evidence.pk).update(extracted_text='Constancia de presentación SUNAT')
+        processing.update_parent_search(evidence)
+
+        self.client.force_login(self.user)
+        response = self.client.get('/api/v1/tasks/', {'search': 'constancia'})
+        self.assertEqual(response.status_code, 200)
+        # La otra tarea no tiene el texto
+        self.assertEqual([task['id'] for task in response.json()['results']], [self.task.id])
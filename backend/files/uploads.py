@@ -0,0 +1,178 @@
+"""
+Subidas por partes (init -> trozos -> finalizar) sobre default_storage.
+
+Cada trozo se guarda como un objeto independiente en
+uploads/chunks/<sesión>/<offset>, de modo que funciona igual con
+FileSystemStorage que con S3 (que no permite añadir a un objeto existente).
+Al finalizar, las partes se leen en orden y se escriben en streaming al
+destino final (files.storage, deduplicado por contenido) calculando el
+SHA-256, sin cargar el archivo en memoria.
+"""
+import hashlib
+import io
+
+from django.apps import apps
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import UploadChunk, UploadSession
+from .storage import blob_storage, release_blob_name
+
+# Campo de destino para cada propósito: define la carpeta (upload_to) del archivo final
+PURPOSE_FIELDS = {
+    'evidence': ('tasks', 'Evidence', 'file'),
+    'tax_declaration': ('clients', 'TaxDeclaration', 'pdf_file'),
+    'additional_pdt': ('clients', 'AdditionalPDT', 'pdf_file'),
+}
+
+
+class ChunkedUploadError(Exception):
+    def __init__(self, message, status_code=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.extra = extra
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def target_name(session):
+    """Ruta final del archivo según el propósito de la subida"""
+    if session.purpose in PURPOSE_FIELDS:
+        app_label, model_name, field_name = PURPOSE_FIELDS[session.purpose]
+        field = apps.get_model(app_label, model_name)._meta.get_field(field_name)
+        return field.generate_filename(None, session.file_name)
+    return f'uploads/{session.user_id}/{session.file_name}'
+
+
+def store_chunk(session, offset, data, checksum):
+    """
+    Guarda un trozo en la posición offset. Debe llamarse con la sesión
+    bloqueada (select_for_update).
+    """
+    if session.status != 'open':
+        raise ChunkedUploadError('La subida ya no admite más partes', status_code=409)
+    if session.direct:
+        raise ChunkedUploadError('La subida es directa al storage (files/direct-uploads/)', status_code=409)
+
+    if offset != session.offset:
+        # Reenvío de un trozo ya confirmado (p. ej. se perdió la respuesta)
+        if session.chunks.filter(offset=offset, checksum=checksum).exists():
+            return False
+        raise ChunkedUploadError(
+            'El offset no coincide con los bytes recibidos', status_code=409, offset=session.offset
+        )
+
+    if not data:
+        raise ChunkedUploadError('El trozo está vacío')
+    if offset + len(data) > session.total_size:
+        raise ChunkedUploadError('El trozo excede el tamaño declarado del archivo')
+    if sha256_hex(data) != checksum:
+        raise ChunkedUploadError('El checksum del trozo no coincide')
+
+    name = f'{session.chunk_prefix()}/{offset:012d}'
+    # Un intento anterior pudo guardar el objeto sin confirmar el offset
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    stored_name = default_storage.save(name, ContentFile(data))
+
+    UploadChunk.objects.create(
+        session=session, offset=offset, size=len(data), checksum=checksum, storage_name=stored_name
+    )
+    session.offset = offset + len(data)
+    session.save(update_fields=['offset', 'updated_at'])
+    return True
+
+
+class ChunkReader(io.RawIOBase):
+    """Lectura secuencial de las partes de una sesión, como si fueran un solo archivo"""
+
+    def __init__(self, chunk_names, size):
+        super().__init__()
+        self.chunk_names = list(chunk_names)
+        self.size = size
+        self.current = None
+        self.digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                if not self.chunk_names:
+                    return 0
+                self.current = default_storage.open(self.chunk_names.pop(0), 'rb')
+            data = self.current.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                self.digest.update(data)
+                return len(data)
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def assemble(session):
+    """
+    Ensambla las partes en el destino final y devuelve el nombre guardado.
+    Verifica el tamaño y, si se indicó, el SHA-256 del archivo completo.
+    """
+    if session.status != 'open':
+        raise ChunkedUploadError('La subida ya fue finalizada o cancelada', status_code=409)
+    if session.direct:
+        raise ChunkedUploadError('La subida es directa al storage (files/direct-uploads/)', status_code=409)
+    if session.offset != session.total_size:
+        raise ChunkedUploadError(
+            'Faltan partes por subir', status_code=409, offset=session.offset
+        )
+
+    chunk_names = session.chunks.order_by('offset').values_list('storage_name', flat=True)
+    reader = ChunkReader(chunk_names, session.total_size)
+    try:
+        # Deduplicado: si el contenido ya existe se reutiliza el blob
+        stored_name = blob_storage().save(target_name(session), File(reader, name=session.file_name))
+    finally:
+        reader.close()
+
+    digest = reader.digest.hexdigest()
+    if session.checksum and digest != session.checksum.lower():
+        release_blob_name(stored_name)
+        raise ChunkedUploadError('El checksum del archivo no coincide')
+
+    session.storage_name = stored_name
+    session.checksum = digest
+    session.status = 'complete'
+    session.save(update_fields=['storage_name', 'checksum', 'status', 'updated_at'])
+    transaction.on_commit(lambda: discard_chunks(session))
+    return stored_name
+
+
+def discard_chunks(session):
+    """Elimina las partes guardadas de una sesión (o el objeto de una subida directa sin confirmar)"""
+    if session.direct and session.status == 'open' and session.storage_name:
+        default_storage.delete(session.storage_name)
+    for chunk in session.chunks.all():
+        default_storage.delete(chunk.storage_name)
+    session.chunks.all().delete()
+
+
+def claim_upload(session):
+    """
+    Marca una subida completa como asociada a un registro. La actualización
+    condicional evita que dos peticiones usen la misma subida.
+    """
+    claimed = UploadSession.objects.filter(pk=session.pk, status='complete').update(status='attached')
+    if not claimed:
+        raise ValidationError({'upload_id': 'La subida ya fue utilizada'})
+    session.status = 'attached'
+    return session
@@ -7,4 +7,15 @@ urlpatterns = [
     path('upload/', views.FileUploadView.as_view(), name='file_upload'),
     path('download/<path:file_path>/', views.FileDownloadView.as_view(), name='file_download'),
     path('delete/<path:file_path>/', views.delete_file, name='file_delete'),
+    path('storage-stats/', views.storage_stats, name='storage_stats'),
+    
+    # Subida por partes (reanudable)
+    path('uploads/', views.UploadSessionCreateView.as_view(), name='upload_session_create'),
+    path('uploads/<uuid:pk>/', views.UploadSessionDetailView.as_view(), name='upload_session_detail'),
+    path('uploads/<uuid:pk>/chunks/', views.UploadChunkView.as_view(), name='upload_chunk'),
+    path('uploads/<uuid:pk>/complete/', views.UploadCompleteView.as_view(), name='upload_complete'),
+    
+    # Subida directa a S3 con URL prefirmada
+    path('direct-uploads/', views.DirectUploadCreateView.as_view(), name='direct_upload_create'),
+    path('direct-uploads/<uuid:pk>/confirm/', views.DirectUploadConfirmView.as_view(), name='direct_upload_confirm'),
 ] 
\ No newline at end of file
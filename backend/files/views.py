@@ -5,9 +5,17 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
 from django.core.files.storage import default_storage
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.files.base import ContentFile
-from django.http import HttpResponse
-from .serializers import FileUploadSerializer
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from .downloads import serve_file
+from .models import BlobReference, UploadSession
+from .presigned import confirm_direct_upload, direct_upload_name, presigned_upload, s3_backend
+from .serializers import DirectUploadSerializer, FileUploadSerializer, UploadSessionSerializer
+from users.permissions import IsAdminUser
+from .storage import blob_storage, get_dedup_stats, register_upload, set_reference, upload_record
+from .uploads import ChunkedUploadError, assemble, discard_chunks, store_chunk
 from .utils import validate_file_type, validate_file_size
 
 
@@ -37,12 +45,11 @@ class FileUploadView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Generar nombre único para el archivo
+        # Guardar el contenido una sola vez (blobs/<sha256>) y registrarlo
+        # bajo su ruta lógica uploads/<usuario>/<nombre>
         file_name = uploaded_file.name
-        file_path = f'uploads/{request.user.id}/{file_name}'
-        
-        # Guardar archivo
-        saved_path = default_storage.save(file_path, uploaded_file)
+        saved_path = blob_storage().save(f'uploads/{request.user.id}/{file_name}', uploaded_file)
+        file_path = register_upload(request.user.id, file_name, saved_path)
         
         # Obtener URL del archivo
         if hasattr(settings, 'AWS_STORAGE_BUCKET_NAME'):
@@ -52,6 +59,7 @@ class FileUploadView(APIView):
         
         return Response({
             'file_name': file_name,
+            'file_path': file_path,
             'file_url': file_url,
             'file_size': uploaded_file.size,
             'file_type': uploaded_file.content_type,
@@ -64,21 +72,28 @@ class FileDownloadView(APIView):
     
     def get(self, request, file_path):
         try:
-            # Construir la ruta completa del archivo
-            full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+            # Ruta lógica de un archivo deduplicado -> blob guardado
+            reference = BlobReference.objects.select_related('blob').filter(record=upload_record(file_path)).first()
+            storage_name = reference.blob.storage_name if reference else file_path
             
-            if not os.path.exists(full_path):
+            if not default_storage.exists(storage_name):
                 return Response(
                     {'error': 'Archivo no encontrado'},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Leer el archivo
-            with open(full_path, 'rb') as file:
-                response = HttpResponse(file.read(), content_type='application/octet-stream')
-                response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-                return response
-                
+            # Envío por bloques, con soporte de Range (o X-Accel-Redirect si está configurado)
+            return serve_file(
+                request, storage_name, os.path.basename(file_path),
+                content_type='application/octet-stream'
+            )
+        
+        except SuspiciousFileOperation:
+            # Rutas fuera de MEDIA_ROOT (../)
+            return Response(
+                {'error': 'Archivo no encontrado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         except Exception as e:
             return Response(
                 {'error': 'Error al descargar el archivo'},
@@ -89,12 +104,15 @@ class FileDownloadView(APIView):
 @api_view(['DELETE'])
 @permission_classes([permissions.IsAuthenticated])
 def delete_file(request, file_path):
-    """Eliminar un archivo"""
+    """
+    Eliminar un archivo. Los archivos deduplicados se identifican por su ruta
+    lógica (file_path devuelto al subirlos): se elimina la referencia y el
+    blob solo se borra del storage si ningún otro registro lo usa.
+    """
     try:
-        # Construir la ruta completa del archivo
-        full_path = os.path.join(settings.MEDIA_ROOT, file_path)
+        reference = BlobReference.objects.filter(record=upload_record(file_path)).first()
         
-        if not os.path.exists(full_path):
+        if reference is None and not default_storage.exists(file_path):
             return Response(
                 {'error': 'Archivo no encontrado'},
                 status=status.HTTP_404_NOT_FOUND
@@ -109,14 +127,185 @@ def delete_file(request, file_path):
             )
         
         # Eliminar el archivo
-        os.remove(full_path)
+        if reference is not None:
+            set_reference(reference.record, '')
+        else:
+            # Archivos guardados antes de la deduplicación
+            default_storage.delete(file_path)
         
         return Response({
             'message': 'Archivo eliminado exitosamente'
         })
-        
+    
+    except SuspiciousFileOperation:
+        return Response(
+            {'error': 'Archivo no encontrado'},
+            status=status.HTTP_404_NOT_FOUND
+        )
     except Exception as e:
         return Response(
             {'error': 'Error al eliminar el archivo'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        ) 
\ No newline at end of file
+        )
+
+
+class UploadSessionCreateView(APIView):
+    """
+    Inicia una subida por partes. Luego el cliente envía los trozos en orden
+    a chunks/ y finaliza con complete/. Si la conexión se corta, consulta la
+    sesión (GET) y continúa desde 'offset'.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            session = serializer.save(user=request.user)
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadSessionDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, pk):
+        """Estado de la subida: 'offset' indica desde dónde continuar"""
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        return Response(UploadSessionSerializer(session).data)
+    
+    def delete(self, request, pk):
+        """Cancela la subida y elimina las partes recibidas"""
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user, status='open')
+        discard_chunks(session)
+        session.status = 'aborted'
+        session.save(update_fields=['status', 'updated_at'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadChunkView(APIView):
+    """
+    Recibe un trozo. El cuerpo es el contenido binario (o un campo 'chunk' en
+    multipart). Headers:
+        Upload-Offset: posición del trozo en el archivo
+        Upload-Checksum: SHA-256 del trozo en hexadecimal
+    Reenviar un trozo ya confirmado es inocuo; un offset distinto al esperado
+    devuelve 409 con el offset correcto.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def put(self, request, pk):
+        offset = request.headers.get('Upload-Offset', request.query_params.get('offset'))
+        checksum = (request.headers.get('Upload-Checksum') or request.query_params.get('checksum', '')).lower()
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            return Response({'error': 'Upload-Offset inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(checksum) != 64:
+            return Response({'error': 'Se requiere Upload-Checksum (SHA-256)'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if request.content_type.startswith('multipart/form-data'):
+            if 'chunk' not in request.FILES:
+                return Response({'error': 'No se proporcionó el trozo'}, status=status.HTTP_400_BAD_REQUEST)
+            chunk = request.FILES['chunk']
+            if chunk.size > settings.CHUNKED_UPLOAD_CHUNK_SIZE:
+                return Response({'error': 'El trozo excede el tamaño máximo'}, status=status.HTTP_400_BAD_REQUEST)
+            data = chunk.read()
+        else:
+            data = request.body
+            if len(data) > settings.CHUNKED_UPLOAD_CHUNK_SIZE:
+                return Response({'error': 'El trozo excede el tamaño máximo'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            session = get_object_or_404(UploadSession.objects.select_for_update(), pk=pk, user=request.user)
+            try:
+                store_chunk(session, offset, data, checksum)
+            except ChunkedUploadError as e:
+                return Response({'error': e.message, **e.extra}, status=e.status_code)
+        
+        return Response(UploadSessionSerializer(session).data)
+    
+    post = put
+
+
+class UploadCompleteView(APIView):
+    """
+    Ensambla las partes en el storage. Para evidencias y PDTs devuelve el
+    upload_id que se envía al crear el registro; para archivos sueltos
+    devuelve la URL igual que la subida directa.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, pk):
+        with transaction.atomic():
+            session = get_object_or_404(UploadSession.objects.select_for_update(), pk=pk, user=request.user)
+            try:
+                saved_path = assemble(session)
+            except ChunkedUploadError as e:
+                return Response({'error': e.message, **e.extra}, status=e.status_code)
+        
+        return Response(completed_upload_data(request, session, saved_path))
+
+
+def completed_upload_data(request, session, saved_path):
+    data = UploadSessionSerializer(session).data
+    data['upload_id'] = data['id']
+    if session.purpose == 'file':
+        data['file_path'] = register_upload(request.user.id, session.file_name, saved_path)
+        # Obtener URL del archivo
+        if getattr(settings, 'AWS_STORAGE_BUCKET_NAME', ''):
+            data['file_url'] = default_storage.url(saved_path)
+        else:
+            data['file_url'] = f'/media/{saved_path}'
+    return data
+
+
+class DirectUploadCreateView(APIView):
+    """
+    Subida directa al bucket S3 con URL prefirmada: el navegador envía el
+    archivo con PUT a upload.url (con upload.headers) y luego llama a
+    confirm/. Django no recibe los bytes del archivo.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        if s3_backend() is None:
+            return Response(
+                {'error': 'Las subidas directas requieren el storage S3; use files/uploads/'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = DirectUploadSerializer(data=request.data)
+        if serializer.is_valid():
+            session = serializer.save(user=request.user, direct=True)
+            session.storage_name = direct_upload_name(session)
+            session.save(update_fields=['storage_name'])
+            data = DirectUploadSerializer(session).data
+            data['upload'] = presigned_upload(session)
+            return Response(data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class DirectUploadConfirmView(APIView):
+    """
+    Verifica el archivo subido al bucket. Igual que complete/ en las subidas
+    por partes: devuelve el upload_id para crear la evidencia o el PDT.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, pk):
+        with transaction.atomic():
+            session = get_object_or_404(
+                UploadSession.objects.select_for_update(), pk=pk, user=request.user, direct=True
+            )
+            try:
+                saved_path = confirm_direct_upload(session)
+            except ChunkedUploadError as e:
+                return Response({'error': e.message, **e.extra}, status=e.status_code)
+        
+        return Response(completed_upload_data(request, session, saved_path))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def storage_stats(request):
+    """Ahorro de espacio por la deduplicación de archivos (solo administradores)"""
+    return Response(get_dedup_stats())
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Task, Evidence, AuditLogEntry
+from .models import Task, Evidence, AuditLogEntry, AuditArchive
 
 
 @admin.register(Task)
@@ -38,6 +38,13 @@ class EvidenceAdmin(admin.ModelAdmin):
 class AuditLogEntryAdmin(admin.ModelAdmin):
     list_display = ['action', 'task', 'user', 'timestamp']
     list_filter = ['action', 'timestamp']
-    search_fields = ['action', 'task__title', 'user__email', 'details']
-    readonly_fields = ['timestamp']
-    ordering = ['-timestamp'] 
\ No newline at end of file
+    search_fields = ['task__title', 'user__email']
+    readonly_fields = ['timestamp', 'details']
+    ordering = ['-timestamp']
+
+
+@admin.register(AuditArchive)
+class AuditArchiveAdmin(admin.ModelAdmin):
+    list_display = ['month', 'path', 'entry_count', 'size', 'created_at']
+    readonly_fields = ['month', 'path', 'entry_count', 'size', 'created_at']
+    ordering = ['-month']
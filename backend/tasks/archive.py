@@ -0,0 +1,327 @@
+"""
+Retención y archivo de la auditoría de tareas.
+
+Las entradas con más de AUDIT_LOG_RETENTION_MONTHS meses se mueven, por
+mes completo, a archivos JSONL comprimidos en AUDIT_ARCHIVE_DIR (por
+defecto MEDIA_ROOT/audit_archive/AAAA/AAAA-MM.jsonl.gz). Luego se elimina
+la partición del mes (PostgreSQL, ver tasks.partitions) o sus filas.
+
+Cada archivo es una concatenación de miembros gzip, uno por tarea y en
+orden de tarea; sigue siendo un .jsonl.gz normal (zcat lo lee completo).
+AuditArchiveSegment guarda el offset y el largo de cada miembro, así el
+historial de una tarea se lee descomprimiendo solo sus entradas.
+
+task_history() devuelve el historial de una tarea combinando las entradas
+vivas y las archivadas, con el mismo orden (timestamp, id) y los mismos
+campos; las archivadas son instancias de AuditLogEntry sin guardar. Los
+archivos se leen solo cuando la página llega a los meses archivados.
+"""
+import gzip
+import json
+import logging
+import os
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from estudiomd_tasks.pagination import KeysetPageNumberPagination
+
+from . import partitions
+from .models import AuditArchive, AuditArchiveSegment, AuditLogEntry
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Orden del historial de una tarea (el último campo desempata)
+HISTORY_ORDERING = ('-timestamp', '-id')
+ARCHIVE_FIELDS = ('id', 'event_id', 'task_id', 'user_id', 'action', 'timestamp', 'payload')
+
+
+def archive_dir():
+    return getattr(settings, 'AUDIT_ARCHIVE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'audit_archive')
+
+
+def archive_path(archive):
+    return os.path.join(archive_dir(), archive.path)
+
+
+def _archive_name(month):
+    """Ruta relativa libre para el mes (un mes archivado dos veces tiene dos archivos)"""
+    directory = os.path.join(archive_dir(), f'{month:%Y}')
+    os.makedirs(directory, exist_ok=True)
+    name, suffix = f'{month:%Y}/{month:%Y-%m}', 1
+    relative = f'{name}.jsonl.gz'
+    while os.path.exists(os.path.join(archive_dir(), relative)) or AuditArchive.objects.filter(path=relative).exists():
+        suffix += 1
+        relative = f'{name}.{suffix}.jsonl.gz'
+    return relative
+
+
+def _line(entry):
+    return json.dumps({
+        'id': entry['id'],
+        'event_id': entry['event_id'],
+        'task': entry['task_id'],
+        'user': entry['user_id'],
+        'action': AuditLogEntry.Action(entry['action']).name.lower(),
+        # isoformat conserva los microsegundos (DjangoJSONEncoder los recorta)
+        'timestamp': entry['timestamp'].isoformat(),
+        'payload': entry['payload'],
+    }, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _write_archive(path, entries):
+    """Escribe un miembro gzip por tarea; devuelve los segmentos sin guardar y el total"""
+    segments = []
+    offset = total = 0
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        for task_id, group in groupby(entries, key=lambda entry: entry['task_id']):
+            lines = [_line(entry) for entry in group]
+            member = gzip.compress(('\n'.join(lines) + '\n').encode(), mtime=0)
+            file.write(member)
+            segments.append(AuditArchiveSegment(
+                task_id=task_id, offset=offset, length=len(member), entry_count=len(lines)
+            ))
+            offset += len(member)
+            total += len(lines)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return segments, total, offset
+
+
+def archive_month(month):
+    """
+    Archiva las entradas del mes (datetime del primer día, UTC) y las quita
+    de la tabla. Devuelve el AuditArchive creado, o None si no había entradas.
+    """
+    month = partitions.month_start(month)
+    end = partitions.add_months(month, 1)
+    entries = AuditLogEntry.objects.filter(timestamp__gte=month, timestamp__lt=end)
+
+    with transaction.atomic():
+        partitioned = partitions.is_partitioned()
+        if partitioned:
+            # Las escrituras tardías del mes esperan a que termine el archivo
+            with connection.cursor() as cursor:
+                partitions.lock_partition(cursor, month)
+        # Solo las filas existentes al empezar: las que lleguen después quedan
+        # para otro archivo del mismo mes
+        last_id = entries.aggregate(last=Max('id'))['last']
+        if last_id is None:
+            return None
+        entries = entries.filter(id__lte=last_id)
+        rows = entries.order_by('task_id', 'timestamp', 'id').values(*ARCHIVE_FIELDS)
+
+        relative = _archive_name(month)
+        path = os.path.join(archive_dir(), relative)
+        try:
+            segments, total, size = _write_archive(path, rows.iterator(chunk_size=2000))
+            archive = AuditArchive.objects.create(month=month.date(), path=relative, entry_count=total, size=size)
+            for segment in segments:
+                segment.archive = archive
+            AuditArchiveSegment.objects.bulk_create(segments, batch_size=1000)
+
+            if partitioned:
+                with connection.cursor() as cursor:
+                    partitions.drop_partition(cursor, month)
+            # Filas del mes en la partición DEFAULT, o todas en otros motores
+            entries.delete()
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+    logger.info('Auditoría de %s archivada en %s (%s entradas)', f'{month:%Y-%m}', relative, total)
+    return archive
+
+
+def expired_months(retention_months=None, now=None):
+    """Meses con entradas más antiguas que la retención, del más antiguo al más nuevo"""
+    if retention_months is None:
+        retention_months = settings.AUDIT_LOG_RETENTION_MONTHS
+    if retention_months <= 0:
+        return []
+    cutoff = partitions.add_months(partitions.month_start(now or timezone.now()), -retention_months)
+    oldest = AuditLogEntry.objects.filter(timestamp__lt=cutoff).aggregate(oldest=Min('timestamp'))['oldest']
+    months = []
+    month = partitions.month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        months.append(month)
+        month = partitions.add_months(month, 1)
+    return months
+
+
+def archive_expired(retention_months=None, now=None):
+    """Archiva los meses fuera de la retención; devuelve los AuditArchive creados"""
+    archives = []
+    for month in expired_months(retention_months, now):
+        archive = archive_month(month)
+        if archive is not None:
+            archives.append(archive)
+    return archives
+
+
+def _read_segment(file, segment):
+    file.seek(segment.offset)
+    data = gzip.decompress(file.read(segment.length))
+    return [json.loads(line) for line in data.splitlines() if line]
+
+
+def archived_entries(task_id, segments=None):
+    """
+    Entradas archivadas de la tarea como instancias de AuditLogEntry sin
+    guardar. segments limita los segmentos leídos (por defecto, todos).
+    """
+    if segments is None:
+        segments = AuditArchiveSegment.objects.filter(task_id=task_id)
+    segments = segments.select_related('archive')
+    entries = []
+    for archive, group in groupby(segments, key=attrgetter('archive')):
+        try:
+            with open(archive_path(archive), 'rb') as file:
+                lines = [line for segment in group for line in _read_segment(file, segment)]
+        except OSError:
+            logger.exception('No se pudo leer el archivo de auditoría %s', archive.path)
+            continue
+        entries.extend(
+            AuditLogEntry(
+                id=line['id'],
+                event_id=line['event_id'],
+                task_id=line['task'],
+                user_id=line['user'],
+                action=AuditLogEntry.action_for(line['action']),
+                timestamp=parse_datetime(line['timestamp']),
+                payload=line['payload'],
+            )
+            for line in lines
+        )
+
+    # Usuarios en una sola consulta; los eliminados quedan como None
+    users = User.objects.in_bulk({entry.user_id for entry in entries})
+    user_field = AuditLogEntry._meta.get_field('user')
+    for entry in entries:
+        user_field.set_cached_value(entry, users.get(entry.user_id))
+    return entries
+
+
+class TaskHistory:
+    """
+    Historial de una tarea (entradas vivas y archivadas) que se lee por
+    tramos: admite count(), rebanadas y keyset_filter() para
+    KeysetPageNumberPagination, sin cargar todo el historial.
+
+    Las entradas vivas posteriores al último mes archivado se piden a la
+    base con LIMIT. Las anteriores (eventos tardíos de un mes ya archivado)
+    y las archivadas se combinan en memoria, solo cuando la rebanada llega
+    a ellas y leyendo únicamente los meses que pueden quedar después de la
+    posición del cursor.
+    """
+
+    def __init__(self, task_id, order=HISTORY_ORDERING, position=None):
+        self.task_id = task_id
+        self.order = tuple(order)
+        self.position = position
+        self._older = None
+
+    def keyset_filter(self, order, position):
+        """Entradas posteriores a position en el orden dado (ver KeysetPageNumberPagination)"""
+        return TaskHistory(self.task_id, order, position)
+
+    @property
+    def descending(self):
+        return self.order[0].startswith('-')
+
+    def segments(self):
+        return AuditArchiveSegment.objects.filter(task_id=self.task_id)
+
+    @cached_property
+    def bound(self):
+        """Fin del último mes archivado de la tarea; None si no tiene archivo"""
+        month = self.segments().aggregate(month=Max('archive__month'))['month']
+        return partitions.add_months(month, 1) if month else None
+
+    def live(self):
+        entries = AuditLogEntry.objects.filter(task_id=self.task_id).select_related('user').order_by(*self.order)
+        if self.position is not None:
+            entries = entries.filter(KeysetPageNumberPagination.after(self.order, self.position))
+        return entries
+
+    def newer(self):
+        entries = self.live()
+        return entries if self.bound is None else entries.filter(timestamp__gte=self.bound)
+
+    def older(self):
+        """Entradas anteriores a bound, vivas y archivadas, ordenadas"""
+        if self._older is None:
+            if self.bound is None:
+                self._older = []
+                return self._older
+            segments = self.segments()
+            if self.position is not None:
+                month = partitions.month_start(self.position[0]).date()
+                segments = segments.filter(**{f"archive__month__{'lte' if self.descending else 'gte'}": month})
+            entries = list(self.live().filter(timestamp__lt=self.bound)) + [
+                entry for entry in archived_entries(self.task_id, segments)
+                if self.position is None or KeysetPageNumberPagination.row_after(entry, self.order, self.position)
+            ]
+            self._older = KeysetPageNumberPagination.sort_rows(entries, self.order)
+        return self._older
+
+    def parts(self):
+        # Las entradas anteriores a bound van al final en orden descendente
+        return (self.newer, self.older) if self.descending else (self.older, self.newer)
+
+    def count(self):
+        if self.position is not None:
+            return self.newer().count() + len(self.older())
+        archived = self.segments().aggregate(total=Sum('entry_count'))['total'] or 0
+        return self.live().count() + archived
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            rows = self[index:index + 1]
+            if not rows:
+                raise IndexError(index)
+            return rows[0]
+        start, stop = index.start or 0, index.stop
+        rows = []
+        for part in self.parts():
+            part = part()
+            chunk = list(part[start:stop])
+            rows.extend(chunk)
+            if stop is not None and len(chunk) == stop - start:
+                break
+            # La parte terminó: lo que falta sale de la siguiente
+            size = start + len(chunk) if chunk else (len(part) if isinstance(part, list) else part.count())
+            start = max(start - size, 0)
+            stop = None if stop is None else stop - size
+        return rows
+
+
+def task_history(task_id):
+    """Historial de la tarea ordenado por (-timestamp, -id), ver TaskHistory"""
+    return TaskHistory(task_id)
+
+
+def maintain(retention_months=None):
+    """Crea las particiones de los próximos meses y archiva los vencidos"""
+    created = partitions.ensure_partitions()
+    archives = archive_expired(retention_months)
+    return created, archives
@@ -0,0 +1,172 @@
+"""
+Auditoría de tareas fuera del camino de la petición.
+
+Las vistas registran eventos estructurados con record(): código de acción,
+id del usuario, id de la tarea y los datos del cambio (JSON). El evento se
+encola al confirmar la transacción, así un cambio revertido no deja rastro.
+
+AUDIT_LOG_BACKEND:
+- 'redis': XADD a un stream de Redis (persistido antes de responder). El
+  primer evento de cada intervalo programa tasks.tasks.flush_audit_log, que
+  lee el stream con un consumer group, escribe lotes con bulk_create y
+  confirma (XACK) solo después de escribirlos. Las entradas leídas por un
+  worker que se detuvo antes de confirmarlas se recuperan con XAUTOCLAIM, y
+  event_id (único) hace que reescribirlas no duplique registros. Si Redis
+  no responde, el evento se escribe directamente. Un flush fallido se
+  reintenta y CELERY_BEAT_SCHEDULE programa además un flush periódico.
+- 'sync': se escriben al confirmar la transacción (desarrollo sin Redis).
+
+Orden: cada lote se inserta ordenado por tarea y momento del evento, y el
+historial se lee por (timestamp, id), con el timestamp de la petición.
+Se guarda el código de la acción (AuditLogEntry.Action) y los datos del
+evento en payload; el texto legible (details) se genera al leer.
+Las entradas antiguas se archivan fuera de la tabla (ver tasks.archive).
+"""
+import json
+import logging
+import os
+import socket
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLogEntry
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+STREAM = 'audit:events'
+GROUP = 'audit-writers'
+FLUSH_SCHEDULED_KEY = 'audit:flush-scheduled'
+# Entradas leídas y sin confirmar durante este tiempo se consideran abandonadas
+RECLAIM_IDLE_MS = 5 * 60 * 1000
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def record(task_id, action, actor_id, **data):
+    """Registra un evento de auditoría de la tarea al confirmar la transacción"""
+    event = {
+        'id': uuid.uuid4().hex,
+        'task': task_id,
+        'action': action,
+        'actor': actor_id,
+        'ts': timezone.now().isoformat(),
+        'data': data,
+    }
+    transaction.on_commit(lambda: enqueue(event))
+    return event
+
+
+def enqueue(event):
+    if getattr(settings, 'AUDIT_LOG_BACKEND', 'sync') != 'redis':
+        write_events([event])
+        return
+    try:
+        connection = get_redis()
+        connection.xadd(STREAM, {'event': json.dumps(event, cls=DjangoJSONEncoder)})
+        # Un solo flush programado por intervalo
+        interval = settings.AUDIT_LOG_FLUSH_INTERVAL
+        if connection.set(FLUSH_SCHEDULED_KEY, 1, nx=True, ex=max(interval * 10, 60)):
+            from .tasks import flush_audit_log
+            flush_audit_log.apply_async(countdown=interval)
+    except Exception:
+        # Sin Redis o sin broker: no perder el evento
+        logger.exception('No se pudo encolar el evento de auditoría; se escribe directamente')
+        write_events([event])
+
+
+def write_events(events):
+    """Escribe los eventos en un solo bulk_create, en orden por tarea"""
+    if not events:
+        return 0
+    events = sorted(events, key=lambda event: (event['task'], event['ts']))
+    # Los eventos de tareas ya eliminadas se conservan (task no tiene
+    # restricción); los de usuarios eliminados se descartan
+    actor_ids = set(User.objects.filter(id__in={event['actor'] for event in events}).values_list('id', flat=True))
+
+    entries = [
+        AuditLogEntry(
+            event_id=uuid.UUID(event['id']),
+            task_id=event['task'],
+            user_id=event['actor'],
+            action=AuditLogEntry.action_for(event['action']),
+            timestamp=parse_datetime(event['ts']),
+            payload=event['data'],
+        )
+        for event in events
+        if event['actor'] in actor_ids
+    ]
+    AuditLogEntry.objects.bulk_create(
+        entries, batch_size=settings.AUDIT_LOG_BATCH_SIZE, ignore_conflicts=True
+    )
+    return len(entries)
+
+
+def _consumer_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def _ensure_group(connection):
+    import redis
+    try:
+        connection.xgroup_create(STREAM, GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _write_entries(connection, entries):
+    if not entries:
+        return 0
+    ids = [entry_id for entry_id, _ in entries]
+    # Redis < 7 devuelve sin campos las entradas reclamadas que ya no existen
+    events = [json.loads(fields[b'event']) for _, fields in entries if fields]
+    written = write_events(events)
+    # Solo se confirman después de escribirlos
+    connection.xack(STREAM, GROUP, *ids)
+    connection.xdel(STREAM, *ids)
+    return written
+
+
+def flush_stream():
+    """Escribe por lotes todos los eventos pendientes del stream"""
+    connection = get_redis()
+    _ensure_group(connection)
+    # Los eventos que lleguen desde ahora programan otro flush
+    connection.delete(FLUSH_SCHEDULED_KEY)
+
+    consumer = _consumer_name()
+    batch_size = settings.AUDIT_LOG_BATCH_SIZE
+    written = 0
+
+    # Entradas de workers que se detuvieron sin confirmarlas
+    start = '0-0'
+    while True:
+        start, entries = connection.xautoclaim(
+            STREAM, GROUP, consumer, min_idle_time=RECLAIM_IDLE_MS, start_id=start, count=batch_size
+        )[:2]
+        written += _write_entries(connection, entries)
+        if start in (b'0-0', '0-0'):
+            break
+
+    while True:
+        response = connection.xreadgroup(GROUP, consumer, {STREAM: '>'}, count=batch_size)
+        if not response or not response[0][1]:
+            break
+        written += _write_entries(connection, response[0][1])
+    return written
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tasks import archive
+
+
+class Command(BaseCommand):
+    help = 'Crea las particiones de auditoría de los próximos meses y archiva los meses fuera de la retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=settings.AUDIT_LOG_RETENTION_MONTHS,
+            help='Meses de auditoría que quedan en la base'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo muestra los meses que se archivarían'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for month in archive.expired_months(options['months']):
+                self.stdout.write(f'{month:%Y-%m}')
+            return
+
+        created, archives = archive.maintain(options['months'])
+        for item in archives:
+            self.stdout.write(f'{item.month:%Y-%m}: {item.entry_count} entradas en {item.path}')
+        self.stdout.write(self.style.SUCCESS(f'{created} particiones creadas, {len(archives)} meses archivados'))
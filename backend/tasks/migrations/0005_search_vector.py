@@ -0,0 +1,47 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:44
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Índices GIN y extensión pg_trgm: solo existen en PostgreSQL, en SQLite la
+# búsqueda usa icontains (ver estudiomd_tasks.search).
+FORWARD_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    UPDATE tasks_task SET search_vector =
+        setweight(to_tsvector('spanish', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(description, '')), 'B')
+    """,
+    'CREATE INDEX IF NOT EXISTS task_search_vector_idx ON tasks_task USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS task_title_trgm_idx ON tasks_task USING gin (title gin_trgm_ops)',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS task_search_vector_idx',
+    'DROP INDEX IF EXISTS task_title_trgm_idx',
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), run_on_postgresql(REVERSE_SQL)),
+    ]
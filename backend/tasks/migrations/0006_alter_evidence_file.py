@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:52
+
+import files.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='evidence',
+            name='file',
+            field=models.FileField(storage=files.storage.blob_storage, upload_to='evidences/', verbose_name='file'),
+        ),
+    ]
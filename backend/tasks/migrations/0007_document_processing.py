@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_alter_evidence_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evidence',
+            name='detected_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='extracted_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('done', 'Procesado'), ('rejected', 'Tipo de archivo no permitido'), ('failed', 'Error al procesar')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='thumbnail',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
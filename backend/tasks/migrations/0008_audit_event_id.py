@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-17 03:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0007_document_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlogentry',
+            name='event_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='auditlogentry',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='timestamp'),
+        ),
+    ]
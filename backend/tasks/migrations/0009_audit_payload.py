@@ -0,0 +1,135 @@
+# Generated by Django 5.0.2 on 2026-10-17 03:08
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+ACTIONS = {
+    'Tarea creada': 1,
+    'Tarea actualizada': 2,
+    'Tarea eliminada': 3,
+    'Estado cambiado': 4,
+    'Evidencia subida': 5,
+    'Evidencia eliminada': 6,
+    'Evidencia descargada': 7,
+}
+LABELS = {code: label for label, code in ACTIONS.items()}
+BATCH_SIZE = 2000
+
+
+def texts_to_payload(apps, schema_editor):
+    """El texto de cada entrada existente se conserva en payload['details']"""
+    AuditLogEntry = apps.get_model('tasks', 'AuditLogEntry')
+    batch = []
+    for entry in AuditLogEntry.objects.only('id', 'action', 'details').iterator(chunk_size=BATCH_SIZE):
+        entry.action_code = ACTIONS.get(entry.action, 0)
+        entry.payload = {'details': entry.details} if entry.details else {}
+        if entry.action_code == 0:
+            entry.payload['action'] = entry.action
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            AuditLogEntry.objects.bulk_update(batch, ['action_code', 'payload'])
+            batch = []
+    AuditLogEntry.objects.bulk_update(batch, ['action_code', 'payload'])
+
+
+def payload_to_texts(apps, schema_editor):
+    AuditLogEntry = apps.get_model('tasks', 'AuditLogEntry')
+    batch = []
+    for entry in AuditLogEntry.objects.only('id', 'action_code', 'payload').iterator(chunk_size=BATCH_SIZE):
+        entry.action = LABELS.get(entry.action_code) or entry.payload.get('action', '')
+        entry.details = entry.payload.get('details', '')
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            AuditLogEntry.objects.bulk_update(batch, ['action', 'details'])
+            batch = []
+    AuditLogEntry.objects.bulk_update(batch, ['action', 'details'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_audit_event_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlogentry',
+            name='action_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auditlogentry',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='payload'),
+        ),
+        migrations.RunPython(texts_to_payload, payload_to_texts),
+        # Con valor por defecto para poder revertir la migración
+        migrations.AlterField(
+            model_name='auditlogentry',
+            name='action',
+            field=models.CharField(default='', max_length=100, verbose_name='action'),
+        ),
+        migrations.AlterField(
+            model_name='auditlogentry',
+            name='details',
+            field=models.TextField(blank=True, default='', verbose_name='details'),
+        ),
+        migrations.RemoveField(
+            model_name='auditlogentry',
+            name='details',
+        ),
+        migrations.RemoveField(
+            model_name='auditlogentry',
+            name='action',
+        ),
+        migrations.RenameField(
+            model_name='auditlogentry',
+            old_name='action_code',
+            new_name='action',
+        ),
+        migrations.AlterField(
+            model_name='auditlogentry',
+            name='action',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Otra'), (1, 'Tarea creada'), (2, 'Tarea actualizada'), (3, 'Tarea eliminada'), (4, 'Estado cambiado'), (5, 'Evidencia subida'), (6, 'Evidencia eliminada'), (7, 'Evidencia descargada')], verbose_name='action'),
+        ),
+        migrations.AlterField(
+            model_name='auditlogentry',
+            name='event_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='auditlogentry',
+            constraint=models.UniqueConstraint(fields=('event_id', 'timestamp'), name='audit_event_id_uniq'),
+        ),
+        migrations.CreateModel(
+            name='AuditArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, verbose_name='month')),
+                ('path', models.CharField(max_length=255, unique=True, verbose_name='path')),
+                ('entry_count', models.PositiveIntegerField(verbose_name='entry count')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'audit archive',
+                'verbose_name_plural': 'audit archives',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.PositiveBigIntegerField(db_index=True)),
+                ('offset', models.BigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('entry_count', models.PositiveIntegerField()),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='tasks.auditarchive')),
+            ],
+            options={
+                'ordering': ['archive_id', 'offset'],
+            },
+        ),
+    ]
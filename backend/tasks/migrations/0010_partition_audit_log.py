@@ -0,0 +1,35 @@
+from django.db import migrations
+
+from tasks import partitions
+
+
+def _tables(apps):
+    Task = apps.get_model('tasks', 'Task')
+    AuditLogEntry = apps.get_model('tasks', 'AuditLogEntry')
+    return Task._meta.db_table, AuditLogEntry._meta.get_field('user').related_model._meta.db_table
+
+
+def partition(apps, schema_editor):
+    # Solo PostgreSQL; en SQLite la auditoría queda en una tabla normal
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        partitions.partition_table(cursor, *_tables(apps))
+
+
+def unpartition(apps, schema_editor):
+    if not partitions.is_partitioned(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        partitions.unpartition_table(cursor, *_tables(apps))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0009_audit_payload'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# El texto de los PDFs de las evidencias entra en el search_vector de la
+# tarea (Task.search_vector_fields); se recalculan las tareas que ya lo tienen.
+FORWARD_SQL = [
+    """
+    UPDATE tasks_task t SET search_vector =
+        setweight(to_tsvector('spanish', coalesce(t.title, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(t.description, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(
+            (SELECT string_agg(e.extracted_text, ' ') FROM tasks_evidence e WHERE e.task_id = t.id), ''
+        )), 'D')
+    WHERE EXISTS (SELECT 1 FROM tasks_evidence e WHERE e.task_id = t.id AND e.extracted_text <> '')
+    """,
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_audit_keep_deleted_tasks'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from files.models import ProcessedDocument
+from files.storage import blob_storage
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 User = get_user_model()
@@ -46,11 +51,24 @@ class Task(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('updated at'))
+    # Documento de búsqueda full-text (solo PostgreSQL, ver estudiomd_tasks.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    search_vector_fields = {'title': 'A', 'description': 'B', 'evidences__extracted_text': 'D'}
+    search_config = 'spanish'
     
     class Meta:
         verbose_name = _('task')
         verbose_name_plural = _('tasks')
         ordering = ['-created_at']
+        indexes = [
+            # Paginación keyset (created_at, id) y orden por defecto
+            models.Index(fields=['-created_at', '-id'], name='task_created_id_idx'),
+            # Filtros por estado con vencimiento
+            models.Index(fields=['status', 'due_date'], name='task_status_due_idx'),
+            # Tareas abiertas por vencimiento (conteo de vencidas)
+            models.Index(fields=['due_date'], condition=~models.Q(status='completed'), name='task_open_due_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -67,14 +85,15 @@ class Task(models.Model):
         return delta.days
 
 
-class Evidence(models.Model):
+class Evidence(ProcessedDocument):
     task = models.ForeignKey(
         Task,
         on_delete=models.CASCADE,
         related_name='evidences',
         verbose_name=_('task')
     )
-    file = models.FileField(upload_to='evidences/', verbose_name=_('file'))
+    # Almacenamiento deduplicado por contenido (ver files.storage)
+    file = models.FileField(upload_to='evidences/', storage=blob_storage, verbose_name=_('file'))
     file_name = models.CharField(max_length=255, verbose_name=_('file name'))
     file_type = models.CharField(max_length=100, verbose_name=_('file type'))
     file_size = models.IntegerField(verbose_name=_('file size'))
@@ -86,6 +105,9 @@ class Evidence(models.Model):
     )
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name=_('uploaded at'))
     
+    declared_type_field = 'file_type'
+    search_parent = 'task'
+    
     class Meta:
         verbose_name = _('evidence')
         verbose_name_plural = _('evidences')
@@ -111,26 +133,135 @@ class Evidence(models.Model):
 
 
 class AuditLogEntry(models.Model):
+    class Action(models.IntegerChoices):
+        # Entradas anteriores a los códigos (su texto original queda en payload)
+        OTHER = 0, 'Otra'
+        TASK_CREATED = 1, 'Tarea creada'
+        TASK_UPDATED = 2, 'Tarea actualizada'
+        TASK_DELETED = 3, 'Tarea eliminada'
+        STATUS_CHANGED = 4, 'Estado cambiado'
+        EVIDENCE_UPLOADED = 5, 'Evidencia subida'
+        EVIDENCE_DELETED = 6, 'Evidencia eliminada'
+        EVIDENCE_DOWNLOADED = 7, 'Evidencia descargada'
+    
+    # Sin restricción en la base: al eliminar la tarea su historial (con el
+    # evento de eliminación) se conserva, igual que en el archivo
     task = models.ForeignKey(
         Task,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='audit_log',
         verbose_name=_('task')
     )
-    action = models.CharField(max_length=100, verbose_name=_('action'))
+    action = models.PositiveSmallIntegerField(choices=Action.choices, verbose_name=_('action'))
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='audit_actions',
         verbose_name=_('user')
     )
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name=_('timestamp'))
-    details = models.TextField(blank=True, verbose_name=_('details'))
+    # Momento del evento (no de la escritura, que puede ser diferida, ver tasks.audit)
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name=_('timestamp'))
+    # Datos del evento; el texto legible se genera al leer (details)
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder, verbose_name=_('payload'))
+    # Identificador del evento: reescribir un lote no duplica entradas
+    event_id = models.UUIDField(null=True, blank=True, editable=False)
     
     class Meta:
         verbose_name = _('audit log entry')
         verbose_name_plural = _('audit log entries')
         ordering = ['-timestamp']
+        indexes = [
+            # Historial de una tarea paginado por keyset (timestamp, id)
+            models.Index(fields=['task', '-timestamp', '-id'], name='audit_task_timestamp_id_idx'),
+        ]
+        constraints = [
+            # En PostgreSQL la tabla se particiona por mes (tasks.partitions) y
+            # las restricciones únicas deben incluir la columna de partición
+            models.UniqueConstraint(fields=['event_id', 'timestamp'], name='audit_event_id_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_action_display()} - {self.task_id} - {self.user_id}"
+    
+    @classmethod
+    def action_for(cls, code):
+        """Acción correspondiente a un código de evento ('task_created', ...)"""
+        try:
+            return cls.Action[code.upper()]
+        except KeyError:
+            return cls.Action.OTHER
+    
+    @property
+    def action_code(self):
+        return self.Action(self.action).name.lower()
+    
+    @property
+    def details(self):
+        """Descripción legible del evento, generada a partir de payload"""
+        data = self.payload or {}
+        if 'details' in data:
+            # Entradas anteriores a payload
+            return data['details']
+        email = self.user.email if self.user else ''
+        action = self.action
+        if action == self.Action.TASK_CREATED:
+            return f'Tarea "{data.get("title", "")}" creada por {email}'
+        if action == self.Action.TASK_DELETED:
+            return f'Tarea "{data.get("title", "")}" eliminada por {email}'
+        if action == self.Action.TASK_UPDATED:
+            changes = ', '.join(f'{field}: {old} → {new}' for field, (old, new) in data.get('changes', {}).items())
+            details = f'Cambios: {changes}'
+            if data.get('assigned_users') is not None:
+                details += f', usuarios asignados: {data["assigned_users"]}'
+            return details
+        if action == self.Action.STATUS_CHANGED:
+            return f'Estado cambiado de "{data.get("old", "")}" a "{data.get("new", "")}" por {email}'
+        if action == self.Action.EVIDENCE_UPLOADED:
+            return f'Archivo "{data.get("file_name", "")}" subido por {email}'
+        if action == self.Action.EVIDENCE_DELETED:
+            return f'Archivo "{data.get("file_name", "")}" eliminado por {email}'
+        if action == self.Action.EVIDENCE_DOWNLOADED:
+            return f'Archivo "{data.get("file_name", "")}" descargado por {email}'
+        return ''
+
+
+class AuditArchive(models.Model):
+    """
+    Entradas de auditoría de un mes movidas a un archivo JSONL comprimido
+    (ver tasks.archive). Un mes puede tener más de un archivo si llegaron
+    eventos después de archivarlo.
+    """
+    month = models.DateField(db_index=True, verbose_name=_('month'))
+    # Relativa a AUDIT_ARCHIVE_DIR
+    path = models.CharField(max_length=255, unique=True, verbose_name=_('path'))
+    entry_count = models.PositiveIntegerField(verbose_name=_('entry count'))
+    size = models.BigIntegerField(verbose_name=_('size'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
+    
+    class Meta:
+        verbose_name = _('audit archive')
+        verbose_name_plural = _('audit archives')
+        ordering = ['-month']
+    
+    def __str__(self):
+        return self.path
+
+
+class AuditArchiveSegment(models.Model):
+    """
+    Entradas de una tarea dentro de un archivo: un miembro gzip independiente
+    en [offset, offset + length), que se lee sin descomprimir el resto.
+    """
+    archive = models.ForeignKey(AuditArchive, on_delete=models.CASCADE, related_name='segments')
+    # Sin FK: el historial archivado se conserva aunque la tarea se elimine
+    task_id = models.PositiveBigIntegerField(db_index=True)
+    offset = models.BigIntegerField()
+    length = models.PositiveIntegerField()
+    entry_count = models.PositiveIntegerField()
+    
+    class Meta:
+        ordering = ['archive_id', 'offset']
     
     def __str__(self):
-        return f"{self.action} - {self.task.title} - {self.user.email}" 
\ No newline at end of file
+        return f"{self.archive.path} - tarea {self.task_id}" 
\ No newline at end of file
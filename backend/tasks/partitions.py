@@ -0,0 +1,172 @@
+"""
+Particionado mensual de la auditoría en PostgreSQL.
+
+tasks_auditlogentry es una tabla particionada por RANGE ("timestamp") con
+una partición por mes (tasks_auditlogentry_pAAAAMM, límites en UTC) y una
+partición DEFAULT para los eventos fuera de los meses creados. La clave
+primaria es (id, timestamp) porque PostgreSQL exige que las claves únicas
+incluyan la columna de partición; para Django la clave sigue siendo id.
+
+Las particiones de los meses siguientes se crean por adelantado
+(ensure_partitions, desde la tarea periódica maintain_audit_log) y las de
+los meses archivados se eliminan completas (DETACH + DROP), sin DELETE
+fila por fila. En SQLite la tabla es una tabla normal y estas funciones no
+hacen nada.
+
+Este módulo no importa modelos: lo usa también la migración que convierte
+la tabla.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection as default_connection
+
+TABLE = 'tasks_auditlogentry'
+DEFAULT_PARTITION = f'{TABLE}_default'
+# Meses siguientes al actual con partición ya creada
+MONTHS_AHEAD = 2
+
+
+def month_start(value):
+    """Primer instante (UTC) del mes de value"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def _literal(month):
+    return f"'{month.isoformat()}'"
+
+
+def is_partitioned(connection=None):
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def _exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    return cursor.fetchone()[0] is not None
+
+
+def create_partition(cursor, month):
+    """
+    Crea la partición del mes. Las filas del mes que estén en la partición
+    DEFAULT se mueven antes de adjuntarla (ATTACH falla si la DEFAULT tiene
+    filas del rango).
+    """
+    name = partition_name(month)
+    if _exists(cursor, name):
+        return False
+    start, end = _literal(month), _literal(add_months(month, 1))
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+        f'WHERE "timestamp" >= {start} AND "timestamp" < {end} RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    )
+    cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})')
+    return True
+
+
+def drop_partition(cursor, month):
+    """Separa y elimina la partición del mes; devuelve False si no existe"""
+    name = partition_name(month)
+    if not _exists(cursor, name):
+        return False
+    cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+    cursor.execute(f'DROP TABLE {name}')
+    return True
+
+
+def lock_partition(cursor, month):
+    """Bloquea las escrituras en la partición del mes hasta el fin de la transacción"""
+    name = partition_name(month)
+    if _exists(cursor, name):
+        cursor.execute(f'LOCK TABLE {name} IN SHARE MODE')
+
+
+def ensure_partitions(connection=None, months_ahead=MONTHS_AHEAD, now=None):
+    """Crea las particiones del mes actual y de los siguientes; devuelve cuántas creó"""
+    connection = connection or default_connection
+    if not is_partitioned(connection):
+        return 0
+    current = month_start(now or datetime.now(dt_timezone.utc))
+    created = 0
+    with connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            created += create_partition(cursor, add_months(current, offset))
+    return created
+
+
+def _add_keys(cursor, task_table, user_table, primary_key):
+    cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY ({primary_key})')
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT audit_event_id_uniq UNIQUE (event_id, "timestamp")')
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_task_id_fk FOREIGN KEY (task_id) '
+        f'REFERENCES {task_table} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk FOREIGN KEY (user_id) '
+        f'REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(f'CREATE INDEX {TABLE}_user_id_idx ON {TABLE} (user_id)')
+    cursor.execute(
+        f'CREATE INDEX audit_task_timestamp_id_idx ON {TABLE} (task_id, "timestamp" DESC, id DESC)'
+    )
+
+
+def _copy_rows(cursor, source):
+    # Columnas en el mismo orden (LIKE), id explícito: se ajusta la secuencia
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {source}')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+    )
+
+
+def partition_table(cursor, task_table, user_table, now=None):
+    """Convierte la tabla normal en particionada por mes, con sus filas"""
+    previous = f'{TABLE}_unpartitioned'
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {previous}')
+    cursor.execute(f'CREATE TABLE {TABLE} (LIKE {previous} INCLUDING CONSTRAINTS) PARTITION BY RANGE ("timestamp")')
+    cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+    cursor.execute(f'SELECT MIN("timestamp") FROM {previous}')
+    oldest = cursor.fetchone()[0]
+    last = add_months(month_start(now or datetime.now(dt_timezone.utc)), MONTHS_AHEAD)
+    month = month_start(oldest) if oldest else last
+    while month <= last:
+        create_partition(cursor, month)
+        month = add_months(month, 1)
+
+    _copy_rows(cursor, previous)
+    cursor.execute(f'DROP TABLE {previous}')
+    _add_keys(cursor, task_table, user_table, 'id, "timestamp"')
+
+
+def unpartition_table(cursor, task_table, user_table):
+    """Inverso de partition_table: vuelve a una tabla normal con las mismas filas"""
+    previous = f'{TABLE}_partitioned'
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {previous}')
+    cursor.execute(f'CREATE TABLE {TABLE} (LIKE {previous} INCLUDING CONSTRAINTS)')
+    cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    _copy_rows(cursor, previous)
+    # Elimina también las particiones
+    cursor.execute(f'DROP TABLE {previous}')
+    _add_keys(cursor, task_table, user_table, 'id')
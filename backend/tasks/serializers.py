@@ -1,38 +1,66 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.urls import reverse
+from estudiomd_tasks.fieldsets import SparseFieldsMixin
+from estudiomd_tasks.pagination import KeysetPageNumberPagination
+from files.serializers import (
+    PROCESSED_DOCUMENT_FIELDS, ChunkedUploadSerializerMixin, ProcessedDocumentSerializerMixin
+)
+from . import archive, audit
 from .models import Task, Evidence, AuditLogEntry
 
 User = get_user_model()
 
+# Columnas que usa UserSerializer (prefetch con only() en los listados)
+USER_FIELDS = ['id', 'email', 'first_name', 'last_name', 'role']
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'role']
+        fields = USER_FIELDS
         ref_name = 'TaskUser'
 
 
-class EvidenceSerializer(serializers.ModelSerializer):
+class EvidenceSerializer(SparseFieldsMixin, ChunkedUploadSerializerMixin, ProcessedDocumentSerializerMixin,
+                         serializers.ModelSerializer):
     uploaded_by = UserSerializer(read_only=True)
+    thumbnail_url = serializers.SerializerMethodField()
+    # Subida por partes ya finalizada, en lugar de 'file'
+    upload_id = serializers.UUIDField(write_only=True, required=False)
+    upload_purpose = 'evidence'
+    upload_required = True
     
     class Meta:
         model = Evidence
         fields = ['id', 'file', 'file_name', 'file_type', 'file_size', 
-                 'uploaded_by', 'uploaded_at']
+                 'uploaded_by', 'uploaded_at', 'upload_id'] + PROCESSED_DOCUMENT_FIELDS
         read_only_fields = ['id', 'file_name', 'file_type', 'file_size', 
-                           'uploaded_by', 'uploaded_at']
+                           'uploaded_by', 'uploaded_at'] + PROCESSED_DOCUMENT_FIELDS
+        extra_kwargs = {'file': {'required': False}}
+    
+    def get_upload_attrs(self, session):
+        return {
+            'file_name': session.file_name,
+            'file_type': session.content_type,
+            'file_size': session.total_size,
+        }
 
 
-class AuditLogEntrySerializer(serializers.ModelSerializer):
+class AuditLogEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    # Texto de la acción, como antes de los códigos; action_code es estable
+    action = serializers.CharField(source='get_action_display', read_only=True)
+    action_code = serializers.CharField(read_only=True)
+    details = serializers.CharField(read_only=True)
     
     class Meta:
         model = AuditLogEntry
-        fields = ['id', 'action', 'user', 'timestamp', 'details']
-        read_only_fields = ['id', 'user', 'timestamp']
+        fields = ['id', 'action', 'action_code', 'user', 'timestamp', 'details', 'payload']
+        read_only_fields = ['id', 'user', 'timestamp', 'payload']
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     assigned_to = UserSerializer(many=True, read_only=True)
     assigned_users = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -42,7 +70,6 @@ class TaskSerializer(serializers.ModelSerializer):
     )
     created_by = UserSerializer(read_only=True)
     evidences = EvidenceSerializer(many=True, read_only=True)
-    audit_log = AuditLogEntrySerializer(many=True, read_only=True)
     is_overdue = serializers.ReadOnlyField()
     days_until_due = serializers.ReadOnlyField()
     
@@ -51,9 +78,11 @@ class TaskSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'assigned_to', 'assigned_users',
             'status', 'priority', 'due_date', 'created_by', 'created_at',
-            'updated_at', 'evidences', 'audit_log', 'is_overdue', 'days_until_due'
+            'updated_at', 'evidences', 'is_overdue', 'days_until_due'
         ]
         read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
+        # Omitidos con ?expand= si no se nombran (ver estudiomd_tasks.fieldsets)
+        expandable_fields = ['evidences']
     
     def create(self, validated_data):
         # Extraer assigned_users del validated_data
@@ -67,13 +96,8 @@ class TaskSerializer(serializers.ModelSerializer):
             # Si no hay usuarios asignados, limpiar la relación
             task.assigned_to.clear()
         
-        # Crear entrada de auditoría
-        AuditLogEntry.objects.create(
-            task=task,
-            action='Tarea creada',
-            user=self.context['request'].user,
-            details=f'Tarea "{task.title}" creada por {self.context["request"].user.email}'
-        )
+        # Registrar auditoría (se escribe en segundo plano)
+        audit.record(task.id, 'task_created', self.context['request'].user.id, title=task.title)
         
         return task
     
@@ -81,11 +105,11 @@ class TaskSerializer(serializers.ModelSerializer):
         # Extraer assigned_users del validated_data
         assigned_users = validated_data.pop('assigned_users', None)
         
-        # Registrar cambios para auditoría
-        changes = []
+        # Registrar cambios para auditoría: {campo: [antes, después]}
+        changes = {}
         for field, value in validated_data.items():
             if hasattr(instance, field) and getattr(instance, field) != value:
-                changes.append(f'{field}: {getattr(instance, field)} → {value}')
+                changes[field] = [getattr(instance, field), value]
         
         # Actualizar la tarea
         for attr, value in validated_data.items():
@@ -101,19 +125,54 @@ class TaskSerializer(serializers.ModelSerializer):
         
         instance.save()
         
-        # Crear entrada de auditoría si hay cambios
+        # Registrar auditoría si hay cambios
         if changes or assigned_users is not None:
-            AuditLogEntry.objects.create(
-                task=instance,
-                action='Tarea actualizada',
-                user=self.context['request'].user,
-                details=f'Cambios: {", ".join(changes)}' + (f', usuarios asignados: {len(assigned_users) if assigned_users else 0}' if assigned_users is not None else '')
+            audit.record(
+                instance.id, 'task_updated', self.context['request'].user.id,
+                changes=changes,
+                assigned_users=len(assigned_users) if assigned_users is not None else None
             )
         
         return instance
 
 
-class TaskListSerializer(serializers.ModelSerializer):
+class TaskDetailSerializer(TaskSerializer):
+    """
+    Detalle de una tarea. El historial de auditoría se pagina: audit_log trae
+    las entradas más recientes y audit_log_next la URL (keyset) del resto en
+    tasks/<id>/audit-log/, que también incluye las entradas archivadas.
+    """
+    audit_log = serializers.SerializerMethodField()
+    audit_log_next = serializers.SerializerMethodField()
+    audit_log_page_size = 20
+    
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + ['audit_log', 'audit_log_next']
+        expandable_fields = {'evidences': [], 'audit_log': ['audit_log_next']}
+    
+    def get_audit_page(self, obj):
+        # Se calcula una vez por tarea para los dos campos
+        cache = self.context.setdefault('audit_pages', {})
+        if obj.pk not in cache:
+            entries = list(archive.task_history(obj.pk)[:self.audit_log_page_size + 1])
+            cache[obj.pk] = entries[:self.audit_log_page_size], len(entries) > self.audit_log_page_size
+        return cache[obj.pk]
+    
+    def get_audit_log(self, obj):
+        entries, _ = self.get_audit_page(obj)
+        return AuditLogEntrySerializer(entries, many=True, context=self.context).data
+    
+    def get_audit_log_next(self, obj):
+        entries, has_next = self.get_audit_page(obj)
+        if not has_next:
+            return None
+        cursor = KeysetPageNumberPagination.encode_cursor(entries[-1], archive.HISTORY_ORDERING)
+        url = f"{reverse('tasks:audit_log', kwargs={'task_id': obj.pk})}?cursor={cursor}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class TaskListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     assigned_to = UserSerializer(many=True, read_only=True)
     created_by = UserSerializer(read_only=True)
     is_overdue = serializers.ReadOnlyField()
@@ -129,7 +188,9 @@ class TaskListSerializer(serializers.ModelSerializer):
         ]
     
     def get_evidence_count(self, obj):
-        return obj.evidences.count()
+        # Los listados lo anotan con Count; sin la anotación se consulta
+        count = getattr(obj, 'evidence_count', None)
+        return obj.evidences.count() if count is None else count
 
 
 class TaskStatsSerializer(serializers.Serializer):
@@ -137,4 +198,6 @@ class TaskStatsSerializer(serializers.Serializer):
     pending = serializers.IntegerField()
     in_progress = serializers.IntegerField()
     completed = serializers.IntegerField()
-    overdue = serializers.IntegerField() 
\ No newline at end of file
+    overdue = serializers.IntegerField()
+    by_priority = serializers.ListField(child=serializers.DictField(), required=False)
+    by_assignee = serializers.ListField(child=serializers.DictField(), required=False) 
\ No newline at end of file
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from estudiomd_tasks.cache import bump_cache_version_on_commit
+from estudiomd_tasks.search import update_search_vector
+from files.processing import update_parent_search
+from .models import Task, Evidence
+
+
+@receiver(post_save, sender=Task)
+def update_task_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_vector(Task, [instance.pk])
+
+
+@receiver(post_delete, sender=Evidence)
+def update_task_search_on_evidence_delete(sender, instance, origin=None, **kwargs):
+    """El texto del PDF eliminado deja de encontrar la tarea"""
+    if (getattr(origin, 'model', None) or type(origin)) is not Task:
+        update_parent_search(instance)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Evidence)
+@receiver(post_delete, sender=Evidence)
+def invalidate_cache_on_task_change(sender, **kwargs):
+    """Invalida estadísticas y listas de tareas cacheadas"""
+    bump_cache_version_on_commit('tasks')
+
+
+@receiver(m2m_changed, sender=Task.assigned_to.through)
+def invalidate_cache_on_assignment_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_cache_version_on_commit('tasks')
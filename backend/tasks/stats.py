@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from estudiomd_tasks.cache import get_cache_version
+from .models import Task
+
+
+def get_task_queryset(user):
+    if user.is_admin:
+        return Task.objects.all()
+    return Task.objects.filter(assigned_to=user)
+
+
+def compute_task_stats(queryset, assignee=None):
+    """
+    Conteos por estado en un único aggregate con Count(filter=...), más
+    desgloses por prioridad y por usuario asignado (una consulta agrupada cada uno).
+
+    Si el queryset ya está filtrado por un usuario asignado (assignee), el
+    desglose por usuario es solo ese usuario con los conteos totales: un
+    segundo join con assigned_to listaría a los coasignados de sus tareas.
+    """
+    now = timezone.now()
+    open_tasks = Q(status__in=['pending', 'in-progress'])
+    counts = {
+        'total': Count('id'),
+        'pending': Count('id', filter=Q(status='pending')),
+        'in_progress': Count('id', filter=Q(status='in-progress')),
+        'completed': Count('id', filter=Q(status='completed')),
+        'overdue': Count('id', filter=open_tasks & Q(due_date__lt=now)),
+    }
+
+    stats = queryset.aggregate(**counts)
+    stats['by_priority'] = list(
+        queryset.values('priority').annotate(**counts).order_by('priority')
+    )
+
+    if assignee is not None:
+        stats['by_assignee'] = [{
+            **{name: stats[name] for name in counts},
+            'user_id': assignee.id,
+            'email': assignee.email,
+            'name': f'{assignee.first_name} {assignee.last_name}'.strip(),
+        }] if stats['total'] else []
+        return stats
+
+    stats['by_assignee'] = list(
+        queryset.filter(assigned_to__isnull=False).values(
+            'assigned_to__id', 'assigned_to__email', 'assigned_to__first_name', 'assigned_to__last_name'
+        ).annotate(**counts).order_by('assigned_to__email')
+    )
+    for row in stats['by_assignee']:
+        row['user_id'] = row.pop('assigned_to__id')
+        row['email'] = row.pop('assigned_to__email')
+        row['name'] = f"{row.pop('assigned_to__first_name')} {row.pop('assigned_to__last_name')}".strip()
+    return stats
+
+
+def get_task_stats(user):
+    """
+    Estadísticas de tareas del usuario (todas si es admin), cacheadas por
+    rol/usuario. La versión del ámbito 'tasks' se incrementa cuando cambia
+    cualquier Task, y el tiempo de vida acota el desfase de los conteos de
+    tareas vencidas.
+    """
+    scope = 'admin' if user.is_admin else f'worker:{user.id}'
+    version = get_cache_version('tasks')
+    key = f'task_stats:{scope}:v{version}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_task_stats(get_task_queryset(user), None if user.is_admin else user)
+        cache.set(key, stats, getattr(settings, 'TASK_STATS_CACHE_TIMEOUT', 60))
+    return stats
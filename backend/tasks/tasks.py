@@ -0,0 +1,35 @@
+from celery import shared_task
+from celery.signals import worker_ready
+from django.conf import settings
+
+from . import archive, audit
+
+
+@shared_task(
+    bind=True, ignore_result=True, acks_late=True, max_retries=5,
+    default_retry_delay=audit.RECLAIM_IDLE_MS // 1000
+)
+def flush_audit_log(self):
+    """Escribe por lotes los eventos de auditoría encolados en Redis (ver tasks.audit)"""
+    if getattr(settings, 'AUDIT_LOG_BACKEND', 'sync') != 'redis':
+        return 0
+    try:
+        return audit.flush_stream()
+    except Exception as e:
+        # Las entradas ya leídas quedan pendientes en el stream; pasado
+        # RECLAIM_IDLE_MS el reintento las recupera con XAUTOCLAIM
+        raise self.retry(exc=e)
+
+
+@shared_task(ignore_result=True)
+def maintain_audit_log():
+    """Crea las particiones de los próximos meses y archiva los meses vencidos (ver tasks.archive)"""
+    created, archives = archive.maintain()
+    return {'partitions': created, 'archives': [item.path for item in archives]}
+
+
+@worker_ready.connect
+def flush_pending_audit_events(**kwargs):
+    # Eventos que quedaron en el stream al detenerse los workers
+    if getattr(settings, 'AUDIT_LOG_BACKEND', 'sync') == 'redis':
+        flush_audit_log.delay()
@@ -0,0 +1,484 @@
+import base64
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from operator import attrgetter
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from estudiomd_tasks.pagination import KeysetPageNumberPagination
+from . import archive, audit, partitions
+from .models import AuditArchive, AuditArchiveSegment, AuditLogEntry, Task
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Los planes de consulta solo se verifican en PostgreSQL')
+class QueryPlanTests(TestCase):
+    """
+    Regresión de planes de las consultas de tareas y auditoría (ver
+    clients.tests.QueryPlanTests): se desactiva el seq scan para ver qué
+    índice elegiría el planificador.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='plan', email='plan@example.com', password='plan', role='admin'
+        )
+        cls.task = Task.objects.create(
+            title='Tarea', description='...', due_date=timezone.now() - timedelta(days=1), created_by=cls.user
+        )
+        AuditLogEntry.objects.create(task=cls.task, action=AuditLogEntry.Action.TASK_CREATED, user=cls.user)
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f'Se esperaba {" o ".join(index_names)} en el plan:\n{plan}'
+        )
+
+    def test_task_list_order(self):
+        self.assertUsesIndex(Task.objects.order_by('-created_at', '-id')[:20], 'task_created_id_idx')
+
+    def test_overdue_tasks(self):
+        queryset = Task.objects.filter(due_date__lt=timezone.now()).exclude(status='completed')
+        self.assertUsesIndex(queryset, 'task_open_due_idx')
+
+    def test_tasks_by_status_and_due_date(self):
+        queryset = Task.objects.filter(status='pending', due_date__lt=timezone.now())
+        self.assertUsesIndex(queryset, 'task_status_due_idx')
+
+    def test_task_audit_log(self):
+        queryset = AuditLogEntry.objects.filter(task=self.task).order_by('-timestamp', '-id')[:20]
+        self.assertUsesIndex(queryset, 'audit_task_timestamp_id_idx')
+
+
+@override_settings(AUDIT_LOG_BACKEND='sync')
+class AuditPipelineTests(TestCase):
+    """Eventos de auditoría: al confirmar, sin duplicados y sin perderlos si falla Redis"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='auditor', email='auditor@example.com', password='auditor', role='admin'
+        )
+        cls.task = Task.objects.create(
+            title='Tarea', description='...', due_date=timezone.now(), created_by=cls.user
+        )
+
+    def event(self, new='completed', actor=None):
+        # record() solo encola al confirmar: fuera de execute=True no se escribe
+        with self.captureOnCommitCallbacks():
+            return audit.record(self.task.id, 'status_changed', (actor or self.user).id, old='pending', new=new)
+
+    def test_written_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            audit.record(self.task.id, 'status_changed', self.user.id, old='pending', new='completed')
+            self.assertFalse(AuditLogEntry.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        entry = AuditLogEntry.objects.get()
+        self.assertEqual(entry.action, AuditLogEntry.Action.STATUS_CHANGED)
+        self.assertEqual(entry.payload, {'old': 'pending', 'new': 'completed'})
+
+    def test_rolled_back_event_is_not_written(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                audit.record(self.task.id, 'status_changed', self.user.id, old='pending', new='completed')
+                raise DatabaseError
+        self.assertEqual(callbacks, [])
+        self.assertFalse(AuditLogEntry.objects.exists())
+
+    def test_replayed_batch_is_written_once(self):
+        events = [self.event('in-progress'), self.event('completed')]
+        audit.write_events(events)
+        audit.write_events(events)
+        self.assertEqual(
+            sorted(AuditLogEntry.objects.values_list('payload__new', flat=True)), ['completed', 'in-progress']
+        )
+
+    def test_events_of_deleted_users_are_dropped(self):
+        actor = User.objects.create_user(username='baja', email='baja@example.com', password='baja', role='worker')
+        events = [self.event('in-progress', actor), self.event('completed')]
+        actor.delete()
+        self.assertEqual(audit.write_events(events), 1)
+        self.assertEqual(AuditLogEntry.objects.get().user, self.user)
+
+    @override_settings(AUDIT_LOG_BACKEND='redis')
+    def test_redis_down_writes_synchronously(self):
+        import redis
+        connection = mock.Mock()
+        connection.xadd.side_effect = redis.ConnectionError
+        with mock.patch.object(audit, '_redis', connection), self.assertLogs('tasks.audit', 'ERROR'):
+            audit.enqueue(self.event())
+        self.assertEqual(AuditLogEntry.objects.count(), 1)
+
+    def test_ack_only_after_write(self):
+        event = self.event()
+        entries = [(b'1-0', {b'event': json.dumps(event).encode()})]
+        connection = mock.Mock()
+
+        with mock.patch.object(audit, 'write_events', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                audit._write_entries(connection, entries)
+        connection.xack.assert_not_called()
+        connection.xdel.assert_not_called()
+
+        connection.xack.side_effect = lambda *args: self.assertEqual(AuditLogEntry.objects.count(), 1)
+        self.assertEqual(audit._write_entries(connection, entries), 1)
+        connection.xack.assert_called_once_with(audit.STREAM, audit.GROUP, b'1-0')
+        connection.xdel.assert_called_once_with(audit.STREAM, b'1-0')
+
+
+class TaskListPaginationTests(APITestCase):
+    """Modos de KeysetPageNumberPagination sobre la lista de tareas ('-created_at', '-id')"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='paginas', email='paginas@example.com', password='paginas', role='admin'
+        )
+        cls.tasks = [
+            Task.objects.create(
+                title=f'Tarea {i}', description='...', due_date=utc(2030, 1, 1), created_by=cls.user
+            )
+            for i in range(5)
+        ]
+        # Dos tareas con el mismo created_at: el empate se resuelve por id
+        for task, created_at in zip(cls.tasks, [utc(2024, 1, 1), utc(2024, 1, 2), utc(2024, 1, 2), utc(2024, 1, 3)]):
+            Task.objects.filter(pk=task.pk).update(created_at=created_at)
+        cls.expected = [task.id for task in sorted(
+            Task.objects.all(), key=attrgetter('created_at', 'id'), reverse=True
+        )]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, data):
+        return [row['id'] for row in data['results']]
+
+    def test_cursor_round_trip(self):
+        pages = [self.get('/api/v1/tasks/?cursor=&page_size=2')]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        self.assertEqual(
+            [self.ids(page) for page in pages], [self.expected[0:2], self.expected[2:4], self.expected[4:]]
+        )
+        self.assertNotIn('count', pages[0])
+        self.assertIsNone(pages[0]['previous'])
+
+        backwards = [pages[-1]]
+        while backwards[-1]['previous']:
+            backwards.append(self.get(backwards[-1]['previous']))
+        self.assertEqual([self.ids(page) for page in backwards], [self.ids(page) for page in reversed(pages)])
+        self.assertEqual(backwards[-1]['next'], pages[0]['next'])
+
+    def test_invalid_cursor(self):
+        wrong_length = base64.urlsafe_b64encode(json.dumps({'p': [1]}).encode()).decode()
+        for cursor in ('no-es-un-cursor', wrong_length):
+            response = self.client.get(f'/api/v1/tasks/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_without_count(self):
+        first = self.get('/api/v1/tasks/?count=false&page_size=2')
+        self.assertEqual(list(first), ['next', 'previous', 'results'])
+        self.assertEqual(self.ids(first), self.expected[:2])
+        self.assertIn('count=false', first['next'])
+        last = self.get(self.get(first['next'])['next'])
+        self.assertEqual(self.ids(last), self.expected[4:])
+        self.assertIsNone(last['next'])
+        self.assertEqual(self.client.get('/api/v1/tasks/?count=false&page=4&page_size=2').status_code, 404)
+
+        counted = self.get('/api/v1/tasks/?page_size=2')
+        self.assertEqual(counted['count'], 5)
+
+    @skipUnless(connection.vendor == 'postgresql', 'La búsqueda ordena por relevancia solo en PostgreSQL')
+    def test_search_falls_back_to_page_numbers(self):
+        # El orden por relevancia no se puede seguir con un cursor
+        data = self.get('/api/v1/tasks/?search=tarea&cursor=&page_size=2')
+        self.assertEqual(len(data['results']), 2)
+        self.assertNotIn('cursor=', data['next'])
+        self.assertIn('count=false', data['next'])
+        self.assertIn('page=2', data['next'])
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class ArchiveTestMixin:
+    """Usuario, dos tareas y un AUDIT_ARCHIVE_DIR temporal"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='auditor', email='auditor@example.com', password='auditor', role='admin'
+        )
+        cls.task, cls.other = [
+            Task.objects.create(title=title, description='...', due_date=utc(2030, 1, 1), created_by=cls.user)
+            for title in ('Tarea', 'Otra')
+        ]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = self.settings(AUDIT_ARCHIVE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def entry(self, timestamp, new, task=None):
+        return AuditLogEntry.objects.create(
+            task=task or self.task, user=self.user, action=AuditLogEntry.Action.STATUS_CHANGED,
+            timestamp=timestamp, payload={'old': 'pending', 'new': new}
+        )
+
+    def fields(self, entries):
+        return [
+            (entry.id, entry.task_id, entry.user_id, entry.action, entry.timestamp, entry.payload)
+            for entry in entries
+        ]
+
+
+class ArchiveTests(ArchiveTestMixin, TestCase):
+
+    def test_expired_months(self):
+        self.entry(utc(2024, 1, 10), 'enero')
+        self.entry(utc(2024, 3, 10), 'marzo')
+        months = archive.expired_months(12, now=utc(2025, 6, 15))
+        self.assertEqual(months, [utc(2024, month, 1) for month in range(1, 6)])
+        self.assertEqual(archive.expired_months(0, now=utc(2025, 6, 15)), [])
+        self.assertEqual(archive.expired_months(24, now=utc(2025, 6, 15)), [])
+
+    def test_archive_month(self):
+        january = [
+            self.entry(utc(2024, 1, day, 10, 0, 0, 123456), f'enero-{day}', task)
+            for day in (5, 6) for task in (self.task, self.other)
+        ]
+        february = self.entry(utc(2024, 2, 1), 'febrero')
+
+        item = archive.archive_month(utc(2024, 1, 1))
+        self.assertEqual(
+            (item.month.isoformat(), item.path, item.entry_count), ('2024-01-01', '2024/2024-01.jsonl.gz', 4)
+        )
+        self.assertEqual(list(AuditLogEntry.objects.values_list('id', flat=True)), [february.id])
+
+        # Un miembro gzip por tarea; el archivo completo es un .jsonl.gz normal
+        segments = list(AuditArchiveSegment.objects.filter(archive=item).order_by('offset'))
+        self.assertEqual(
+            [(segment.task_id, segment.entry_count) for segment in segments], [(self.task.id, 2), (self.other.id, 2)]
+        )
+        self.assertEqual(segments[1].offset, segments[0].length)
+        with gzip.open(archive.archive_path(item), 'rt') as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 4)
+
+        expected = sorted((entry for entry in january if entry.task_id == self.task.id), key=attrgetter('timestamp'))
+        self.assertEqual(self.fields(archive.archived_entries(self.task.id)), self.fields(expected))
+        self.assertEqual(archive.archived_entries(self.task.id)[0].user, self.user)
+
+        self.assertIsNone(archive.archive_month(utc(2024, 1, 1)))
+
+    def test_late_events_are_archived_again(self):
+        self.entry(utc(2024, 1, 5), 'enero')
+        archive.archive_month(utc(2024, 1, 1))
+        self.entry(utc(2024, 1, 20), 'tardío')
+
+        archives = archive.archive_expired(12, now=utc(2025, 6, 15))
+        self.assertEqual([item.month for item in archives], [utc(2024, 1, 1).date()])
+        self.assertEqual(
+            sorted(AuditArchive.objects.values_list('path', flat=True)),
+            ['2024/2024-01.2.jsonl.gz', '2024/2024-01.jsonl.gz']
+        )
+        self.assertFalse(AuditLogEntry.objects.exists())
+        self.assertEqual([entry.payload['new'] for entry in archive.task_history(self.task.id)], ['tardío', 'enero'])
+
+
+class TaskHistoryTests(ArchiveTestMixin, APITestCase):
+    """
+    task_history combina entradas vivas y archivadas en el mismo orden que
+    la lista completa, y solo lee los archivos cuando la página llega a ellos.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        for month in (1, 2):
+            for day in (3, 8, 13, 18):
+                self.entry(utc(2024, month, day), f'{month}-{day}')
+        self.entry(utc(2024, 2, 3), 'otra tarea', self.other)
+        archive.archive_month(utc(2024, 1, 1))
+        archive.archive_month(utc(2024, 2, 1))
+        # Eventos tardíos de meses archivados, entre las entradas archivadas
+        self.entry(utc(2024, 2, 10), 'tardío febrero')
+        self.entry(utc(2024, 1, 1), 'tardío enero')
+        now = timezone.now()
+        for hour in range(7):
+            self.entry(now - timedelta(hours=hour), f'vivo-{hour}')
+
+        entries = list(AuditLogEntry.objects.filter(task=self.task)) + archive.archived_entries(self.task.id)
+        self.expected = [entry.id for entry in sorted(entries, key=attrgetter('timestamp', 'id'), reverse=True)]
+        self.url = f'/api/v1/tasks/{self.task.id}/audit-log/'
+
+    def ids(self, rows):
+        return [row['id'] if isinstance(row, dict) else row.id for row in rows]
+
+    def follow(self, url, key='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append(response.data)
+            url = response.data[key]
+        return pages
+
+    def test_slices_and_count(self):
+        history = archive.task_history(self.task.id)
+        self.assertEqual(len(self.expected), 17)
+        self.assertEqual(history.count(), 17)
+        self.assertEqual(self.ids(history), self.expected)
+        for start in range(18):
+            for stop in range(start, 19):
+                self.assertEqual(self.ids(history[start:stop]), self.expected[start:stop], (start, stop))
+        self.assertEqual(history[16].id, self.expected[16])
+        with self.assertRaises(IndexError):
+            history[17]
+
+    def test_keyset_filter(self):
+        history = archive.task_history(self.task.id)
+        entries = list(history)
+        ascending = [KeysetPageNumberPagination.invert(field) for field in archive.HISTORY_ORDERING]
+        for index, entry in enumerate(entries):
+            position = [entry.timestamp, entry.id]
+            after = history.keyset_filter(archive.HISTORY_ORDERING, position)
+            self.assertEqual(self.ids(after[0:None]), self.expected[index + 1:])
+            self.assertEqual(after.count(), 16 - index)
+            before = history.keyset_filter(ascending, position)
+            self.assertEqual(self.ids(before[0:None]), self.expected[:index][::-1])
+
+    def test_live_pages_do_not_read_archives(self):
+        with mock.patch.object(archive, '_read_segment', side_effect=AssertionError('Se leyó un archivo')):
+            self.assertEqual(self.ids(archive.task_history(self.task.id)[0:7]), self.expected[:7])
+            first = self.client.get(f'{self.url}?cursor=&page_size=3').data
+            second = self.client.get(first['next']).data
+            self.assertEqual(self.ids(second['results']), self.expected[3:6])
+            self.assertEqual(self.ids(self.client.get(second['previous']).data['results']), self.expected[:3])
+            response = self.client.get(f'{self.url}?page_size=5')
+            self.assertEqual(response.data['count'], 17)
+            self.assertEqual(self.ids(response.data['results']), self.expected[:5])
+
+    def test_pagination_modes(self):
+        for size in (1, 3, 4, 16, 17, 100):
+            pages = self.follow(f'{self.url}?cursor=&page_size={size}')
+            self.assertEqual([row for page in pages for row in self.ids(page['results'])], self.expected, size)
+            backwards = self.follow(pages[-1]['previous'], 'previous') if pages[-1]['previous'] else []
+            rows = [row for page in reversed(backwards) for row in self.ids(page['results'])]
+            self.assertEqual(rows + self.ids(pages[-1]['results']), self.expected, size)
+            for mode in ('count=false', 'page=1'):
+                pages = self.follow(f'{self.url}?{mode}&page_size={size}')
+                rows = [row for page in pages for row in self.ids(page['results'])]
+                self.assertEqual(rows, self.expected, (mode, size))
+
+        response = self.client.get(f'{self.url}?page=3&page_size=5')
+        self.assertEqual(self.ids(response.data['results']), self.expected[10:15])
+
+    def test_task_detail_first_page(self):
+        response = self.client.get(f'/api/v1/tasks/{self.task.id}/')
+        self.assertEqual(self.ids(response.data['audit_log']), self.expected)
+        self.assertIsNone(response.data['audit_log_next'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'El particionado de la auditoría solo existe en PostgreSQL')
+class PartitionMigrationTests(TransactionTestCase):
+    """0009 → 0010 → 0009 con filas: la tabla, sus claves e índices se rehacen a mano"""
+
+    before = [('tasks', '0009_audit_payload')]
+    after = [('tasks', '0010_partition_audit_log')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, task_id, user_id, action, "timestamp", event_id::text FROM {partitions.TABLE} ORDER BY id'
+            )
+            return cursor.fetchall()
+
+    def constraints(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT conname FROM pg_constraint c JOIN pg_class t ON t.oid = c.conrelid WHERE t.relname = %s',
+                [partitions.TABLE]
+            )
+            constraints = {row[0] for row in cursor.fetchall()}
+            cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [partitions.TABLE])
+            return constraints | {row[0] for row in cursor.fetchall()}
+
+    def insert(self, task_id, user_id, timestamp, event_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {partitions.TABLE} (task_id, user_id, action, "timestamp", payload, event_id) '
+                "VALUES (%s, %s, 1, %s, '{}', %s) RETURNING id",
+                [task_id, user_id, timestamp, event_id]
+            )
+            return cursor.fetchone()[0]
+
+    def test_partition_and_back(self):
+        self.migrate(self.before)
+        user = User.objects.create_user(username='particion', email='particion@example.com', password='x', role='admin')
+        task = Task.objects.create(title='Tarea', description='...', due_date=utc(2030, 1, 1), created_by=user)
+        now = timezone.now()
+        events = ['00000000-0000-0000-0000-%012d' % index for index in range(3)]
+        for timestamp, event_id in zip((utc(2024, 1, 5), utc(2024, 3, 5), now), events):
+            self.insert(task.id, user.id, timestamp, event_id)
+        rows = self.rows()
+
+        self.migrate(self.after)
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(self.rows(), rows)
+        with connection.cursor() as cursor:
+            for month in (utc(2024, 1, 1), utc(2024, 2, 1), partitions.add_months(partitions.month_start(now), 2)):
+                self.assertTrue(partitions._exists(cursor, partitions.partition_name(month)), month)
+            self.assertTrue(partitions._exists(cursor, partitions.DEFAULT_PARTITION))
+        self.assertLessEqual(
+            {'audit_event_id_uniq', f'{partitions.TABLE}_task_id_fk', f'{partitions.TABLE}_user_id_fk',
+             f'{partitions.TABLE}_user_id_idx', 'audit_task_timestamp_id_idx'},
+            self.constraints()
+        )
+        # La identidad sigue después del último id copiado y la unicidad de event_id se mantiene
+        self.assertGreater(self.insert(task.id, user.id, now, None), rows[-1][0])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.insert(task.id, user.id, utc(2024, 1, 5), events[0])
+        rows = self.rows()
+
+        self.migrate(self.before)
+        self.assertFalse(partitions.is_partitioned())
+        self.assertEqual(self.rows(), rows)
+        self.assertLessEqual({'audit_event_id_uniq', 'audit_task_timestamp_id_idx'}, self.constraints())
+        self.assertGreater(self.insert(task.id, user.id, now, None), rows[-1][0])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.insert(task.id, user.id, utc(2024, 1, 5), events[0])
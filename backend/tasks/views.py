@@ -3,30 +3,64 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count
-from django.utils import timezone
+from django.db.models import Count, Max, Prefetch
+from django.contrib.auth import get_user_model
+from . import archive, audit
 from .models import Task, Evidence, AuditLogEntry
+from .stats import get_task_stats
 from .serializers import (
-    TaskSerializer, TaskListSerializer, TaskStatsSerializer,
+    USER_FIELDS, TaskSerializer, TaskDetailSerializer, TaskListSerializer, TaskStatsSerializer,
     EvidenceSerializer, AuditLogEntrySerializer
 )
 from users.permissions import IsAdminUser, IsWorkerOrAdmin, PublicReadOnlyOrAuthenticated
+from estudiomd_tasks.cache import CachedResponseMixin
+from estudiomd_tasks.conditional import ConditionalGetMixin, latest
+from estudiomd_tasks.fieldsets import Fieldset, SparseFieldsViewMixin
+from estudiomd_tasks.pagination import KeysetPageNumberPagination
+from estudiomd_tasks.search import RankedSearchFilter
+from files.processing import schedule_processing
 
+User = get_user_model()
 
-class TaskListView(generics.ListCreateAPIView):
+
+def task_list_queryset(fieldset=None):
+    """
+    Tareas para los listados (TaskListSerializer): sin evidencias ni
+    auditoría, con el conteo de evidencias anotado y los usuarios asignados
+    solo con las columnas que se serializan. Con un Fieldset (?fields=) solo
+    se hacen el join, el prefetch y el conteo de los campos pedidos.
+    """
+    fieldset = fieldset or Fieldset(TaskListSerializer)
+    # Las consultas con GROUP BY no aplican Meta.ordering: el orden va explícito
+    queryset = Task.objects.defer('search_vector').order_by('-created_at', '-id')
+    if fieldset.includes('created_by'):
+        queryset = queryset.select_related('created_by')
+    if fieldset.includes('assigned_to'):
+        queryset = queryset.prefetch_related(Prefetch('assigned_to', queryset=User.objects.only(*USER_FIELDS)))
+    if fieldset.includes('evidence_count'):
+        queryset = queryset.annotate(evidence_count=Count('evidences', distinct=True))
+    return queryset
+
+
+class TaskListView(CachedResponseMixin, SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = TaskListSerializer
+    # Las respuestas GET se cachean por rol (y por usuario para trabajadores)
+    cache_endpoint = 'tasks'
+    cache_scopes = ('tasks',)
+    cache_per_user = True
     permission_classes = [PublicReadOnlyOrAuthenticated]
-    filter_backends = [DjangoFilterBackend]
+    # ?cursor= para paginación keyset, ?count=false para scroll infinito
+    pagination_class = KeysetPageNumberPagination
+    keyset_ordering = ('-created_at', '-id')
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter]
     filterset_fields = ['status', 'priority', 'created_by']
-    search_fields = ['title', 'description']
+    search_fields = ['title', 'description', 'evidences__extracted_text']
+    search_trigram_fields = ['title']
     ordering_fields = ['created_at', 'due_date', 'priority']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        # Base queryset con prefetch de relaciones
-        base_queryset = Task.objects.select_related('created_by').prefetch_related(
-            'assigned_to', 'evidences', 'audit_log'
-        )
+        base_queryset = task_list_queryset(self.get_fieldset())
         
         # Para usuarios autenticados, filtrar según su rol
         if self.request.user.is_authenticated:
@@ -48,15 +82,37 @@ class TaskListView(generics.ListCreateAPIView):
         serializer.save(created_by=self.request.user)
 
 
-class TaskDetailView(generics.RetrieveUpdateDestroyAPIView):
-    serializer_class = TaskSerializer
+class TaskDetailView(ConditionalGetMixin, SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = TaskDetailSerializer
     permission_classes = [IsWorkerOrAdmin]
     
+    def get_validator(self, request, pk):
+        """Última modificación y huella de la tarea, sus evidencias y su auditoría"""
+        tasks = Task.objects.filter(pk=pk)
+        if not request.user.is_admin:
+            tasks = tasks.filter(assigned_to=request.user)
+        task_updated_at = tasks.values_list('updated_at', flat=True).first()
+        if task_updated_at is None:
+            return None
+        
+        evidences = Evidence.objects.filter(task_id=pk).aggregate(last=Max('uploaded_at'), count=Count('id'))
+        audit = AuditLogEntry.objects.filter(task_id=pk).aggregate(last=Max('timestamp'), count=Count('id'))
+        last_modified = latest(task_updated_at, evidences['last'], audit['last'])
+        return last_modified, f"{evidences['count']}|{audit['count']}|{last_modified}"
+    
     def get_queryset(self):
-        # Base queryset con prefetch de relaciones
-        base_queryset = Task.objects.select_related('created_by').prefetch_related(
-            'assigned_to', 'evidences', 'audit_log'
-        )
+        # La auditoría se pagina en TaskDetailSerializer, no se precarga
+        base_queryset = Task.objects.all()
+        if self.field_requested('created_by'):
+            base_queryset = base_queryset.select_related('created_by')
+        if self.field_requested('assigned_to'):
+            base_queryset = base_queryset.prefetch_related(
+                Prefetch('assigned_to', queryset=User.objects.only(*USER_FIELDS))
+            )
+        if self.field_requested('evidences'):
+            base_queryset = base_queryset.prefetch_related(
+                Prefetch('evidences', queryset=Evidence.objects.select_related('uploaded_by'))
+            )
         
         user = self.request.user
         if user.role == 'admin':
@@ -65,54 +121,32 @@ class TaskDetailView(generics.RetrieveUpdateDestroyAPIView):
             return base_queryset.filter(assigned_to=user)
     
     def perform_destroy(self, instance):
-        # Crear entrada de auditoría antes de eliminar
-        AuditLogEntry.objects.create(
-            task=instance,
-            action='Tarea eliminada',
-            user=self.request.user,
-            details=f'Tarea "{instance.title}" eliminada por {self.request.user.email}'
-        )
+        # Registrar auditoría antes de eliminar
+        audit.record(instance.id, 'task_deleted', self.request.user.id, title=instance.title)
         instance.delete()
 
 
-class MyTasksView(generics.ListAPIView):
+class MyTasksView(SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = TaskListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
+    pagination_class = KeysetPageNumberPagination
+    keyset_ordering = ('-created_at', '-id')
+    filter_backends = [DjangoFilterBackend, RankedSearchFilter]
     filterset_fields = ['status', 'priority']
-    search_fields = ['title', 'description']
+    search_fields = ['title', 'description', 'evidences__extracted_text']
+    search_trigram_fields = ['title']
     ordering_fields = ['created_at', 'due_date', 'priority']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return Task.objects.select_related('created_by').prefetch_related(
-            'assigned_to', 'evidences', 'audit_log'
-        ).filter(assigned_to=self.request.user)
+        return task_list_queryset(self.get_fieldset()).filter(assigned_to=self.request.user)
 
 
 class TaskStatsView(APIView):
     permission_classes = [IsWorkerOrAdmin]
     
     def get(self, request):
-        user = request.user
-        
-        if user.is_admin:
-            queryset = Task.objects.all()
-        else:
-            queryset = Task.objects.filter(assigned_to=user)
-        
-        now = timezone.now()
-        
-        stats = {
-            'total': queryset.count(),
-            'pending': queryset.filter(status='pending').count(),
-            'in_progress': queryset.filter(status='in-progress').count(),
-            'completed': queryset.filter(status='completed').count(),
-            'overdue': queryset.filter(
-                due_date__lt=now,
-                status__in=['pending', 'in-progress']
-            ).count(),
-        }
+        stats = get_task_stats(request.user)
         
         serializer = TaskStatsSerializer(stats)
         return Response(serializer.data)
@@ -140,26 +174,26 @@ class EvidenceUploadView(generics.CreateAPIView):
             task=task,
             uploaded_by=self.request.user
         )
+        # Tipo real, miniatura y texto se obtienen en segundo plano (Celery)
+        schedule_processing(serializer.instance)
         
-        # Crear entrada de auditoría
-        AuditLogEntry.objects.create(
-            task=task,
-            action='Evidencia subida',
-            user=self.request.user,
-            details=f'Archivo "{serializer.instance.file_name}" subido por {self.request.user.email}'
-        )
+        # Registrar auditoría (se escribe en segundo plano)
+        audit.record(task.id, 'evidence_uploaded', self.request.user.id, file_name=serializer.instance.file_name)
 
 
-class EvidenceListView(generics.ListAPIView):
+class EvidenceListView(SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = EvidenceSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         task_id = self.kwargs.get('task_id')
-        return Evidence.objects.filter(task_id=task_id)
+        queryset = Evidence.objects.filter(task_id=task_id)
+        if self.field_requested('uploaded_by'):
+            queryset = queryset.select_related('uploaded_by')
+        return queryset
 
 
-class EvidenceDetailView(generics.RetrieveDestroyAPIView):
+class EvidenceDetailView(SparseFieldsViewMixin, generics.RetrieveDestroyAPIView):
     serializer_class = EvidenceSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -168,13 +202,8 @@ class EvidenceDetailView(generics.RetrieveDestroyAPIView):
         return Evidence.objects.filter(task_id=task_id)
     
     def perform_destroy(self, instance):
-        # Crear entrada de auditoría
-        AuditLogEntry.objects.create(
-            task=instance.task,
-            action='Evidencia eliminada',
-            user=self.request.user,
-            details=f'Archivo "{instance.file_name}" eliminado por {self.request.user.email}'
-        )
+        # Registrar auditoría
+        audit.record(instance.task_id, 'evidence_deleted', self.request.user.id, file_name=instance.file_name)
         instance.delete()
 
 
@@ -182,10 +211,8 @@ class EvidenceDownloadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, task_id, pk):
-        from django.http import HttpResponse, Http404
-        from django.conf import settings
-        import os
-        import mimetypes
+        from django.http import Http404
+        from files.downloads import serve_file
         
         # Verificar permisos: solo admin puede descargar evidencias
         if request.user.role != 'admin':
@@ -197,42 +224,33 @@ class EvidenceDownloadView(APIView):
         except Evidence.DoesNotExist:
             raise Http404('Evidencia no encontrada')
         
-        # Obtener la ruta del archivo
-        file_path = evidence.file.path
-        
-        if not os.path.exists(file_path):
+        if not evidence.file.storage.exists(evidence.file.name):
             raise Http404('Archivo no encontrado en el servidor')
         
-        # Determinar el tipo MIME
-        content_type, _ = mimetypes.guess_type(file_path)
-        if not content_type:
-            content_type = 'application/octet-stream'
+        # La auditoría se registra al cerrar la respuesta, después de enviar el archivo
+        user = request.user
         
-        # Leer el archivo y crear la respuesta
-        with open(file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=content_type)
-            response['Content-Disposition'] = f'attachment; filename="{evidence.file_name}"'
-            response['Content-Length'] = os.path.getsize(file_path)
+        def log_download():
+            audit.record(evidence.task_id, 'evidence_downloaded', user.id, file_name=evidence.file_name)
         
-        # Crear entrada de auditoría
-        AuditLogEntry.objects.create(
-            task=evidence.task,
-            action='Evidencia descargada',
-            user=request.user,
-            details=f'Archivo "{evidence.file_name}" descargado por {request.user.email}'
+        # Envío por bloques, con soporte de Range (o X-Accel-Redirect si está configurado)
+        return serve_file(
+            request, evidence.file.name, evidence.file_name,
+            storage=evidence.file.storage, on_close=log_download
         )
-        
-        return response
 
 
-class AuditLogView(generics.ListAPIView):
+class AuditLogView(SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = AuditLogEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
-    ordering = ['-timestamp']
+    pagination_class = KeysetPageNumberPagination
+    keyset_ordering = archive.HISTORY_ORDERING
+    # El historial no es un queryset (entradas vivas y archivadas) y ya viene ordenado
+    filter_backends = []
     
     def get_queryset(self):
         task_id = self.kwargs.get('task_id')
-        return AuditLogEntry.objects.filter(task_id=task_id)
+        return archive.task_history(task_id)
 
 
 @api_view(['POST'])
@@ -260,15 +278,10 @@ def change_task_status(request, pk):
         task.status = new_status
         task.save()
         
-        # Crear entrada de auditoría
-        AuditLogEntry.objects.create(
-            task=task,
-            action='Estado cambiado',
-            user=request.user,
-            details=f'Estado cambiado de "{old_status}" a "{new_status}" por {request.user.email}'
-        )
+        # Registrar auditoría (se escribe en segundo plano)
+        audit.record(task.id, 'status_changed', request.user.id, old=old_status, new=new_status)
         
-        serializer = TaskSerializer(task)
+        serializer = TaskDetailSerializer(task, context={'request': request})
         return Response(serializer.data)
         
     except Task.DoesNotExist:
@@ -284,46 +297,14 @@ def dashboard_stats(request):
     """Obtener estadísticas para el dashboard"""
     user = request.user
     
-    if user.role == 'admin':
-        # Estadísticas para administradores
-        total_tasks = Task.objects.count()
-        pending_tasks = Task.objects.filter(status='pending').count()
-        in_progress_tasks = Task.objects.filter(status='in-progress').count()
-        completed_tasks = Task.objects.filter(status='completed').count()
-        overdue_tasks = Task.objects.filter(
-            due_date__lt=timezone.now(),
-            status__in=['pending', 'in-progress']
-        ).count()
-        
-        # Tareas recientes con prefetch
-        recent_tasks = Task.objects.select_related('created_by').prefetch_related(
-            'assigned_to', 'evidences', 'audit_log'
-        ).all()[:5]
-        
-    else:
-        # Estadísticas para trabajadores
-        user_tasks = Task.objects.filter(assigned_to=user)
-        total_tasks = user_tasks.count()
-        pending_tasks = user_tasks.filter(status='pending').count()
-        in_progress_tasks = user_tasks.filter(status='in-progress').count()
-        completed_tasks = user_tasks.filter(status='completed').count()
-        overdue_tasks = user_tasks.filter(
-            due_date__lt=timezone.now(),
-            status__in=['pending', 'in-progress']
-        ).count()
-        
-        # Tareas recientes del usuario con prefetch
-        recent_tasks = Task.objects.select_related('created_by').prefetch_related(
-            'assigned_to', 'evidences', 'audit_log'
-        ).filter(assigned_to=user)[:5]
+    # Conteos en un único aggregate, cacheados por rol/usuario
+    stats = dict(get_task_stats(user))
+    
+    # Tareas recientes (mismo queryset que los listados)
+    recent_tasks = task_list_queryset()
+    if user.role != 'admin':
+        recent_tasks = recent_tasks.filter(assigned_to=user)
     
-    stats = {
-        'total': total_tasks,
-        'pending': pending_tasks,
-        'in_progress': in_progress_tasks,
-        'completed': completed_tasks,
-        'overdue': overdue_tasks,
-        'recent_tasks': TaskListSerializer(recent_tasks, many=True).data
-    }
+    stats['recent_tasks'] = TaskListSerializer(recent_tasks[:5], many=True).data
     
-    return Response(stats) 
\ No newline at end of file
+    return Response(stats)
@@ -12,6 +12,7 @@ from .serializers import (
     LoginSerializer, ChangePasswordSerializer, PasswordResetSerializer
 )
 from .permissions import IsAdminUser, IsOwnerOrAdmin
+from estudiomd_tasks.fieldsets import SparseFieldsViewMixin
 
 User = get_user_model()
 
@@ -55,7 +56,7 @@ class RegisterView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserListView(generics.ListCreateAPIView):
+class UserListView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend]
@@ -85,7 +86,7 @@ class UserListView(generics.ListCreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
+class UserDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsOwnerOrAdmin]
     queryset = User.objects.all()